@@ -0,0 +1,141 @@
+"""Benchmark the per-job ingestion latency of POST /job.
+
+Compare the legacy ingestion path, which commits once per package, once per
+measurement and once per S3 URI update, with the single transaction path
+implemented in `squash.ingestion.JobIngestion`.
+
+Only the relational inserts are measured; the Celery tasks dispatched by
+``Job.post`` are not part of the benchmark. Run it against a local MySQL
+instance, e.g. the one started by ``docker-compose up``:
+
+    export SQUASH_API_PROFILE=squash.config.Testing
+    python benchmarks/ingest_job.py --repeat 10 tests/data/job-768.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from squash.app import create_app
+from squash.ingestion import JobIngestion
+from squash.models import (
+    BlobModel,
+    EnvModel,
+    JobModel,
+    MeasurementModel,
+    MetricModel,
+    PackageModel,
+    db,
+)
+from squash.tasks.s3 import get_s3_uri
+
+
+def legacy_ingestion(data):
+    """Reproduce the ingestion path that commits once per row."""
+    env_name = data["meta"].get("env", {}).get("env_name", "unknown")
+    env = EnvModel.find_by_name(env_name)
+    if not env:
+        env = EnvModel(env_name)
+        env.save_to_db()
+
+    meta = data["meta"].copy()
+    job_env = meta.pop("env", {})
+    del meta["packages"]
+    job = JobModel(env.id, job_env, meta)
+    job.save_to_db()
+
+    for package in data["meta"]["packages"].values():
+        PackageModel(job.id, **package).save_to_db()
+
+    for measurement in data["measurements"]:
+        metric = MetricModel.find_by_name(measurement["metric"])
+        m = MeasurementModel(job.id, metric.id, **measurement)
+        m.blobs = []
+        for blob in data["blobs"]:
+            if blob["identifier"] in measurement["blob_refs"]:
+                # blob identifiers are unique, reuse the existing row
+                b = BlobModel.find_by_identifier(blob["identifier"])
+                if not b:
+                    b = BlobModel(blob["identifier"], blob["name"])
+                m.blobs.append(b)
+        m.save_to_db()
+
+    for blob in data["blobs"]:
+        saved_blob = BlobModel.find_by_identifier(blob["identifier"])
+        if saved_blob:
+            saved_blob.s3_uri = get_s3_uri(blob["identifier"])
+            saved_blob.save_to_db()
+
+    job = JobModel.find_by_id(job.id)
+    job.s3_uri = get_s3_uri(str(job.id))
+    job.save_to_db()
+
+    return job.id
+
+
+def bulk_ingestion(data):
+    """Ingest the job in a single transaction."""
+    return JobIngestion(data).run()
+
+
+def ensure_metrics(data):
+    """Create the metrics referenced by the job if they do not exist."""
+    for name in set(m["metric"] for m in data["measurements"]):
+        if not MetricModel.find_by_name(name):
+            MetricModel(name, description=name).save_to_db()
+
+
+def run(func, data, repeat):
+    """Return the ingestion latencies in seconds, deleting each job."""
+    identifiers = [blob["identifier"] for blob in data["blobs"]]
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        job_id = func(data)
+        latencies.append(time.perf_counter() - start)
+        JobModel.find_by_id(job_id).delete_from_db()
+        BlobModel.query.filter(BlobModel.identifier.in_(identifiers)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+
+    return latencies
+
+
+def main():
+    """Run the legacy and bulk ingestion of a job and print latencies."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("job", help="Path to a lsst.verify job document.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--profile", default="squash.config.Testing")
+    args = parser.parse_args()
+
+    with open(args.job) as f:
+        data = json.load(f)
+
+    app = create_app(args.profile)
+
+    with app.app_context():
+        # statement logging would dominate the measurement
+        db.get_engine(app).echo = False
+        ensure_metrics(data)
+        for name, func in [
+            ("legacy", legacy_ingestion),
+            ("bulk", bulk_ingestion),
+        ]:
+            latencies = run(func, data, args.repeat)
+            print(
+                "{:>8}: median {:.4f}s min {:.4f}s max {:.4f}s".format(
+                    name,
+                    statistics.median(latencies),
+                    min(latencies),
+                    max(latencies),
+                )
+            )
+        db.session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the construction of the GET /monitor response.
+
+Compare the legacy path, which formats the date of each row and appends its
+values to a list per column, with the vectorized path implemented in
+`squash.responses.stream_table`, which converts the columns of each chunk of
+rows to NumPy arrays. The rows are synthetic, so the benchmark measures the
+response construction only, not the database query:
+
+    python benchmarks/monitor.py --points 100000 1000000 --repeat 5
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from squash.api_v1.monitor import SCHEMA
+from squash.responses import ARROW, JSON, iter_chunks, stream_table
+
+
+def make_rows(points):
+    """Return synthetic monitor rows, in the order of the schema."""
+    start = datetime(2020, 1, 1)
+    return [
+        (
+            random.random(),
+            start + timedelta(minutes=i),
+            "validate_drp.AM1",
+            str(i // 100),
+            "https://ci.lsst.codes/job/{}".format(i // 100),
+            "r",
+            i // 100,
+        )
+        for i in range(points)
+    ]
+
+
+def legacy_response(rows):
+    """Build the columns row by row and encode them as JSON."""
+    columns = {name: [] for name in SCHEMA.names}
+    for row in rows:
+        for name, value in zip(SCHEMA.names, row):
+            if isinstance(value, datetime):
+                value = value.strftime("%Y-%m-%dT%H:%M:%SZ")
+            columns[name].append(value)
+
+    return json.dumps(columns).encode("utf-8")
+
+
+def vectorized_response(rows, mimetype):
+    """Build the columns a chunk at a time with `stream_table`."""
+    chunks = (tuple(zip(*chunk)) for chunk in iter_chunks(rows))
+    app = Flask(__name__)
+    with app.test_request_context(headers={"Accept": mimetype}):
+        response = stream_table(chunks, SCHEMA)
+        return b"".join(
+            chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            for chunk in response.response
+        )
+
+
+def run(func, rows, repeat):
+    """Return the response construction times in seconds."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def main():
+    """Build the monitor responses of each path and print latencies."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--points", type=int, nargs="+", default=[100000, 1000000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for points in args.points:
+        rows = make_rows(points)
+        print("{} points".format(points))
+        for name, func in [
+            ("legacy", legacy_response),
+            ("json", lambda rows: vectorized_response(rows, JSON)),
+            ("arrow", lambda rows: vectorized_response(rows, ARROW)),
+        ]:
+            latencies = run(func, rows, args.repeat)
+            print(
+                "{:>8}: median {:.4f}s min {:.4f}s max {:.4f}s".format(
+                    name,
+                    statistics.median(latencies),
+                    min(latencies),
+                    max(latencies),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+-- Keep a single blob row per identifier, shared by all the measurements
+-- that reference it through measurement_blob, and enforce it with a unique
+-- index on blob.identifier.
+--
+-- Tables created by db.create_all() already have the index, this migration
+-- is only required for existing databases (MySQL 5.7).
+
+-- Point the associations at the first row of each identifier
+UPDATE IGNORE measurement_blob mb
+  JOIN blob b ON b.id = mb.blob_id
+  JOIN (SELECT identifier, MIN(id) AS id FROM blob GROUP BY identifier) keep
+    ON keep.identifier = b.identifier
+SET mb.blob_id = keep.id
+WHERE mb.blob_id <> keep.id;
+
+-- Associations left behind were duplicates of an existing one
+DELETE mb FROM measurement_blob mb
+  JOIN blob b ON b.id = mb.blob_id
+  JOIN (SELECT identifier, MIN(id) AS id FROM blob GROUP BY identifier) keep
+    ON keep.identifier = b.identifier
+WHERE mb.blob_id <> keep.id;
+
+-- Preserve the S3 URI registered on any of the duplicates
+UPDATE blob b
+  JOIN (SELECT identifier, MAX(s3_uri) AS s3_uri FROM blob
+        GROUP BY identifier) uri
+    ON uri.identifier = b.identifier
+SET b.s3_uri = uri.s3_uri
+WHERE b.s3_uri IS NULL;
+
+DELETE b FROM blob b
+  JOIN (SELECT identifier, MIN(id) AS id FROM blob GROUP BY identifier) keep
+    ON keep.identifier = b.identifier
+WHERE b.id <> keep.id;
+
+ALTER TABLE blob ADD UNIQUE INDEX ix_blob_identifier (identifier);
@@ -0,0 +1,11 @@
+-- Add the idempotency key of the jobs, the Idempotency-Key header of the
+-- request or the digest of the job document, with a unique index so that a
+-- replayed request is detected with a single indexed lookup.
+--
+-- Tables created by db.create_all() already have the column, this
+-- migration is only required for existing databases (MySQL 5.7). Jobs
+-- created before the migration have no key.
+
+ALTER TABLE job
+  ADD COLUMN idempotency_key VARCHAR(64) NULL DEFAULT NULL,
+  ADD UNIQUE INDEX ix_job_idempotency_key (idempotency_key);
@@ -0,0 +1,20 @@
+-- Keep a single env row per name, enforced by a unique index on env.name,
+-- so that environments can be created with an upsert by concurrent workers.
+--
+-- Tables created by db.create_all() already have the index, this migration
+-- is only required for existing databases (MySQL 5.7).
+
+-- Point the jobs at the first row of each name
+UPDATE job j
+  JOIN env e ON e.id = j.env_id
+  JOIN (SELECT name, MIN(id) AS id FROM env GROUP BY name) keep
+    ON keep.name = e.name
+SET j.env_id = keep.id
+WHERE j.env_id <> keep.id;
+
+DELETE e FROM env e
+  JOIN (SELECT name, MIN(id) AS id FROM env GROUP BY name) keep
+    ON keep.name = e.name
+WHERE e.id <> keep.id;
+
+ALTER TABLE env ADD UNIQUE INDEX ix_env_name (name);
@@ -0,0 +1,9 @@
+-- Add the version of the jobs, incremented when a measurement is added to a
+-- job, used as the entity tag of the job resources for conditional requests.
+--
+-- Tables created by db.create_all() already have the column, this
+-- migration is only required for existing databases (MySQL 5.7). Existing
+-- jobs start at version 1.
+
+ALTER TABLE job
+  ADD COLUMN version INT NOT NULL DEFAULT 1;
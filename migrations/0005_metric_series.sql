@@ -0,0 +1,75 @@
+-- Add the denormalized metric series read by the monitor, a row per
+-- measurement with the job attributes the monitor filters and sends, and
+-- fill it with the existing measurements.
+--
+-- Tables created by db.create_all() already have the table, but it is
+-- filled only as jobs are ingested; this migration is required for
+-- existing databases (MySQL 5.7).
+--
+-- The measurements are copied in ranges of 10000 ids, each range in its
+-- own transaction, so that the shared locks the INSERT ... SELECT takes
+-- on the measurement and job rows are held briefly and the ingestion is
+-- not blocked for the whole backfill. A measurement appended by the
+-- ingestion is skipped thanks to the unique measurement_id, so the
+-- script can run while jobs are ingested and can be run again, see the
+-- deploy order in README.rst.
+
+CREATE TABLE IF NOT EXISTS metric_series (
+  id INT NOT NULL AUTO_INCREMENT,
+  measurement_id INT NULL,
+  metric_id INT NULL,
+  metric_name VARCHAR(64) NOT NULL,
+  ci_dataset VARCHAR(32) NULL DEFAULT NULL,
+  filter_name VARCHAR(64) NULL DEFAULT NULL,
+  date_created TIMESTAMP NOT NULL,
+  value FLOAT NULL,
+  job_id INT NULL,
+  ci_id VARCHAR(64) NULL DEFAULT NULL,
+  ci_url VARCHAR(255) NULL DEFAULT NULL,
+  PRIMARY KEY (id),
+  UNIQUE INDEX ix_metric_series_measurement_id (measurement_id),
+  INDEX ix_metric_series_dataset_metric_date
+    (ci_dataset, metric_id, date_created),
+  INDEX ix_metric_series_metric_date (metric_id, date_created),
+  INDEX ix_metric_series_job_id (job_id),
+  FOREIGN KEY (metric_id) REFERENCES metric (id),
+  FOREIGN KEY (job_id) REFERENCES job (id)
+);
+
+DROP PROCEDURE IF EXISTS backfill_metric_series;
+
+DELIMITER //
+
+CREATE PROCEDURE backfill_metric_series()
+BEGIN
+  DECLARE batch_start INT DEFAULT 0;
+  DECLARE last_id INT;
+
+  SELECT COALESCE(MAX(id), 0) INTO last_id FROM measurement;
+
+  WHILE batch_start <= last_id DO
+    -- with autocommit, each range is committed on its own
+    INSERT IGNORE INTO metric_series (
+      measurement_id, metric_id, metric_name, ci_dataset, filter_name,
+      date_created, value, job_id, ci_id, ci_url
+    )
+    SELECT m.id, m.metric_id, m.metric_name, j.ci_dataset,
+           JSON_UNQUOTE(JSON_EXTRACT(j.meta, '$."filter_name"')),
+           j.date_created, m.value, m.job_id,
+           JSON_UNQUOTE(JSON_EXTRACT(j.env, '$."ci_id"')),
+           JSON_UNQUOTE(JSON_EXTRACT(j.env, '$."ci_url"'))
+    FROM measurement m
+      JOIN job j ON j.id = m.job_id
+    WHERE m.id >= batch_start AND m.id < batch_start + 10000
+      AND m.metric_id IS NOT NULL
+    ORDER BY m.id;
+
+    SET batch_start = batch_start + 10000;
+  END WHILE;
+END //
+
+DELIMITER ;
+
+CALL backfill_metric_series();
+
+DROP PROCEDURE backfill_metric_series;
@@ -0,0 +1,47 @@
+-- Add generated columns for the JSON paths used in lookups, the Jenkins
+-- build and filter of the jobs and the dataset and filter of the metadata
+-- query of the specifications, with secondary indexes so that these
+-- lookups do not parse the JSON document of every row.
+--
+-- Tables created by db.create_all() already have the columns, this
+-- migration is only required for existing databases (MySQL 5.7). Virtual
+-- columns are added without rebuilding the tables and the indexes are
+-- built online.
+
+ALTER TABLE job
+  ADD COLUMN ci_id VARCHAR(64) GENERATED ALWAYS AS (
+    CASE JSON_EXTRACT(env, '$."ci_id"') WHEN 'null' THEN NULL
+    ELSE JSON_UNQUOTE(JSON_EXTRACT(env, '$."ci_id"')) END
+  ) VIRTUAL,
+  ADD COLUMN ci_name VARCHAR(64) GENERATED ALWAYS AS (
+    CASE JSON_EXTRACT(env, '$."ci_name"') WHEN 'null' THEN NULL
+    ELSE JSON_UNQUOTE(JSON_EXTRACT(env, '$."ci_name"')) END
+  ) VIRTUAL,
+  ADD COLUMN filter_name VARCHAR(64) GENERATED ALWAYS AS (
+    CASE JSON_EXTRACT(meta, '$."filter_name"') WHEN 'null' THEN NULL
+    ELSE JSON_UNQUOTE(JSON_EXTRACT(meta, '$."filter_name"')) END
+  ) VIRTUAL,
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE job
+  ADD INDEX ix_job_ci_id_ci_name (ci_id, ci_name),
+  ADD INDEX ix_job_ci_name (ci_name),
+  ADD INDEX ix_job_filter_name (filter_name),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE spec
+  ADD COLUMN dataset_name VARCHAR(64) GENERATED ALWAYS AS (
+    CASE JSON_EXTRACT(metadata_query, '$."dataset_name"') WHEN 'null'
+    THEN NULL
+    ELSE JSON_UNQUOTE(JSON_EXTRACT(metadata_query, '$."dataset_name"')) END
+  ) VIRTUAL,
+  ADD COLUMN filter_name VARCHAR(64) GENERATED ALWAYS AS (
+    CASE JSON_EXTRACT(metadata_query, '$."filter_name"') WHEN 'null'
+    THEN NULL
+    ELSE JSON_UNQUOTE(JSON_EXTRACT(metadata_query, '$."filter_name"')) END
+  ) VIRTUAL,
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE spec
+  ADD INDEX ix_spec_dataset_name_filter_name (dataset_name, filter_name),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,28 @@
+-- Index the columns the API filters, joins and orders on: the creation
+-- date of the jobs, the job and metric of the measurements, the job of the
+-- packages and the name and metric of the specifications. blob.identifier
+-- is already indexed, see 0001_deduplicate_blobs.sql.
+--
+-- Tables created by db.create_all() already have the indexes, this
+-- migration is only required for existing databases (MySQL 5.7). The
+-- indexes are built online, reads and writes to the tables are not
+-- blocked. The index MySQL creates implicitly for a foreign key is dropped
+-- once an index that covers the foreign key is added.
+
+ALTER TABLE job
+  ADD INDEX ix_job_date_created (date_created),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE measurement
+  ADD INDEX ix_measurement_job_id (job_id),
+  ADD INDEX ix_measurement_metric_id (metric_id),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE package
+  ADD INDEX ix_package_job_id (job_id),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE spec
+  ADD INDEX ix_spec_name (name),
+  ADD INDEX ix_spec_metric_id (metric_id),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,17 @@
+-- Index the dataset of the jobs and the package of the metrics, listed by
+-- /datasets and /packages with SELECT DISTINCT: the distinct values are
+-- read with a loose index scan, one index lookup per value, instead of a
+-- full scan of the tables.
+--
+-- Tables created by db.create_all() already have the indexes, this
+-- migration is only required for existing databases (MySQL 5.7). The
+-- indexes are built online, reads and writes to the tables are not
+-- blocked.
+
+ALTER TABLE job
+  ADD INDEX ix_job_ci_dataset (ci_dataset),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE metric
+  ADD INDEX ix_metric_package (package),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,15 @@
+-- Add the time the job documents and the data blobs were uploaded to S3.
+-- The S3 URIs are written when the rows are inserted, before the uploads,
+-- uploaded_at is set by the upload stage of the job pipeline once the
+-- object is in S3. A blob with an S3 URI but no uploaded_at is still being
+-- uploaded, or its upload failed.
+--
+-- Tables created by db.create_all() already have the columns, this
+-- migration is only required for existing databases (MySQL 5.7). Existing
+-- rows keep a NULL uploaded_at, their objects are served as before.
+
+ALTER TABLE job
+  ADD COLUMN uploaded_at TIMESTAMP NULL DEFAULT NULL;
+
+ALTER TABLE blob
+  ADD COLUMN uploaded_at TIMESTAMP NULL DEFAULT NULL;
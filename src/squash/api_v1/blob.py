@@ -6,6 +6,9 @@ from squash.tasks.s3 import download_object
 
 from ..models import JobModel as Job
 
+# Seconds after which a request for a blob not uploaded yet can be retried
+RETRY_AFTER = 10
+
 
 class Blob(Resource):
     parser = reqparse.RequestParser()
@@ -50,6 +53,11 @@ class Blob(Resource):
             description: Data blob successfully retrieved.
           404:
             description: Data blob not found.
+          503:
+            description: >
+                The data blob is not uploaded yet, or its upload failed.
+                The request can be retried after the number of seconds of
+                the Retry-After header.
         """
         job = Job.find_by_id(job_id)
 
@@ -60,6 +68,7 @@ class Blob(Resource):
         name = args["name"]
 
         s3_uri = None
+        uploaded_at = None
         for meas in job.measurements:
 
             if meas.metric_name == metric:
@@ -67,6 +76,7 @@ class Blob(Resource):
 
                     if blob.name == name:
                         s3_uri = blob.s3_uri
+                        uploaded_at = blob.uploaded_at
 
         data = None
         if s3_uri:
@@ -75,4 +85,12 @@ class Blob(Resource):
         if data:
             return json.loads(data)
 
+        if s3_uri and uploaded_at is None:
+            # the s3_uri is written before the blob is uploaded
+            return (
+                {"message": "Data blob not uploaded yet"},
+                503,
+                {"Retry-After": str(RETRY_AFTER)},
+            )
+
         return {"message": "Data blob not found"}, 404
@@ -1,8 +1,8 @@
 from flask_restful import Resource, reqparse
 
+from squash.catalog import env_registry
 from squash.decorators import time_this
 
-from ..models import EnvModel as Env
 from ..models import JobModel as Job
 
 
@@ -18,9 +18,9 @@ class CodeChanges(Resource):
     @time_this
     def get_current(self, ci_id, ci_name):
         """Given the ci_id, and ci_name returns the corresponding job object."""
-        env = Env.find_by_name(env_name="jenkins")
+        env_id = env_registry.get_id("jenkins")
         current = Job.find_by_env_data(
-            env_id=env.id, ci_id=ci_id, ci_name=ci_name
+            env_id=env_id, ci_id=ci_id, ci_name=ci_name
         )
 
         return current
@@ -30,13 +30,13 @@ class CodeChanges(Resource):
         """Given the ci_id, and ci_name returns the job corresponding to the
         previous ci_id.
         """
-        env = Env.find_by_name(env_name="jenkins")
+        env_id = env_registry.get_id("jenkins")
 
         queryset = Job.query.order_by(Job.date_created.asc())
-        queryset = queryset.filter(Job.env_id == env.id)
-        queryset = queryset.filter(Job.env["ci_name"] == ci_name)
+        queryset = queryset.filter(Job.env_id == env_id)
+        queryset = queryset.filter(Job.ci_name == ci_name)
 
-        resultset = queryset.values(Job.env["ci_id"])
+        resultset = queryset.values(Job.ci_id)
 
         ci_ids = []
         for result in resultset:
@@ -47,7 +47,7 @@ class CodeChanges(Resource):
         previous = None
         if ci_id in ci_ids:
             index = ci_ids.index(ci_id)
-            expression = Job.env["ci_id"] == ci_ids[index - 1]
+            expression = Job.ci_id == ci_ids[index - 1]
             previous = queryset.filter(expression).first()
 
         return previous
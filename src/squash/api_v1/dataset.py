@@ -16,7 +16,8 @@ class DatasetList(Resource):
           200:
             description: Dataset list successfully retrieved.
         """
-        dataset = Job.query.values(Job.ci_dataset)
+        # a loose index scan, one lookup per dataset
+        dataset = Job.query.with_entities(Job.ci_dataset).distinct()
         try:
             datasets = [d[0] for d in set(dataset)]
         except StopIteration:
@@ -1,6 +1,17 @@
 from flask_restful import Resource, reqparse
+from werkzeug.http import quote_etag
 
-from ..models import EnvModel, JobModel
+from squash.catalog import env_registry, job_cache
+from squash.responses import (
+    DOCUMENT_FORMATS,
+    get_job_etag,
+    is_not_modified,
+    negotiate,
+    not_modified,
+)
+
+from ..models import JobModel
+from .job import job_fields
 
 
 class Jenkins(Resource):
@@ -11,6 +22,7 @@ class Jenkins(Resource):
         required=True,
         help="This field cannot be left blank.",
     )
+    parser.add_argument("fields", type=job_fields, location="args")
 
     def get(self, ci_id):
         """
@@ -24,25 +36,64 @@ class Jenkins(Resource):
           type: integer
           description: ID of the jenkins job.
           required: true
+        - name: fields
+          in: url
+          type: string
+          description: >
+            Comma-separated fields of the job document, e.g.
+            `id,date_created,meta.env`. Only the data required by these
+            fields is loaded. By default all the fields are returned.
+        - name: If-None-Match
+          in: header
+          type: string
+          description: >
+            Entity tag of a job retrieved before, the job is not sent
+            again if it has not changed since.
+        produces:
+          - application/json
+          - application/msgpack
         responses:
           200:
             description: Jenkins job successfully retrieved.
+          304:
+            description: Jenkins job not modified.
+          400:
+            description: Unknown job field.
           404:
             description: Jenkins job not found.
         """
         args = self.parser.parse_args()
         ci_name = args["ci_name"]
-        env = EnvModel.find_by_name(env_name="jenkins")
+        fields = args["fields"]
+        env_id = env_registry.get_id("jenkins")
+        mimetype = negotiate(DOCUMENT_FORMATS)
 
-        if env:
-            job = JobModel.find_by_env_data(
-                env_id=env.id, ci_id=ci_id, ci_name=ci_name
+        if env_id:
+            # the id and revision are read without loading the job
+            found = (
+                JobModel.query_by_env_data(
+                    env_id=env_id, ci_id=ci_id, ci_name=ci_name
+                )
+                .with_entities(
+                    JobModel.id, JobModel.date_created, JobModel.version
+                )
+                .first()
             )
         else:
             message = "Environment `jenkins` not found."
             return {"message": message}, 400
 
-        if job:
-            return job.json()
+        if found:
+            revision = JobModel.make_revision(
+                found.date_created, found.version
+            )
+            etag = get_job_etag(found.id, revision, mimetype, fields)
+            if is_not_modified(etag):
+                return not_modified(etag)
+
+            document = job_cache.get_document(found.id, revision, fields)
+
+            if document is not None:
+                return document, 200, {"ETag": quote_etag(etag)}
 
         return {"message": "Jenkins job not found"}, 404
@@ -1,27 +1,85 @@
+import gzip
 import json
-import warnings
+import uuid
 
+import pyarrow as pa
 from flask import current_app as app
-from flask import url_for
+from flask import request, url_for
 from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
+from werkzeug.http import quote_etag
 
+from squash.catalog import job_cache
 from squash.decorators import time_this
 from squash.error import ApiError
-from squash.tasks.influxdb import job_to_influxdb
-from squash.tasks.s3 import get_s3_uri, upload_object
-
-from ..models import (
-    BlobModel,
-    EnvModel,
-    JobModel,
-    MeasurementModel,
-    MetricModel,
-    PackageModel,
+from squash.ingestion import (
+    JobBatchIngestion,
+    JobIngestion,
+    get_job_data,
+    get_job_digest,
 )
+from squash.pagination import Page
+from squash.responses import (
+    DOCUMENT_FORMATS,
+    get_job_etag,
+    is_not_modified,
+    negotiate,
+    not_modified,
+    stream_records,
+)
+from squash.streaming import iter_lines, parse_job
+from squash.tasks.ingestion import get_staging_key, ingest_job
+from squash.tasks.pipeline import JobPipeline
+from squash.tasks.s3 import put_fileobj, put_object, put_spool_file
+
+from ..models import JobModel
+
+# Fields of the list of job ids
+ID_SCHEMA = pa.schema([("id", pa.int64())])
+
+# Fields of the job document, see JobModel.json
+JOB_FIELDS = [
+    "id",
+    "date_created",
+    "ci_dataset",
+    "s3_uri",
+    "measurements",
+    "meta",
+]
+
+
+def job_fields(value):
+    """Parse the ``fields`` argument of the job resources, a comma-separated
+    list of fields of the job document, e.g. ``id,date_created,meta.env``.
+    """
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+
+    for field in fields:
+        root = field.split(".")[0]
+        if root not in JOB_FIELDS or (root != field and root != "meta"):
+            raise ValueError("Unknown job field `{}`.".format(field))
+
+    return fields or None
+
+
+def archive_document(key, body, compression=""):
+    """Upload a job document to S3.
+
+    The document is compressed with ``compression``, e.g. ``gzip``, see the
+    ``JOB_ARCHIVE_COMPRESSION`` setting.
+    """
+    content_encoding = None
+    if compression == "gzip":
+        body = gzip.compress(body)
+        content_encoding = "gzip"
+
+    return put_object(key, body, content_encoding=content_encoding)
 
 
 class JobWithArg(Resource):
+    parser = reqparse.RequestParser()
+    parser.add_argument("fields", type=job_fields, location="args")
+
     def get(self, job_id):
         """
         Retrieve a verification job.
@@ -34,16 +92,47 @@ class JobWithArg(Resource):
           type: integer
           description: ID of the job.
           required: true
+        - name: fields
+          in: url
+          type: string
+          description: >
+            Comma-separated fields of the job document, e.g.
+            `id,date_created,meta.env`. Only the data required by these
+            fields is loaded. By default all the fields are returned.
+        - name: If-None-Match
+          in: header
+          type: string
+          description: >
+            Entity tag of a job retrieved before, the job is not sent
+            again if it has not changed since.
+        produces:
+          - application/json
+          - application/msgpack
         responses:
           200:
             description: Job successfully retrieved.
+          304:
+            description: Job not modified.
+          400:
+            description: Unknown job field.
           404:
             description: Job not found.
         """
-        job = JobModel.find_by_id(job_id)
+        fields = self.parser.parse_args()["fields"]
+        mimetype = negotiate(DOCUMENT_FORMATS)
+
+        # the revision is read without loading the job
+        revision = JobModel.get_revision(job_id)
+
+        if revision is not None:
+            etag = get_job_etag(job_id, revision, mimetype, fields)
+            if is_not_modified(etag):
+                return not_modified(etag)
 
-        if job:
-            return job.json()
+            document = job_cache.get_document(job_id, revision, fields)
+
+            if document is not None:
+                return document, 200, {"ETag": quote_etag(etag)}
 
         return {"message": "Job not found"}, 404
 
@@ -79,6 +168,8 @@ class JobWithArg(Resource):
             return {"message": message}, 404
 
         job.delete_from_db()
+        job_cache.invalidate(job_id)
+
         return {"message": "Job deleted."}
 
 
@@ -114,6 +205,20 @@ class Job(Resource):
         tags:
           - Jobs
         parameters:
+        - in: header
+          name: Prefer
+          type: string
+          description: >
+            Use `respond-async` to stage the job document and insert it
+            asynchronously, its progress is reported by the `status` URL.
+        - in: header
+          name: Idempotency-Key
+          type: string
+          maxLength: 64
+          description: >
+            Unique key of the job, retrying a request with the same key
+            returns the existing job. By default the key is the digest of
+            the job document.
         - in: body
           name: "Request body:"
           schema:
@@ -129,8 +234,14 @@ class Job(Resource):
               meta:
                 type: object
         responses:
+          200:
+            description: >
+              The job already exists, the request is not processed again.
           202:
-            description: Request for creating Job received.
+            description: >
+              Request for creating Job received, the `status` URL reports
+              the state of its blob uploads, document upload and InfluxDB
+              export.
           400:
             description: Missing or invalid data in the request body.
           401:
@@ -140,287 +251,356 @@ class Job(Resource):
           500:
             description: An error occurred creating this job.
         """
-        self.data = Job.parser.parse_args()
+        key = request.headers.get("Idempotency-Key")
+        if key is not None:
+            if not key or len(key) > 64:
+                message = "The Idempotency-Key must have 1 to 64 characters."
+                return {"message": message}, 400
 
-        try:
-            env_id = self.check_or_create_env()
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
+            job_id = self.find_job(key)
+            if job_id:
+                return self.job_exists(job_id)
 
-        try:
-            job_id = self.create_job(env_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
+        if "respond-async" in request.headers.get("Prefer", ""):
+            return self.stage_job(key)
 
-        try:
-            self.insert_packages(job_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
+        self.raw = None
+        if self.is_large_request():
+            try:
+                self.data, self.raw = parse_job(request.stream)
+            except ApiError as err:
+                app.logger.error(err.message)
+                return {"message": err.message}, err.status_code
+        else:
+            self.data = Job.parser.parse_args()
 
-        try:
-            self.insert_measurements(job_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
+        if key is None:
+            key = get_job_digest(self.data)
+            job_id = self.find_job(key)
+            if job_id:
+                return self.job_exists(job_id)
 
-        # async task
+        # env, job, packages, measurements and blobs are inserted in a
+        # single transaction, nothing is written if any of them fails
+        ingestion = JobIngestion(self.data, key)
         try:
-            self.upload_blobs_to_s3()
+            job_id = ingestion.run()
         except ApiError as err:
+            if err.status_code == 409:
+                # created by a concurrent request with the same key, unless
+                # its transaction was rolled back since
+                job_id = self.find_job(key)
+                if job_id:
+                    return self.job_exists(job_id)
             app.logger.error(err.message)
             return {"message": err.message}, err.status_code
 
-        # async, the status of the job upload task can be accessed
-        # from the /status resource
-        try:
-            task = self.upload_job_to_s3(job_id)
-        except ApiError as err:
-            app.logger.error(err.message)
-            return {"message": err.message}, err.status_code
-
-        # async celery task
-        try:
-            task = job_to_influxdb.delay(job_id)
-        except ApiError:
-            app.logger.error(meassage)
-            return {"message": meassage}, status_code
+        # blob uploads, document upload and InfluxDB export
+        pipeline = JobPipeline(job_id)
+        ingestion.upload_blobs_to_s3([pipeline])
+        self.upload_job_to_s3(pipeline)
+        pipeline.add("influxdb", job_id)
+        pipeline_id = pipeline.start()
 
-        # see DM-16391 for improving task status report
         message = "Request for creating Job `{}` received".format(job_id)
         return {
             "message": message,
-            "status": url_for("status", task_id=task.id, _external=True),
+            "job_id": job_id,
+            "status": url_for("status", task_id=pipeline_id, _external=True),
         }, 202
 
-    @time_this
-    def check_or_create_env(self):
-        """Check if env (e.g. Jenkins) exists in the db,
-        if not create it.
-        """
-        if "env" in self.data["meta"]:
-            env = self.data["meta"]["env"]
-            if "env_name" in env:
-                e = EnvModel.find_by_name(env["env_name"])
-                if not e:
-                    e = EnvModel(env["env_name"])
-                    try:
-                        e.save_to_db()
-                    except Exception:
-                        raise ApiError(
-                            "An error ocurred creating " "the env object.", 500
-                        )
-            else:
-                raise ApiError("Missing `env_name` in env metadata.", 400)
-        else:
-            # allows for unknown environment
-            e = EnvModel.find_by_name("unknown")
-            if not e:
-                e = EnvModel("unknown")
-                try:
-                    e.save_to_db()
-                except Exception:
-                    raise ApiError(
-                        "An error ocurred creating " "the env object.", 500
-                    )
+    @staticmethod
+    def find_job(key):
+        """Return the id of the job with an idempotency key, if any."""
+        return JobModel.find_ids_by_idempotency_keys([key]).get(key)
 
-        return e.id
+    @staticmethod
+    def job_exists(job_id):
+        """Response to a request replayed for an existing job."""
+        message = "Job `{}` already exists.".format(job_id)
+        return {"message": message, "job_id": job_id}, 200
+
+    def is_large_request(self):
+        """Whether the request body must be parsed incrementally."""
+        length = request.content_length
+        return length is None or (
+            length > app.config["JOB_STREAMING_THRESHOLD"]
+        )
 
     @time_this
-    def create_job(self, env_id):
-        """Creates the job object
+    def stage_job(self, key=None):
+        """Stage the job document for asynchronous ingestion.
+
+        The request body is written as is to the staging area and the
+        relational inserts are done by the `ingest_job` Celery task, whose
+        progress is reported by the /status resource.
 
         Parameters
         ----------
-        env_id : `int`
-            id of the environment associated with the job.
-
-        Return
-        ------
-        job_id : `int`
-            id of the job created
+        key : `str`, optional
+            The Idempotency-Key of the request.
         """
+        task_id = str(uuid.uuid4())
+        staging_key = get_staging_key(task_id)
 
-        # job metadata contains arbitrary metadata plus
-        # env metadata and packages
-        meta = self.data["meta"].copy()
-
-        # we extract the env metadata
-        if "env" in meta:
-            env = meta.pop("env")
-        else:
-            env = {}
-
-        # and remove the packages, they will be inserted later.
-        if "packages" in meta:
-            del meta["packages"]
-        else:
-            raise ApiError("Missing packages metadata.", 400)
-
-        # what remains in meta is the arbitrary metadata we want to save
-        j = JobModel(env_id, env, meta)
+        ingest_job.backend.store_result(task_id, None, "STAGING")
 
         try:
-            j.save_to_db()
+            put_fileobj(staging_key, request.stream)
         except Exception:
-            raise ApiError(
-                "An error occurred creating " "the job object.", 500
-            )
+            message = "An error occurred staging the job document."
+            app.logger.error(message)
+            ingest_job.backend.mark_as_failure(task_id, ApiError(message, 500))
+            return {"message": message}, 500
 
-        return j.id
+        ingest_job.apply_async(args=(staging_key, key), task_id=task_id)
+
+        message = "Request for creating Job received"
+        return {
+            "message": message,
+            "task_id": task_id,
+            "status": url_for("status", task_id=task_id, _external=True),
+        }, 202
 
     @time_this
-    def insert_packages(self, job_id):
-        """Insert packages associated with the job.
+    def upload_job_to_s3(self, pipeline):
+        """Archive the job document in S3 as it was received.
+
+        The document is not serialized again, its S3 URI location is
+        registered when the job is ingested. It is uploaded before the
+        response is sent, see `squash.tasks.pipeline.JobPipeline.run`.
 
         Parameters
         ----------
-        job_id : `int`
-            id of the job object previously created.
+        pipeline : `squash.tasks.pipeline.JobPipeline`
+            The pipeline of the job, the upload is one of its stages.
         """
-        meta = self.data["meta"]
-        if "packages" in meta:
-            packages = meta["packages"]
-        else:
-            raise ApiError("Missing packages metadata.", 400)
+        key = str(pipeline.job_id)
 
-        for package in packages:
-            p = PackageModel(job_id, **packages[package])
-            try:
-                p.save_to_db()
-            except Exception:
-                raise ApiError("An error occurred inserting packages", 500)
+        if self.raw:
+            # the request body spooled by the streaming parser
+            pipeline.run("document", put_spool_file, key, self.raw)
+        else:
+            # the request body cached when it was parsed
+            pipeline.run(
+                "document",
+                archive_document,
+                key,
+                request.get_data(),
+                app.config["JOB_ARCHIVE_COMPRESSION"],
+            )
 
-    @time_this
-    def insert_measurements(self, job_id):
-        """Insert measurements associated with the job.
 
-        Parameters
-        ----------
-        job_id : `int`
-            id of the job object previously created.
+class JobList(Resource):
+    def get(self):
+        """
+        Retrieve the list of job ids, a page at a time.
+        ---
+        tags:
+          - Jobs
+        parameters:
+          - name: limit
+            in: url
+            type: integer
+            description: Maximum number of items in the page.
+          - name: after
+            in: url
+            type: integer
+            description: Return the items after this id.
+        produces:
+          - application/json
+          - application/x-ndjson
+          - application/msgpack
+          - application/vnd.apache.arrow.stream
+        responses:
+          200:
+            description: >
+                Page of job ids successfully retrieved, with the URL of the
+                `next` page.
         """
-        measurements = self.data["measurements"]
 
-        for measurement in measurements:
-            if measurement and "metric" in measurement:
-                metric_name = measurement["metric"]
-            else:
-                raise ApiError(
-                    "You must provide a list of measurements "
-                    "and the associated metric name.",
-                    400,
-                )
+        queryset = JobModel.query.with_entities(JobModel.id)
 
-            metric = MetricModel.find_by_name(metric_name)
+        page = Page(queryset, JobModel.id)
 
-            if metric:
-                m = MeasurementModel(job_id, metric.id, **measurement)
-            else:
-                warnings.warn(
-                    "Metric `{}` not found, it looks like "
-                    "the metrics definition is out of "
-                    "date.".format(metric_name)
-                )
+        return stream_records(
+            "ids", (row.id for row in page), ID_SCHEMA, page.next_url
+        )
 
-            # Insert data blobs associated with this measurement
-            blobs = self.data["blobs"]
-
-            m.blobs = []
+    @jwt_required()
+    def post(self):
+        """
+        Create verification jobs in bulk, e.g. to backfill historical jobs.
+        The request body is newline-delimited JSON (NDJSON) with one job \
+        document per line, see http://sqr-019.lsst.io for its content.
+        ---
+        tags:
+          - Jobs
+        consumes:
+          - application/x-ndjson
+        parameters:
+        - in: body
+          name: "Request body:"
+          schema:
+            type: string
+            description: One job document per line.
+        responses:
+          200:
+            description: >
+              Request processed, the result of each line is reported in
+              `results` with the `job_id` created (status 201) and the
+              `status_url` of its pipeline, the `job_id` of an identical
+              job that already exists (status 200) or an error message.
+          401:
+            description: >
+                Authorization Required. Request does not contain a
+                valid access token.
+        """
+        results = []
+        batch = []
 
-            for blob in blobs:
-                if blob and "identifier" in blob and "name" in blob:
-                    identifier = blob["identifier"]
-                    if identifier in measurement["blob_refs"]:
-                        name = blob["name"]
-                        b = BlobModel(identifier, name)
-                        m.blobs.append(b)
+        for number, line in enumerate(iter_lines(request.stream), 1):
+            if not line.strip():
+                continue
 
             try:
-                m.save_to_db()
-            except Exception:
-                raise ApiError(
-                    "An error occurred inserting " "measurements", 500
+                data = self.parse_line(line)
+            except ApiError as err:
+                results.append(
+                    {
+                        "line": number,
+                        "status": err.status_code,
+                        "message": err.message,
+                    }
                 )
+                continue
 
-    @time_this
-    def upload_job_to_s3(self, job_id):
-        """Upload job document to S3 and register the S3 URI
-        location.
+            batch.append((number, line, data))
+            if len(batch) == app.config["JOB_BATCH_SIZE"]:
+                results.extend(self.ingest_batch(batch))
+                batch = []
+
+        if batch:
+            results.extend(self.ingest_batch(batch))
+
+        results.sort(key=lambda result: result["line"])
+
+        return {"results": results}
+
+    @staticmethod
+    def parse_line(line):
+        """Parse a job document of the request body.
 
         Parameters
         ----------
-        job_id : `int`
-            id of the job object previously created
-        """
-        key = str(job_id)
-        body = json.dumps(self.data)
-
-        # async celery task
-        task = upload_object.delay(key, body)
+        line : `bytes`
+            A line of the request body.
 
-        # update the s3_uri field
-        job = JobModel.find_by_id(job_id)
-        job.s3_uri = get_s3_uri(key)
+        Returns
+        -------
+        data : `dict`
+            The ``measurements``, ``meta`` and ``blobs`` of the job.
+        """
         try:
-            job.save_to_db()
-        except Exception:
-            raise ApiError(
-                "An error occurred registering " "the S3 URI location.", 500
-            )
+            document = json.loads(line)
+        except ValueError:
+            raise ApiError("Invalid job document.", 400)
 
-        return task
+        return get_job_data(document)
 
     @time_this
-    def upload_blobs_to_s3(self):
-
-        blobs = self.data["blobs"]
-
-        for blob in blobs:
-            if (
-                blob
-                and "identifier" in blob
-                and "data" in blob
-                and "name" in blob
-            ):
-                identifier = blob["identifier"]
-                data = json.dumps(blob["data"])
-                metadata = {"name": blob["name"]}
-
-                # async celery task
-                upload_object.delay(identifier, data, metadata)
-
-                # update the s3_uri field
-                saved_blobs = BlobModel.find_by_identifier(identifier)
-
-                for saved_blob in saved_blobs:
-                    saved_blob.s3_uri = get_s3_uri(identifier)
-                    try:
-                        saved_blob.save_to_db()
-                    except Exception:
-                        raise ApiError(
-                            "An error ocurred registering "
-                            "the S3 URI location.",
-                            500,
-                        )
+    def ingest_batch(self, batch):
+        """Insert a batch of jobs in a single transaction.
 
+        Jobs that already exist, identified by the digest of their
+        document, are not inserted again. If the transaction fails the
+        jobs are inserted one at a time, so that only the invalid
+        documents are rejected.
 
-class JobList(Resource):
-    def get(self):
-        """
-        Retrieve the complete list of job ids.
-        ---
-        tags:
-          - Jobs
-        responses:
-          200:
-            description: List of job ids successfully retrieved.
+        Parameters
+        ----------
+        batch : `list`
+            Tuples with the line number, the line and the job document.
+
+        Returns
+        -------
+        results : `list`
+            The result of each line.
         """
+        keys = [get_job_digest(data) for _, _, data in batch]
+        existing = JobModel.find_ids_by_idempotency_keys(keys)
+
+        results = []
+        pending = []
+        for item, key in zip(batch, keys):
+            if key in existing:
+                results.append(
+                    {"line": item[0], "status": 200, "job_id": existing[key]}
+                )
+            else:
+                pending.append((item, key))
 
-        queryset = JobModel.query
+        if not pending:
+            return results
 
-        generator = queryset.values(JobModel.id)
+        ingestion = JobBatchIngestion(
+            [data for (_, _, data), _ in pending],
+            [key for _, key in pending],
+        )
+        try:
+            job_ids = ingestion.run()
+        except ApiError as err:
+            if len(pending) > 1:
+                # e.g. the same job twice in the batch
+                for item, _ in pending:
+                    results.extend(self.ingest_batch([item]))
+                return results
+
+            (number, _, _), key = pending[0]
+            if err.status_code == 409:
+                # created by a concurrent request, unless its transaction
+                # was rolled back since
+                job_id = JobModel.find_ids_by_idempotency_keys([key]).get(key)
+                if job_id:
+                    results.append(
+                        {"line": number, "status": 200, "job_id": job_id}
+                    )
+                    return results
+
+            app.logger.error(err.message)
+            results.append(
+                {
+                    "line": number,
+                    "status": err.status_code,
+                    "message": err.message,
+                }
+            )
+            return results
+
+        pipelines = [JobPipeline(job_id) for job_id in job_ids]
+        ingestion.upload_blobs_to_s3(pipelines)
+
+        for pipeline, ((number, line, _), _) in zip(pipelines, pending):
+            job_id = pipeline.job_id
+            # uploaded as received, not sent in a task message
+            pipeline.run(
+                "document",
+                archive_document,
+                str(job_id),
+                line,
+                app.config["JOB_ARCHIVE_COMPRESSION"],
+            )
+            pipeline.add("influxdb", job_id)
+            pipeline_id = pipeline.start()
+            results.append(
+                {
+                    "line": number,
+                    "status": 201,
+                    "job_id": job_id,
+                    "status_url": url_for(
+                        "status", task_id=pipeline_id, _external=True
+                    ),
+                }
+            )
 
-        return {"ids": [value[0] for value in generator]}
+        return results
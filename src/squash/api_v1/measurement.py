@@ -1,7 +1,40 @@
+import pyarrow as pa
 from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
 
-from ..models import JobModel, MeasurementModel, MetricModel
+from squash.catalog import job_cache
+from squash.pagination import Page
+from squash.responses import (
+    get_job_etag,
+    is_not_modified,
+    iter_chunks,
+    negotiate,
+    not_modified,
+    stream_records,
+)
+
+from ..models import BlobModel, JobModel, MeasurementModel, MetricModel
+
+# Fields of the measurements
+SCHEMA = pa.schema(
+    [
+        ("value", pa.float64()),
+        ("unit", pa.string()),
+        ("metric", pa.string()),
+        (
+            "blobs",
+            pa.list_(
+                pa.struct(
+                    [
+                        ("identifier", pa.string()),
+                        ("name", pa.string()),
+                        ("s3_uri", pa.string()),
+                    ]
+                )
+            ),
+        ),
+    ]
+)
 
 
 class Measurement(Resource):
@@ -38,29 +71,46 @@ class Measurement(Resource):
           type: integer
           description: ID of the job.
           required: true
+        - name: If-None-Match
+          in: header
+          type: string
+          description: >
+            Entity tag of the measurements retrieved before, they are not
+            sent again if the job has not changed since.
+        produces:
+          - application/json
+          - application/x-ndjson
+          - application/msgpack
+          - application/vnd.apache.arrow.stream
         responses:
           200:
             description: List of Measurements successfully retrieved.
+          304:
+            description: Measurements not modified.
           404:
             description: Job not found.
         """
+        revision = JobModel.get_revision(job_id)
 
-        # find the corresponding job
-        job = JobModel.find_by_id(job_id)
+        if revision is not None:
+            etag = get_job_etag(job_id, revision, negotiate())
+            if is_not_modified(etag):
+                return not_modified(etag)
 
-        if job:
-            # find the associated measurements
-            measurements = MeasurementModel.find_by_job_id(job.id)
+            # the measurements are part of the job document
+            document = job_cache.get_document(job_id, revision)
 
-            return {
-                "measurements": [
-                    measurement.json() for measurement in measurements
-                ]
-            }
-        else:
-            message = "Job `{}` not found.".format(job_id)
+            if document is not None:
+                response = stream_records(
+                    "measurements", document["measurements"], SCHEMA
+                )
+                response.set_etag(etag)
 
-            return {"message": message}, 404
+                return response
+
+        message = "Job `{}` not found.".format(job_id)
+
+        return {"message": message}, 404
 
     @jwt_required()
     def post(self, job_id):
@@ -123,7 +173,10 @@ class Measurement(Resource):
             return {"message": message}, 404
 
         try:
+            # the job document changes, committed with the measurement
+            JobModel.bump_version(job.id)
             measurement.save_to_db()
+            job_cache.invalidate(job.id)
         except Exception:
             return {
                 "message": "An error occurred inserting the " "measurement."
@@ -135,17 +188,56 @@ class Measurement(Resource):
 class MeasurementList(Resource):
     def get(self):
         """
-        Retrieve the complete list of measurements.
+        Retrieve the list of measurements, a page at a time.
         ---
         tags:
           - Metric Measurements
+        parameters:
+          - name: limit
+            in: url
+            type: integer
+            description: Maximum number of items in the page.
+          - name: after
+            in: url
+            type: integer
+            description: Return the items after this id.
+        produces:
+          - application/json
+          - application/x-ndjson
+          - application/msgpack
+          - application/vnd.apache.arrow.stream
         responses:
           200:
-            description: List of Measurements successfully retrieved.
+            description: >
+                Page of measurements successfully retrieved, with the URL
+                of the `next` page.
+        """
+        queryset = MeasurementModel.query.with_entities(
+            MeasurementModel.id,
+            MeasurementModel.value,
+            MeasurementModel.unit,
+            MeasurementModel.metric_name,
+        )
+
+        page = Page(queryset, MeasurementModel.id)
+
+        return stream_records(
+            "measurements", self.serialize(page), SCHEMA, page.next_url
+        )
+
+    @staticmethod
+    def serialize(rows):
+        """Serialize measurement rows as `MeasurementModel.json` does,
+        loading the blobs of each chunk of rows with a single query.
         """
-        return {
-            "measurements": [
-                measurement.json()
-                for measurement in MeasurementModel.query.all()
-            ]
-        }
+        for chunk in iter_chunks(rows):
+            blobs = BlobModel.find_by_measurement_ids(
+                [row.id for row in chunk]
+            )
+            for row in chunk:
+                yield {
+                    "value": row.value,
+                    "unit": row.unit,
+                    "metric": row.metric_name,
+                    "blobs": blobs.get(row.id, []),
+                }
@@ -1,8 +1,10 @@
 from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
-from sqlalchemy.orm import noload
 
-from ..models import MetricModel
+from squash.catalog import metric_catalog
+from squash.pagination import paginate
+
+from ..models import MeasurementModel, MetricModel
 
 
 class Metric(Resource):
@@ -20,6 +22,16 @@ class Metric(Resource):
     parser.add_argument("tags", type=str, action="append")
     parser.add_argument("reference", type=dict)
 
+    # related objects included in the metric on request
+    expand_parser = reqparse.RequestParser()
+    expand_parser.add_argument(
+        "expand",
+        choices=("specs", "measurements"),
+        action="append",
+        location="args",
+        default=[],
+    )
+
     def get(self, name):
         """
         Retrieve a metric from its name.
@@ -32,18 +44,49 @@ class Metric(Resource):
           type: string
           description: Full qualified name of the metric, e.g. validate_drp.AM1
           required: true
+        - name: expand
+          in: url
+          type: string
+          description: >
+            Related objects to include, `specs` or `measurements`. Can be
+            given more than once. Measurements are returned a page at a
+            time, with the URL of the `next` page.
+        - name: limit
+          in: url
+          type: integer
+          description: Maximum number of measurements in the page.
+        - name: after
+          in: url
+          type: integer
+          description: Return the measurements after this id.
         responses:
           200:
             description: Metric found.
           404:
             description: Metric not found.
         """
+        expand = self.expand_parser.parse_args()["expand"]
+
         metric = MetricModel.find_by_name(name)
 
-        if metric:
-            return metric.json()
+        if not metric:
+            return {"message": "Metric not found"}, 404
+
+        result = metric.json()
+
+        if "specs" in expand:
+            result["specs"] = [spec.json() for spec in metric.specification]
+
+        if "measurements" in expand:
+            measurements, next_url = paginate(
+                metric.measurement, MeasurementModel.id
+            )
+            result["measurements"] = [
+                measurement.json() for measurement in measurements
+            ]
+            result["next"] = next_url
 
-        return {"message": "Metric not found"}, 404
+        return result
 
     @jwt_required()
     def post(self, name):
@@ -111,6 +154,8 @@ class Metric(Resource):
             message = "An error ocurred creating metric `{}`.".format(name)
             return {"message": message}, 500
 
+        metric_catalog.invalidate()
+
         return metric.json(), 201
 
     @jwt_required()
@@ -173,6 +218,8 @@ class Metric(Resource):
             message = "An error ocurred updating metric `{}`.".format(name)
             return {"message": message}, 500
 
+        metric_catalog.invalidate()
+
         return metric.json(), 200
 
     @jwt_required()
@@ -204,6 +251,8 @@ class Metric(Resource):
             return {"message": "Metric `{}` not found.".format(name)}, 404
 
         metric.delete_from_db()
+        metric_catalog.invalidate()
+
         return {"message": "Metric deleted."}
 
 
@@ -214,7 +263,7 @@ class MetricList(Resource):
 
     def get(self):
         """
-        Retrieve the complete list of metrics.
+        Retrieve the list of metrics, a page at a time.
         ---
         tags:
           - Metrics
@@ -223,9 +272,19 @@ class MetricList(Resource):
             in: url
             type: string
             description: Name of the verification package to filter
+          - name: limit
+            in: url
+            type: integer
+            description: Maximum number of items in the page.
+          - name: after
+            in: url
+            type: integer
+            description: Return the items after this id.
         responses:
           200:
-            description: List of metrics successfully retrieved.
+            description: >
+                Page of metrics successfully retrieved, with the URL of the
+                `next` page.
         """
 
         queryset = MetricModel.query
@@ -237,14 +296,11 @@ class MetricList(Resource):
         if package:
             queryset = queryset.filter(MetricModel.package == package)
 
+        metrics, next_url = paginate(queryset, MetricModel.id)
+
         return {
-            "metrics": [
-                metric.json()
-                for metric in queryset.options(
-                    noload(MetricModel.measurement),
-                    noload(MetricModel.specification),
-                ).all()
-            ]
+            "metrics": [metric.json() for metric in metrics],
+            "next": next_url,
         }
 
     @jwt_required()
@@ -309,4 +365,6 @@ class MetricList(Resource):
 
                 return {"message": message, "error": str(error)}, 500
 
+        metric_catalog.invalidate()
+
         return {"message": "List of metrics successfully created."}, 201
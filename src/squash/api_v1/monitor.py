@@ -1,10 +1,41 @@
 import datetime
 
+import pyarrow as pa
 from flask_restful import Resource, reqparse
 
-from ..models import JobModel as Job
-from ..models import MeasurementModel as Measurement
-from ..models import MetricModel as Metric
+from squash.catalog import metric_catalog
+from squash.downsampling import MIN_POINTS, downsample
+from squash.responses import iter_columns, stream_table
+
+from ..models import MetricSeriesModel as Series
+
+# Columns of the monitor data structure
+SCHEMA = pa.schema(
+    [
+        ("value", pa.float64()),
+        ("date_created", pa.timestamp("s", tz="UTC")),
+        ("metric_name", pa.string()),
+        ("ci_id", pa.string()),
+        ("ci_url", pa.string()),
+        ("filter_name", pa.string()),
+        ("job_id", pa.int64()),
+    ]
+)
+
+
+def max_points(value):
+    """Parse the ``max_points`` argument of the monitor, the maximum number
+    of points of each metric series.
+    """
+    value = int(value)
+    if value < MIN_POINTS:
+        raise ValueError(
+            "The maximum number of points must be at least {}.".format(
+                MIN_POINTS
+            )
+        )
+
+    return value
 
 
 class Monitor(Resource):
@@ -13,6 +44,7 @@ class Monitor(Resource):
     parser.add_argument("filter_name")
     parser.add_argument("metric")
     parser.add_argument("period")
+    parser.add_argument("max_points", type=max_points, location="args")
 
     def get(self):
         """
@@ -39,26 +71,46 @@ class Monitor(Resource):
              The period used to retrieve the data, e.g: "Last Month",
              "Last 6 Months", "Last Year" or "All". By default retrieves
              the last month of data.
+        - name: max_points
+          in: url
+          type: integer
+          description: >
+            Maximum number of points of each metric series, at least 4.
+            Longer series are downsampled keeping the first and last
+            points and the minimum and maximum values of consecutive
+            buckets of points, the series are then sent one after the
+            other. By default all the points are sent.
+        produces:
+          - application/json
+          - application/x-ndjson
+          - application/msgpack
+          - application/vnd.apache.arrow.stream
         responses:
           200:
-            description: Monitor data successfully retrieved.
+            description: >
+                Monitor data successfully retrieved, in the format of the
+                Accept header of the request.
         """
 
-        queryset = Measurement.query.join(Job, Metric)
+        # the metric series are filled when the measurements are inserted,
+        # the query is an index range scan on dataset, metric and date
+        queryset = Series.query
 
         args = self.parser.parse_args()
 
         ci_dataset = args["ci_dataset"]
         if ci_dataset:
-            queryset = queryset.filter(Job.ci_dataset == ci_dataset)
+            queryset = queryset.filter(Series.ci_dataset == ci_dataset)
 
         filter_name = args["filter_name"]
         if filter_name:
-            queryset = queryset.filter(Job.meta["filter_name"] == filter_name)
+            queryset = queryset.filter(Series.filter_name == filter_name)
 
         metric = args["metric"]
         if metric:
-            queryset = queryset.filter(Metric.name == metric)
+            # an unknown metric has no series, its id is None
+            metric_id = metric_catalog.resolve({metric}).get(metric)
+            queryset = queryset.filter(Series.metric_id == metric_id)
 
         period = args["period"]
         if period:
@@ -75,55 +127,34 @@ class Monitor(Resource):
                 start = end - datetime.timedelta(weeks=12)
 
             if period != "All":
-                queryset = queryset.filter(Job.date_created > start)
+                queryset = queryset.filter(Series.date_created > start)
 
-        queryset = queryset.order_by(Job.date_created.asc())
+        if args["max_points"]:
+            # a series is downsampled once all its points are read
+            queryset = queryset.order_by(
+                Series.metric_id.asc(), Series.date_created.asc()
+            )
+        else:
+            queryset = queryset.order_by(Series.date_created.asc())
 
         # TODO: test environment first
-        generator = queryset.values(
-            Measurement.value,
-            Measurement.metric_name,
-            Job.date_created,
-            Job.env["ci_id"],
-            Job.env["ci_url"],
-            Job.meta["filter_name"],
-            Job.id,
+        generator = queryset.with_entities(
+            Series.value,
+            Series.date_created,
+            Series.metric_name,
+            Series.ci_id,
+            Series.ci_url,
+            Series.filter_name,
+            Series.job_id,
         )
 
-        value_list = []
-        metric_name_list = []
-        date_created_list = []
-        ci_id_list = []
-        ci_url_list = []
-        job_filter_name_list = []
-        job_id_list = []
-
-        for (
-            value,
-            metric_name,
-            date_created,
-            ci_id,
-            ci_url,
-            job_filter_name,
-            job_id,
-        ) in generator:
-
-            value_list.append(value)
-            metric_name_list.append(metric_name)
-            date_created_list.append(
-                date_created.strftime("%Y-%m-%dT%H:%M:%SZ")
+        chunks = iter_columns(generator)
+        if args["max_points"]:
+            chunks = downsample(
+                chunks,
+                SCHEMA.get_field_index("metric_name"),
+                SCHEMA.get_field_index("value"),
+                args["max_points"],
             )
-            ci_id_list.append(ci_id)
-            ci_url_list.append(ci_url)
-            job_filter_name_list.append(job_filter_name)
-            job_id_list.append(job_id)
-
-        return {
-            "value": value_list,
-            "date_created": date_created_list,
-            "metric_name": metric_name_list,
-            "ci_id": ci_id_list,
-            "ci_url": ci_url_list,
-            "filter_name": job_filter_name_list,
-            "job_id": job_id_list,
-        }
+
+        return stream_table(chunks, SCHEMA)
@@ -16,7 +16,8 @@ class PackageList(Resource):
           200:
             description: Package list successfully retrieved.
         """
-        package = Metric.query.values(Metric.package)
+        # a loose index scan, one lookup per package
+        package = Metric.query.with_entities(Metric.package).distinct()
         try:
             packages = [p[0] for p in set(package)]
         except StopIteration:
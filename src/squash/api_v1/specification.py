@@ -2,6 +2,8 @@ from flask_jwt import jwt_required
 from flask_restful import Resource, reqparse
 from sqlalchemy import func
 
+from squash.pagination import paginate
+
 from ..models import MetricModel, SpecificationModel
 
 
@@ -226,7 +228,7 @@ class SpecificationList(Resource):
 
     def get(self):
         """
-        Retrieve the complete list of metric specifications.
+        Retrieve the list of metric specifications, a page at a time.
         ---
         tags:
           - Metric Specifications
@@ -254,9 +256,19 @@ class SpecificationList(Resource):
             type: string
             description: >
                 Name of the specification tag
+          - name: limit
+            in: url
+            type: integer
+            description: Maximum number of items in the page.
+          - name: after
+            in: url
+            type: integer
+            description: Return the items after this id.
         responses:
           200:
-            description: List of metric specifications successfully retrieved.
+            description: >
+                Page of metric specifications successfully retrieved, with
+                the URL of the `next` page.
         """
 
         queryset = SpecificationModel.query.join(MetricModel)
@@ -268,17 +280,12 @@ class SpecificationList(Resource):
 
         dataset_name = args["dataset_name"]
         if dataset_name:
-            expr = (
-                SpecificationModel.metadata_query["dataset_name"]
-                == dataset_name
-            )
+            expr = SpecificationModel.dataset_name == dataset_name
             queryset = queryset.filter(expr)
 
         filter_name = args["filter_name"]
         if filter_name:
-            expr = (
-                SpecificationModel.metadata_query["filter_name"] == filter_name
-            )
+            expr = SpecificationModel.filter_name == filter_name
             queryset = queryset.filter(expr)
 
         specification_tag = args["tag"]
@@ -288,7 +295,9 @@ class SpecificationList(Resource):
             )
             queryset = queryset.filter(expr)
 
-        return {"specs": [spec.json() for spec in queryset.all()]}
+        specs, next_url = paginate(queryset, SpecificationModel.id)
+
+        return {"specs": [spec.json() for spec in specs], "next": next_url}
 
     @jwt_required()
     def post(self):
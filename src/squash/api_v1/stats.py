@@ -1,5 +1,7 @@
 from flask_restful import Resource
 
+from squash.catalog import job_cache
+
 from ..models import JobModel as Job
 from ..models import MeasurementModel as Measurement
 from ..models import MetricModel as Metric
@@ -32,5 +34,7 @@ class Stats(Resource):
         stats["number_of_jobs"] = number_of_jobs
         stats["number_of_metrics"] = number_of_metrics
         stats["number_of_measurements"] = number_of_measurements
+        # counters of the worker that handles the request
+        stats["job_cache"] = job_cache.stats()
 
         return {"stats": stats}
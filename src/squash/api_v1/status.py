@@ -1,13 +1,22 @@
 from flask import jsonify
 from flask_restful import Resource
 
+from squash.tasks.pipeline import get_pipeline_status
 from squash.tasks.s3 import upload_object
 
+# Stages of a job ingestion reported for each task state
+STAGES = {
+    "STAGING": "staging",
+    "INSERTING": "inserting",
+    "SUCCESS": "done",
+    "FAILURE": "failed",
+}
+
 
 class Status(Resource):
     def get(self, task_id):
         """
-        Retrieve status of an upload task.
+        Retrieve status of a job pipeline or of an ingestion task.
         ---
         tags:
           - Misc
@@ -15,31 +24,43 @@ class Status(Resource):
         - name: task_id
           in: path
           type: string
-          description: Upload task ID as returned by /job
+          description: Pipeline or task ID as returned by /job
           required: true
         responses:
           200:
             description: >
-                Upload task status successfully retrieved.
+                Status successfully retrieved. The status of a pipeline
+                has the `stages` of the job, each blob upload, the
+                document upload and the InfluxDB export, with their
+                status and timings.
                 PENDING: the task did not start yet.
                 STARTED: the task has started.
+                STAGING: the job document is staged for ingestion.
+                INSERTING: the job is being inserted in the database.
                 SUCCESS: the task has completed.
                 FAILURE: something went wrong.
 
         """
+        pipeline = get_pipeline_status(task_id)
+        if pipeline is not None:
+            return jsonify(pipeline)
+
         task = upload_object.AsyncResult(task_id)
 
-        if task.state == "PENDING":
-            # Upload task did not start yet
-            response = {
-                "status": task.state,
-            }
-
-        elif task.state != "FAILURE":
-            response = {
-                "status": task.state,
-            }
-        else:
+        response = {"status": task.state}
+
+        if task.state in STAGES:
+            response["stage"] = STAGES[task.state]
+
+        if task.state == "FAILURE":
             # Something went wrong in
-            response = {"status": task.state, "message": str(task.info)}
+            response["message"] = getattr(task.info, "message", str(task.info))
+        elif task.state == "SUCCESS" and isinstance(task.info, dict):
+            # e.g. the job_id of an ingested job
+            response.update(task.info)
+            if "pipeline_id" in task.info:
+                response["pipeline"] = get_pipeline_status(
+                    task.info["pipeline_id"]
+                )
+
         return jsonify(response)
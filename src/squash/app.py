@@ -39,7 +39,9 @@ from squash.api_v1.status import Status
 from squash.api_v1.user import Register, User, UserList
 from squash.api_v1.version import Version
 from squash.auth import authenticate, identity
-from squash.models import UserModel
+from squash.compression import decompress_request
+from squash.models import MetricCatalogModel, UserModel
+from squash.responses import JSON, MSGPACK, output_json, output_msgpack
 
 
 def create_app(profile):
@@ -75,12 +77,26 @@ def create_app(profile):
             )
             user.save_to_db()
 
+        # create the metric catalog version stamp
+        if MetricCatalogModel.query.get(1) is None:
+            db.session.add(MetricCatalogModel(id=1, version=0))
+            db.session.commit()
+
+    # decompress request bodies sent with a Content-Encoding
+    app.before_request(decompress_request)
+
     # add authentication route /auth
     JWT(app, authenticate, identity)
 
     # register api resources
     api = Api(app)
 
+    # resources are sent as JSON or MessagePack, as requested by the
+    # Accept header, see squash.responses
+    api.representation(JSON)(output_json)
+    api.representation(MSGPACK)(output_msgpack)
+    api.representation("application/x-msgpack")(output_msgpack)
+
     template = {
         "tags": [
             {"name": "Jobs"},
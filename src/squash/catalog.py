@@ -0,0 +1,279 @@
+"""Implement the in-process metric catalog, environment and job caches.
+
+Ingesting a job requires resolving the metric name of every measurement to
+a metric id. Each worker process keeps a name to id map of the whole metric
+catalog, loaded with a single query, and revalidates it against the version
+stamp stored in the ``metric_catalog`` table, which is incremented whenever
+a metric is created, updated or deleted.
+
+The execution environment of a job is resolved the same way. Environments
+are only ever created, so their ids are cached without revalidation, and
+a missing environment is created with an upsert on its unique name.
+
+The rendered documents of the most recently requested jobs are kept in a
+bounded LRU cache keyed by job id and revision, the creation date and
+version of the job. A job changes only when a measurement is added to it,
+which increments its version, so a document cached by a worker is never
+served once the job changed in another one. The creation date tells apart
+a new job that reuses the id of a deleted one.
+"""
+
+__all__ = [
+    "EnvRegistry",
+    "JobCache",
+    "MetricCatalog",
+    "env_registry",
+    "job_cache",
+    "metric_catalog",
+]
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app as app
+from sqlalchemy import select
+
+from .models import (
+    EnvModel,
+    JobModel,
+    MetricCatalogModel,
+    MetricModel,
+    db,
+    select_fields,
+)
+
+
+class MetricCatalog:
+    """Per-worker cache of metric ids keyed by metric name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Force a version check on the next lookup."""
+        with self._lock:
+            self._version = None
+            self._checked_at = 0.0
+
+    def resolve(self, names):
+        """Resolve metric names to metric ids.
+
+        The version stamp is checked only if the cache is older than
+        ``METRIC_CATALOG_TTL`` seconds or if some of the names are not in
+        the cache, and the catalog is reloaded only if the version changed.
+        An id may refer to a metric deleted by another worker until then,
+        an insert that fails on its foreign key must `invalidate` the
+        catalog and resolve the names again, see
+        `squash.ingestion.JobIngestion.insert_measurements`.
+
+        Parameters
+        ----------
+        names : `set`
+            Full qualified names of the metrics.
+
+        Returns
+        -------
+        metric_ids : `dict`
+            Mapping of metric name to metric id for the metrics found.
+        """
+        ttl = app.config["METRIC_CATALOG_TTL"]
+
+        with self._lock:
+            expired = time.monotonic() - self._checked_at > ttl
+            if expired or not names <= self._ids.keys():
+                self._revalidate()
+
+            return {
+                name: self._ids[name] for name in names if name in self._ids
+            }
+
+    def _revalidate(self):
+        """Reload the catalog if its version stamp changed.
+
+        The catalog is read on its own connection, outside of the snapshot
+        of the transaction in progress, so that a reload after a failed
+        insert does not return the deleted metrics again.
+        """
+        catalog = MetricCatalogModel.__table__
+        metric = MetricModel.__table__
+
+        with db.engine.connect() as connection:
+            version = connection.execute(
+                select([catalog.c.version]).where(catalog.c.id == 1)
+            ).scalar()
+            version = version or 0
+
+            if version != self._version:
+                rows = connection.execute(select([metric.c.name, metric.c.id]))
+                self._ids = {name: _id for name, _id in rows}
+                self._version = version
+
+        self._checked_at = time.monotonic()
+
+
+metric_catalog = MetricCatalog()
+
+
+class EnvRegistry:
+    """Per-worker cache of environment ids keyed by environment name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+
+    def invalidate(self):
+        """Clear the cache, e.g. after an environment is deleted."""
+        with self._lock:
+            self._ids = {}
+
+    def get_id(self, name, create=False):
+        """Return the id of an environment.
+
+        Parameters
+        ----------
+        name : `str`
+            Name of the environment, e.g. ``jenkins``.
+        create : `bool`, optional
+            Whether to create the environment if it does not exist.
+
+        Returns
+        -------
+        env_id : `int` or `None`
+            id of the environment, `None` if it does not exist.
+        """
+        with self._lock:
+            if name not in self._ids:
+                env_id = self._upsert(name) if create else self._find(name)
+                if env_id is None:
+                    return None
+                self._ids[name] = env_id
+
+            return self._ids[name]
+
+    @staticmethod
+    def _find(name):
+        """Find the id of an environment in the database."""
+        return db.session.query(EnvModel.id).filter_by(name=name).scalar()
+
+    @staticmethod
+    def _upsert(name):
+        """Create the environment if it does not exist and return its id.
+
+        The environment is committed on its own connection, so that it is
+        not rolled back with the job that required it while its id is
+        cached, and concurrent workers creating the same environment are
+        serialized by the unique index on its name.
+        """
+        table = EnvModel.__table__
+        statement = table.insert().prefix_with("IGNORE", dialect="mysql")
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                statement, {"name": name, "display_name": name.title()}
+            )
+            return connection.execute(
+                select([table.c.id]).where(table.c.name == name)
+            ).scalar()
+
+
+env_registry = EnvRegistry()
+
+
+class JobCache:
+    """Per-worker LRU cache of job documents keyed by job id and revision.
+
+    The cache holds at most ``JOB_CACHE_SIZE`` documents. The documents are
+    shared by the requests, they must not be modified.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Remove all the documents and reset the counters."""
+        with self._lock:
+            self._documents.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def invalidate(self, job_id):
+        """Remove the documents of a job.
+
+        E.g. after the job is deleted or a measurement is added to it.
+        """
+        with self._lock:
+            for key in [key for key in self._documents if key[0] == job_id]:
+                del self._documents[key]
+
+    def get_document(self, job_id, revision, fields=None):
+        """Return the document of a job, see `squash.models.JobModel.json`.
+
+        On a miss the job is loaded and its document is cached if the job
+        has still the requested revision. If only some fields are requested
+        and the document is not cached, only the relationships required by
+        these fields are loaded and the document is not cached.
+
+        Parameters
+        ----------
+        job_id : `int`
+            ID of the job.
+        revision : `str`
+            Revision of the job, see `squash.models.JobModel.get_revision`.
+        fields : `list`, optional
+            Fields of the document, see `squash.models.select_fields`.
+
+        Returns
+        -------
+        document : `dict` or `None`
+            The job document, `None` if the job does not exist.
+        """
+        key = (job_id, revision)
+
+        with self._lock:
+            if key in self._documents:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                document = self._documents[key]
+                if fields is None:
+                    return document
+                return select_fields(document, fields)
+
+            self.misses += 1
+
+        # the job is loaded without holding the lock
+        job = JobModel.find_by_id(job_id, fields)
+        if job is None:
+            return None
+
+        document = job.json(fields)
+        if fields is not None:
+            return document
+
+        if job.revision == revision:
+            max_size = app.config["JOB_CACHE_SIZE"]
+            with self._lock:
+                self._documents[key] = document
+                while len(self._documents) > max_size:
+                    self._documents.popitem(last=False)
+
+        return document
+
+    def stats(self):
+        """Return the number of documents cached, hits and misses."""
+        with self._lock:
+            return {
+                "size": len(self._documents),
+                "max_size": app.config["JOB_CACHE_SIZE"],
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+job_cache = JobCache()
@@ -0,0 +1,114 @@
+"""Decompress request bodies sent with a Content-Encoding.
+
+lsst.verify job documents are highly repetitive JSON, clients can upload
+them compressed with ``Content-Encoding: gzip`` or ``zstd`` on the
+ingestion endpoints. The body is decompressed as it is read, and reading
+more than ``MAX_DECOMPRESSED_SIZE`` bytes aborts the request.
+"""
+
+__all__ = ["decompress_request"]
+
+import gzip
+import zlib
+
+import zstandard
+from flask import current_app as app
+from flask import request
+from werkzeug.exceptions import (
+    BadRequest,
+    RequestEntityTooLarge,
+    UnsupportedMediaType,
+)
+
+# Endpoints that accept compressed request bodies
+COMPRESSED_ENDPOINTS = {"job", "jobs", "metrics", "specs", "measurement"}
+
+
+class _DecompressingReader:
+    """File-like object that reads a decompressed stream up to a limit.
+
+    Parameters
+    ----------
+    stream : file-like object
+        The decompressed stream.
+    limit : `int`
+        Maximum number of decompressed bytes that can be read.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.size = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(self.chunk_size), b""))
+
+        try:
+            # read one byte more than allowed to detect the overflow
+            data = self.stream.read(min(size, self.limit - self.size + 1))
+        except (OSError, EOFError, zlib.error, zstandard.ZstdError):
+            raise BadRequest("Invalid compressed request body.")
+
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(
+                "The decompressed request body exceeds {} bytes.".format(
+                    self.limit
+                )
+            )
+
+        return data
+
+    def readline(self, size=-1):
+        # required by the werkzeug form parser, unused for JSON bodies
+        raise BadRequest("Compressed form data is not supported.")
+
+
+def decompress_request():
+    """Replace the request input stream with a decompressing one.
+
+    Registered with `flask.Flask.before_request`, it must run before the
+    request body is read.
+    """
+    encoding = request.headers.get("Content-Encoding", "").strip().lower()
+
+    if not encoding or encoding == "identity":
+        return
+
+    if request.endpoint not in COMPRESSED_ENDPOINTS:
+        raise UnsupportedMediaType(
+            "Compressed request bodies are not accepted by this resource."
+        )
+
+    stream = request.environ["wsgi.input"]
+    if request.content_length is not None:
+        stream = request.stream
+
+    if encoding in ("gzip", "x-gzip"):
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    elif encoding == "zstd":
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            stream, read_across_frames=True
+        )
+    else:
+        raise UnsupportedMediaType(
+            "Unsupported Content-Encoding `{}`.".format(encoding)
+        )
+
+    environ = request.environ
+    environ["wsgi.input"] = _DecompressingReader(
+        stream, app.config["MAX_DECOMPRESSED_SIZE"]
+    )
+    # the length of the decompressed body is unknown, the stream ends
+    # when the decompressed data ends
+    environ["wsgi.input_terminated"] = True
+    environ.pop("CONTENT_LENGTH", None)
+    environ.pop("HTTP_CONTENT_ENCODING", None)
+
+    # drop the properties computed from the original environ
+    request.__dict__.pop("stream", None)
+    request.__dict__.pop("content_length", None)
+    request.__dict__.pop("headers", None)
@@ -33,6 +33,37 @@ class Config(object):
     # SQuaSH API URL
     SQUASH_API_URL = os.environ.get("SQUASH_API_URL", "localhost:5000")
 
+    # Seconds during which a worker trusts its cached metric catalog
+    # without checking the catalog version stamp in the database
+    METRIC_CATALOG_TTL = float(os.environ.get("METRIC_CATALOG_TTL", 5))
+
+    # Job documents larger than this number of bytes, or sent without a
+    # Content-Length, are parsed incrementally and their data blobs spooled
+    # to disk instead of being loaded in memory
+    JOB_STREAMING_THRESHOLD = int(
+        os.environ.get("JOB_STREAMING_THRESHOLD", 64 * 1024 * 1024)
+    )
+
+    # Maximum size in bytes of a compressed request body once decompressed
+    MAX_DECOMPRESSED_SIZE = int(
+        os.environ.get("MAX_DECOMPRESSED_SIZE", 2 * 1024 * 1024 * 1024)
+    )
+
+    # Compression of the job documents archived in S3, "gzip" or empty
+    # for none. Documents parsed incrementally are archived uncompressed.
+    JOB_ARCHIVE_COMPRESSION = os.environ.get("JOB_ARCHIVE_COMPRESSION", "")
+
+    # Number of job documents of a NDJSON request inserted per transaction
+    JOB_BATCH_SIZE = int(os.environ.get("JOB_BATCH_SIZE", 100))
+
+    # Number of items per page of the list resources, when the request
+    # has no limit, and maximum number of items per page
+    DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", 1000))
+    MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 10000))
+
+    # Number of rendered job documents cached by each worker
+    JOB_CACHE_SIZE = int(os.environ.get("JOB_CACHE_SIZE", 128))
+
     # Turn off the Flask-SQLAlchemy event system
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
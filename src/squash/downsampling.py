@@ -0,0 +1,116 @@
+"""Downsample the time series of the monitor.
+
+A series with more points than a plot can show is reduced with min/max
+bucketing: the first and last points are kept, the other points are split
+in buckets of consecutive points and the points with the minimum and the
+maximum value of each bucket are kept. The shape of the series, and its
+outliers, are preserved with at most ``max_points`` points. The points kept
+are rows of the original series, e.g. with the id of their job.
+"""
+
+__all__ = ["bucket_extrema", "downsample"]
+
+import numpy as np
+
+# Minimum number of points of a downsampled series, the first and last
+# points and the extrema of a bucket
+MIN_POINTS = 4
+
+
+def bucket_extrema(values, max_points):
+    """Return the indices of the points kept by min/max bucketing.
+
+    Parameters
+    ----------
+    values : `numpy.ndarray`
+        The values of the series, in the order of the series.
+    max_points : `int`
+        Maximum number of points kept, at least ``MIN_POINTS``.
+
+    Returns
+    -------
+    indices : `numpy.ndarray`
+        The sorted indices of the points kept.
+    """
+    size = len(values)
+    if size <= max_points:
+        return np.arange(size)
+
+    # the first and last points are kept as is
+    interior = np.arange(1, size - 1)
+    buckets = (max_points - 2) // 2
+    bucket = (interior - 1) * buckets // len(interior)
+
+    # points ordered by bucket, then value: the first point of a bucket has
+    # its minimum value and the last one its maximum value
+    order = np.lexsort((values[interior], bucket))
+    starts = np.flatnonzero(np.diff(bucket[order], prepend=-1))
+    ends = np.append(starts[1:], len(order)) - 1
+
+    return np.unique(
+        np.concatenate(
+            ([0], interior[order[starts]], interior[order[ends]], [size - 1])
+        )
+    )
+
+
+def _downsample_series(parts, value, max_points):
+    """Concatenate the parts of a series and return its downsampled columns.
+
+    The columns keep their dtype, only the values are converted to floats to
+    select the points kept.
+    """
+    columns = [
+        np.concatenate([part[i] for part in parts])
+        for i in range(len(parts[0]))
+    ]
+    indices = bucket_extrema(columns[value].astype(np.float64), max_points)
+
+    return tuple(column[indices] for column in columns)
+
+
+def downsample(chunks, key, value, max_points):
+    """Downsample each series of a table.
+
+    Parameters
+    ----------
+    chunks : iterable
+        The chunks of the table, with a sequence of values per column, see
+        `squash.responses.iter_columns`. The rows are ordered by series,
+        and by date within a series.
+    key : `int`
+        Index of the column that identifies the series, e.g. the metric.
+    value : `int`
+        Index of the column with the values of the series.
+    max_points : `int`
+        Maximum number of points of each series.
+
+    Yields
+    ------
+    columns : `tuple`
+        The downsampled columns of a series, one series at a time. Only
+        the rows of the current series are held in memory.
+    """
+    series = None
+    parts = []
+
+    for columns in chunks:
+        # e.g. float64 values and int64 job ids, dates and strings are kept
+        # as objects or unicode arrays
+        columns = [np.asarray(column) for column in columns]
+        keys = columns[key]
+
+        # boundaries of the series in the chunk
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        for start, end in zip(
+            np.append(0, bounds), np.append(bounds, len(keys))
+        ):
+            if parts and keys[start] != series:
+                yield _downsample_series(parts, value, max_points)
+                parts = []
+
+            series = keys[start]
+            parts.append([column[start:end] for column in columns])
+
+    if parts:
+        yield _downsample_series(parts, value, max_points)
@@ -0,0 +1,574 @@
+"""Ingest lsst.verify jobs into the SQuaSH database.
+
+The rows that make up a verification job (env, job, packages, measurements,
+blobs and the ``measurement_blob`` association) are written inside a single
+transaction using set-based inserts, and committed once. If any step fails
+the transaction is rolled back, so no partially ingested job is left behind.
+A batch of jobs is ingested the same way, with the inserts of all the jobs
+in the batch grouped together.
+"""
+
+__all__ = [
+    "JobIngestion",
+    "JobBatchIngestion",
+    "get_job_data",
+    "get_job_digest",
+]
+
+import hashlib
+import json
+import warnings
+
+import numpy as np
+from sqlalchemy import cast, literal
+from sqlalchemy.exc import IntegrityError
+
+from squash.catalog import env_registry, metric_catalog
+from squash.decorators import time_this
+from squash.error import ApiError
+from squash.tasks.s3 import get_s3_uri, put_spool_file
+
+from .models import (
+    BlobModel,
+    EnvModel,
+    JobModel,
+    MeasurementModel,
+    MetricSeriesModel,
+    PackageModel,
+    db,
+    measurement_blob,
+)
+
+
+def get_job_data(document):
+    """Return the data of a decoded job document.
+
+    Used for the documents that are not read by the request parser of the
+    Job resource, e.g. the lines of a bulk ingestion request or a staged
+    document. Missing keys get the same defaults as with that parser.
+
+    Parameters
+    ----------
+    document
+        The decoded JSON job document.
+
+    Returns
+    -------
+    data : `dict`
+        The ``measurements``, ``meta`` and ``blobs`` of the job.
+
+    Raises
+    ------
+    ApiError
+        If the document is not a JSON object.
+    """
+    if not isinstance(document, dict):
+        raise ApiError("Invalid job document.", 400)
+
+    return {
+        "measurements": document.get("measurements") or [],
+        "meta": document.get("meta") or {},
+        "blobs": document.get("blobs") or [],
+    }
+
+
+def get_job_digest(data):
+    """Return the digest of a job document, used as its idempotency key.
+
+    The digest is the SHA-256 of the canonical JSON serialization of the
+    ``meta`` and ``measurements`` of the job and the identifiers and names
+    of its data blobs. Blob identifiers are UUIDs assigned when the job is
+    created by ``lsst.verify``, so the blob data is not hashed; it may be
+    spooled to disk by the streaming parser.
+
+    Parameters
+    ----------
+    data : `dict`
+        The verification job document.
+
+    Returns
+    -------
+    digest : `str`
+        Hexadecimal SHA-256 digest.
+    """
+    document = {
+        "meta": data["meta"],
+        "measurements": data["measurements"],
+        "blobs": [
+            [blob.get("identifier"), blob.get("name")]
+            for blob in data["blobs"]
+            if blob
+        ],
+    }
+    canonical = json.dumps(document, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class JobIngestion:
+    """Insert a verification job in a single database transaction.
+
+    Parameters
+    ----------
+    data : `dict`
+        The verification job document as sent by ``dispatch_verify.py``,
+        with ``meta``, ``measurements`` and ``blobs`` keys.
+    idempotency_key : `str`, optional
+        Idempotency key of the job, a second job with the same key is
+        rejected with a 409 error.
+    """
+
+    def __init__(self, data, idempotency_key=None):
+        self.documents = [data]
+        self.idempotency_keys = [idempotency_key]
+        self.jobs = []
+        self.blob_ids = {}
+
+    @property
+    def data(self):
+        """The verification job document."""
+        return self.documents[0]
+
+    def run(self):
+        """Insert the job and commit the transaction.
+
+        Returns
+        -------
+        job_id : `int`
+            id of the job created.
+
+        Raises
+        ------
+        ApiError
+            If the job document is invalid, a job with the same idempotency
+            key exists or any of the inserts fail. The transaction is
+            rolled back before the error is raised.
+        """
+        return self.ingest()[0]
+
+    def ingest(self):
+        """Insert the jobs of all the documents and commit the transaction.
+
+        Returns
+        -------
+        job_ids : `list`
+            ids of the jobs created, in the order of the documents.
+        """
+        try:
+            env_ids = [
+                self.check_or_create_env(data) for data in self.documents
+            ]
+            job_ids = self.create_jobs(env_ids)
+            self.insert_packages()
+            self.insert_measurements()
+            self.register_s3_uris()
+            db.session.commit()
+        except ApiError:
+            db.session.rollback()
+            raise
+        except Exception:
+            db.session.rollback()
+            raise ApiError("An error occurred creating the job object.", 500)
+
+        return job_ids
+
+    @time_this
+    def check_or_create_env(self, data):
+        """Check if env (e.g. Jenkins) exists in the db, or create it.
+
+        Parameters
+        ----------
+        data : `dict`
+            The verification job document.
+
+        Returns
+        -------
+        env_id : `int`
+            id of the environment associated with the job.
+        """
+        # allows for unknown environment
+        env_name = "unknown"
+        if "env" in data["meta"]:
+            env = data["meta"]["env"]
+            if "env_name" in env:
+                env_name = env["env_name"]
+            else:
+                raise ApiError("Missing `env_name` in env metadata.", 400)
+
+        # a longer name would be truncated by the insert of the env
+        max_length = EnvModel.__table__.c.name.type.length
+        if not isinstance(env_name, str) or len(env_name) > max_length:
+            raise ApiError(
+                "The `env_name` must be a string of at most {} "
+                "characters.".format(max_length),
+                400,
+            )
+
+        try:
+            return env_registry.get_id(env_name, create=True)
+        except Exception:
+            raise ApiError("An error ocurred creating the env object.", 500)
+
+    @time_this
+    def create_jobs(self, env_ids):
+        """Create the job objects.
+
+        Parameters
+        ----------
+        env_ids : `list`
+            ids of the environment associated with each job.
+
+        Returns
+        -------
+        job_ids : `list`
+            ids of the jobs created
+        """
+        for env_id, key, data in zip(
+            env_ids, self.idempotency_keys, self.documents
+        ):
+            # job metadata contains arbitrary metadata plus
+            # env metadata and packages
+            meta = data["meta"].copy()
+
+            # we extract the env metadata
+            if "env" in meta:
+                env = meta.pop("env")
+            else:
+                env = {}
+
+            # and remove the packages, they will be inserted later.
+            if "packages" in meta:
+                del meta["packages"]
+            else:
+                raise ApiError("Missing packages metadata.", 400)
+
+            # what remains in meta is the arbitrary metadata we want to save
+            job = JobModel(env_id, env, meta)
+            job.idempotency_key = key
+            self.jobs.append(job)
+
+        try:
+            db.session.add_all(self.jobs)
+            db.session.flush()
+        except IntegrityError as err:
+            # the unique index on the idempotency key, other violations,
+            # e.g. of the env foreign key, are not a replayed job
+            if "idempotency_key" in str(err.orig):
+                raise ApiError("The job already exists.", 409)
+            # a cached env may have been deleted, it is resolved again by
+            # the next request
+            env_registry.invalidate()
+            raise ApiError("An error occurred creating the job object.", 500)
+        except Exception:
+            raise ApiError("An error occurred creating the job object.", 500)
+
+        return [job.id for job in self.jobs]
+
+    @time_this
+    def insert_packages(self):
+        """Insert packages associated with the jobs in bulk."""
+        rows = []
+        for job, data in zip(self.jobs, self.documents):
+            packages = data["meta"]["packages"]
+            rows.extend(
+                {
+                    "job_id": job.id,
+                    "name": package.get("name"),
+                    "git_sha": package.get("git_sha"),
+                    "git_url": package.get("git_url"),
+                    "git_branch": package.get("git_branch"),
+                    "eups_version": package.get("eups_version"),
+                }
+                for package in packages.values()
+            )
+
+        if not rows:
+            return
+
+        try:
+            db.session.execute(PackageModel.__table__.insert(), rows)
+        except Exception:
+            raise ApiError("An error occurred inserting packages", 500)
+
+    @time_this
+    def insert_measurements(self):
+        """Insert measurements and data blobs associated with the jobs.
+
+        Measurements are inserted with a single multi-row insert, their ids
+        are read back in insertion order and used to link the data blobs
+        through the ``measurement_blob`` association table. The measurements
+        are appended to the metric series with a single insert as well.
+        """
+        for data in self.documents:
+            for measurement in data["measurements"]:
+                if not measurement or "metric" not in measurement:
+                    raise ApiError(
+                        "You must provide a list of measurements "
+                        "and the associated metric name.",
+                        400,
+                    )
+
+        metric_names = set(
+            measurement["metric"]
+            for data in self.documents
+            for measurement in data["measurements"]
+        )
+        rows, inserted = self.get_measurement_rows(
+            metric_catalog.resolve(metric_names)
+        )
+
+        if not rows:
+            return
+
+        try:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(
+                        MeasurementModel.__table__.insert(), rows
+                    )
+            except IntegrityError:
+                # a cached metric was deleted by another worker, the
+                # catalog is revalidated and the insert retried once
+                metric_catalog.invalidate()
+                rows, inserted = self.get_measurement_rows(
+                    metric_catalog.resolve(metric_names)
+                )
+                if rows:
+                    db.session.execute(
+                        MeasurementModel.__table__.insert(), rows
+                    )
+
+            # Auto-increment ids of a multi-row insert are assigned in
+            # ascending order, so they match the order of the rows.
+            measurement_ids = [
+                _id
+                for (_id,) in db.session.query(MeasurementModel.id)
+                .filter(
+                    MeasurementModel.job_id.in_([job.id for job in self.jobs])
+                )
+                .order_by(MeasurementModel.id.asc())
+            ]
+            MetricSeriesModel.append(
+                MeasurementModel.job_id.in_([job.id for job in self.jobs])
+            )
+        except Exception:
+            raise ApiError("An error occurred inserting measurements", 500)
+
+        self.insert_blobs(zip(measurement_ids, inserted))
+
+    def get_measurement_rows(self, metric_ids):
+        """Return the rows of the measurements of the jobs.
+
+        Parameters
+        ----------
+        metric_ids : `dict`
+            Mapping of metric name to metric id, see
+            `squash.catalog.MetricCatalog.resolve`.
+
+        Returns
+        -------
+        rows : `list`
+            The measurement rows, measurements of unknown metrics are
+            skipped with a warning.
+        inserted : `list`
+            The measurement and job documents of each row.
+        """
+        rows = []
+        inserted = []
+        for job, data in zip(self.jobs, self.documents):
+            for measurement in data["measurements"]:
+                metric_name = measurement["metric"]
+
+                if metric_name not in metric_ids:
+                    warnings.warn(
+                        "Metric `{}` not found, it looks like "
+                        "the metrics definition is out of "
+                        "date.".format(metric_name)
+                    )
+                    continue
+
+                value = measurement.get("value", 0)
+                # handle nan in measurement values
+                if np.isnan(float(value)):
+                    value = 0
+
+                rows.append(
+                    {
+                        "job_id": job.id,
+                        "metric_id": metric_ids[metric_name],
+                        "value": value,
+                        "unit": measurement.get("unit"),
+                        "metric_name": metric_name,
+                    }
+                )
+                inserted.append((measurement, data))
+
+        return rows, inserted
+
+    @time_this
+    def insert_blobs(self, measurements):
+        """Insert data blobs and link them to their measurements.
+
+        There is a single ``blob`` row per identifier, shared by all the
+        measurements that reference it through ``measurement_blob``.
+
+        Parameters
+        ----------
+        measurements : iterable of (`int`, (`dict`, `dict`))
+            Pairs of measurement id and the measurement and job documents.
+        """
+        blobs = {
+            blob["identifier"]: blob
+            for data in self.documents
+            for blob in data["blobs"]
+            if blob and "identifier" in blob and "name" in blob
+        }
+
+        links = []
+        for measurement_id, (measurement, data) in measurements:
+            for identifier in set(measurement.get("blob_refs") or []):
+                if identifier in blobs:
+                    links.append((measurement_id, identifier))
+
+        if not links:
+            return
+
+        identifiers = set(identifier for _, identifier in links)
+
+        # The S3 key of a blob is its identifier, the final location of
+        # the blobs uploaded by `upload_blobs_to_s3` is known beforehand
+        uploaded = set(
+            blob["identifier"]
+            for data in self.documents
+            for blob in data["blobs"]
+            if blob and "identifier" in blob and "data" in blob
+        )
+
+        # Blobs are identified by an UUID, an identifier that is already
+        # in the database refers to the same blob and its row is reused.
+        statement = BlobModel.__table__.insert().prefix_with(
+            "IGNORE", dialect="mysql"
+        )
+
+        try:
+            db.session.execute(
+                statement,
+                [
+                    {
+                        "identifier": identifier,
+                        "name": blobs[identifier]["name"],
+                        "s3_uri": get_s3_uri(identifier)
+                        if identifier in uploaded
+                        else None,
+                    }
+                    for identifier in identifiers
+                ],
+            )
+            query = db.session.query(
+                BlobModel.identifier, BlobModel.id
+            ).filter(BlobModel.identifier.in_(identifiers))
+            self.blob_ids = {identifier: _id for identifier, _id in query}
+
+            db.session.execute(
+                measurement_blob.insert(),
+                [
+                    {
+                        "measurement_id": measurement_id,
+                        "blob_id": self.blob_ids[identifier],
+                    }
+                    for measurement_id, identifier in links
+                ],
+            )
+        except Exception:
+            raise ApiError("An error occurred inserting measurements", 500)
+
+    @time_this
+    def register_s3_uris(self):
+        """Register the S3 URI locations of the jobs.
+
+        The S3 key of a job is its id, so the URIs of all the jobs are set
+        with a single statement once the ids are assigned. The URIs of the
+        data blobs are written when the blobs are inserted.
+        """
+        job_ids = [job.id for job in self.jobs]
+
+        try:
+            JobModel.query.filter(JobModel.id.in_(job_ids)).update(
+                {
+                    JobModel.s3_uri: literal(get_s3_uri(""))
+                    + cast(JobModel.id, db.String)
+                },
+                synchronize_session=False,
+            )
+        except Exception:
+            raise ApiError(
+                "An error occurred registering the S3 URI location.", 500
+            )
+
+    @time_this
+    def upload_blobs_to_s3(self, pipelines):
+        """Add the upload of the data blobs to the pipelines of the jobs.
+
+        To be called after `run`. The blobs spooled by the streaming parser
+        are uploaded by this process, the other blobs by the workers.
+
+        Parameters
+        ----------
+        pipelines : `list` of `squash.tasks.pipeline.JobPipeline`
+            The pipeline of each job, in the order of the documents.
+        """
+        for pipeline, data in zip(pipelines, self.documents):
+            for blob in data["blobs"]:
+                if (
+                    blob
+                    and "identifier" in blob
+                    and "data" in blob
+                    and "name" in blob
+                ):
+                    identifier = blob["identifier"]
+                    metadata = {"name": blob["name"]}
+                    stage = "blob:{}".format(identifier)
+
+                    if hasattr(blob["data"], "read"):
+                        # spooled by the streaming parser, too large to be
+                        # sent in a task message, uploaded and closed by
+                        # this process
+                        pipeline.run(
+                            stage,
+                            put_spool_file,
+                            identifier,
+                            blob["data"],
+                            metadata,
+                        )
+                        continue
+
+                    body = json.dumps(blob["data"])
+
+                    # uploaded by a worker
+                    pipeline.add(stage, identifier, body, metadata)
+
+
+class JobBatchIngestion(JobIngestion):
+    """Insert several verification jobs in a single database transaction.
+
+    Parameters
+    ----------
+    documents : `list`
+        The verification job documents.
+    idempotency_keys : `list`, optional
+        Idempotency key of each job.
+    """
+
+    def __init__(self, documents, idempotency_keys=None):
+        super().__init__(None)
+        self.documents = documents
+        self.idempotency_keys = idempotency_keys or [None] * len(documents)
+
+    def run(self):
+        """Insert the jobs and commit the transaction.
+
+        Returns
+        -------
+        job_ids : `list`
+            ids of the jobs created, in the order of the documents.
+        """
+        return self.ingest()
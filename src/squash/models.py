@@ -5,8 +5,10 @@ from datetime import datetime
 
 import numpy as np
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Computed
 from sqlalchemy.dialects.mysql import JSON, TIMESTAMP
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import lazyload
 from sqlalchemy.sql import expression
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -33,6 +35,61 @@ def mysql_now(element, compiler, **kw):
     return "CURRENT_TIMESTAMP()"
 
 
+def select_fields(document, fields):
+    """Return the selected fields of a document.
+
+    Parameters
+    ----------
+    document : `dict`
+        The document, it is not modified.
+    fields : `list`
+        Names of the fields, the fields of a nested object are named by
+        their path, e.g. ``meta.env``. Fields that are not in the document
+        are ignored.
+
+    Returns
+    -------
+    selected : `dict`
+        A document with the selected fields only.
+    """
+    # a field within a selected field is already included
+    fields = [
+        field
+        for field in fields
+        if not any(field.startswith(other + ".") for other in fields)
+    ]
+
+    selected = {}
+    for field in fields:
+        *parents, name = field.split(".")
+
+        source, target = document, selected
+        for parent in parents:
+            source = source.get(parent)
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(parent, {})
+        else:
+            if name in source:
+                target[name] = source[name]
+
+    return selected
+
+
+def requires_field(fields, name):
+    """Whether a field is required by the selected fields.
+
+    A field is required if it is selected, if a field within it is, or if it
+    is within a selected field.
+    """
+    return any(
+        field == name
+        or field.startswith(name + ".")
+        or name.startswith(field + ".")
+        for field in fields
+    )
+
+
 class UserModel(db.Model):
     """Database model for authenticated API users."""
 
@@ -93,7 +150,7 @@ class MetricModel(db.Model):
     # name, e.g. validate_drp.AM1
     name = db.Column(db.String(64), nullable=False, unique=True)
     # Name of the package that defines this metric, e.g. validate_drp
-    package = db.Column(db.String(64))
+    package = db.Column(db.String(64), index=True)
     # Display name of the metric, e.g. `AM1`
     display_name = db.Column(db.String(64))
     # Short description about the metric.
@@ -107,8 +164,15 @@ class MetricModel(db.Model):
     # usually with a handle to the document, a url and a page number.
     reference = db.Column(JSON())
 
-    specification = db.relationship("SpecificationModel", lazy="joined")
-    measurement = db.relationship("MeasurementModel", lazy="joined")
+    # The specifications and measurements of a metric are not loaded with
+    # it. Measurements are queried a page at a time, see `Metric.get`, and
+    # neither is loaded to delete the metric, see `delete_from_db`.
+    specification = db.relationship(
+        "SpecificationModel", lazy="select", passive_deletes=True
+    )
+    measurement = db.relationship(
+        "MeasurementModel", lazy="dynamic", passive_deletes=True
+    )
 
     def __init__(
         self,
@@ -149,14 +213,57 @@ class MetricModel(db.Model):
     def save_to_db(self):
         """Save metric to database."""
         db.session.add(self)
+        MetricCatalogModel.bump()
         db.session.commit()
 
     def delete_from_db(self):
-        """Delete metric from the databse."""
+        """Delete metric from the databse.
+
+        The specifications and measurements of the metric are kept and
+        unlinked from it with a single update each, its series is deleted.
+        """
+        for model in (SpecificationModel, MeasurementModel):
+            model.query.filter_by(metric_id=self.id).update(
+                {model.metric_id: None}, synchronize_session=False
+            )
+        MetricSeriesModel.query.filter_by(metric_id=self.id).delete(
+            synchronize_session=False
+        )
         db.session.delete(self)
+        MetricCatalogModel.bump()
         db.session.commit()
 
 
+class MetricCatalogModel(db.Model):
+    """Version stamp of the metric catalog.
+
+    A single row whose version is incremented in the same transaction
+    that creates, updates or deletes a metric, so that the API workers can
+    cheaply detect that their cached copy of the metric catalog is stale.
+    See `squash.catalog.MetricCatalog`.
+    """
+
+    __tablename__ = "metric_catalog"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def get_version(cls):
+        """Return the current version of the metric catalog."""
+        version = db.session.query(cls.version).filter_by(id=1).scalar()
+        return version or 0
+
+    @classmethod
+    def bump(cls):
+        """Increment the catalog version in the current transaction."""
+        updated = cls.query.filter_by(id=1).update(
+            {cls.version: cls.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.session.add(cls(id=1, version=1))
+
+
 class SpecificationModel(db.Model):
     """Database model for specifications.
 
@@ -168,7 +275,7 @@ class SpecificationModel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     # Full qualified name of the specification, e.g.
     # validate_drp.AM1.minimum_gri
-    name = db.Column(db.String(64), nullable=False)
+    name = db.Column(db.String(64), nullable=False, index=True)
     # Defines the specification, usually the threshold
     # field has an operator, value and unit keys.
     threshold = db.Column(JSON())
@@ -177,11 +284,28 @@ class SpecificationModel(db.Model):
     # Additional metadata information that can be tested
     # against the job metadata
     metadata_query = db.Column(JSON())
+    # Dataset and filter of the metadata query, generated columns that
+    # are indexed so that specifications are filtered without parsing
+    # the metadata query of every row
+    dataset_name = db.Column(
+        db.String(64),
+        Computed(metadata_query["dataset_name"].as_string(), persisted=False),
+    )
+    filter_name = db.Column(
+        db.String(64),
+        Computed(metadata_query["filter_name"].as_string(), persisted=False),
+    )
     # Type of specification
     type = db.Column(db.String(64))
 
     # Id of the metric this specification applies to
-    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"))
+    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"), index=True)
+
+    __table_args__ = (
+        db.Index(
+            "ix_spec_dataset_name_filter_name", "dataset_name", "filter_name"
+        ),
+    )
 
     def __init__(
         self,
@@ -235,7 +359,7 @@ class EnvModel(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     # Name of the environment
-    name = db.Column(db.String(64), nullable=False)
+    name = db.Column(db.String(64), nullable=False, unique=True, index=True)
     # Environment display name
     display_name = db.Column(db.String(64), nullable=False)
 
@@ -280,25 +404,61 @@ class JobModel(db.Model):
     # Name of the dataset used in this job, extrated from the
     # environment
     # FIXME: DM-14538 Remove ci_dataset from job model
-    ci_dataset = db.Column(db.String(32), default=None)
+    ci_dataset = db.Column(db.String(32), default=None, index=True)
     # Timestamp when the actual job object was created
     date_created = db.Column(
-        db.TIMESTAMP, nullable=False, server_default=now()
+        db.TIMESTAMP, nullable=False, server_default=now(), index=True
     )
     env = db.Column(JSON())
     meta = db.Column(JSON())
-    # URI of the object store repository for this job, note that this
-    # field is updated only after the job object is created
+    # URI of the object store repository for this job, registered when
+    # the job is ingested, before the job document is uploaded
     s3_uri = db.Column(db.Unicode(255), default=None)
+    # Time the job document was uploaded, NULL until the upload completes
+    uploaded_at = db.Column(db.TIMESTAMP, nullable=True, default=None)
+    # Idempotency key of the request that created this job, either the
+    # Idempotency-Key header or the digest of the job document
+    idempotency_key = db.Column(
+        db.String(64), default=None, unique=True, index=True
+    )
+    # Version of the job document, incremented when a measurement is
+    # added to the job. Used as the entity tag of the job resources.
+    version = db.Column(
+        db.Integer, nullable=False, default=1, server_default="1"
+    )
+    # Jenkins build and filter of the job, generated columns that are
+    # indexed so that jobs are found without parsing the env and meta of
+    # every row, see `query_by_env_data`
+    ci_id = db.Column(
+        db.String(64), Computed(env["ci_id"].as_string(), persisted=False)
+    )
+    ci_name = db.Column(
+        db.String(64), Computed(env["ci_name"].as_string(), persisted=False)
+    )
+    filter_name = db.Column(
+        db.String(64),
+        Computed(meta["filter_name"].as_string(), persisted=False),
+    )
 
-    # Measurements are deleted upon job deletion
+    __table_args__ = (
+        db.Index("ix_job_ci_id_ci_name", "ci_id", "ci_name"),
+        db.Index("ix_job_ci_name", "ci_name"),
+        db.Index("ix_job_filter_name", "filter_name"),
+    )
+
+    # Keys of the env data with a generated column
+    ENV_COLUMNS = ("ci_id", "ci_name")
+
+    # Measurements are deleted upon job deletion. Measurements, packages
+    # and the measurement blobs are loaded with one batched query each,
+    # joining both collections would multiply their rows.
     measurements = db.relationship(
-        "MeasurementModel", lazy="joined", cascade="all, delete-orphan"
+        "MeasurementModel", lazy="selectin", cascade="all, delete-orphan"
     )
 
     # Packages are deleted upon job deletion
     packages = db.relationship(
-        "PackageModel", lazy="joined", cascade="all, delete-orphan"
+        "PackageModel", lazy="selectin", cascade="all, delete-orphan"
     )
 
     def __init__(self, env_id, env, meta):
@@ -319,37 +479,154 @@ class JobModel(db.Model):
         self.env = env
         self.meta = meta
 
-    def json(self):
-        """Return JSON serialized job."""
-        # Reconstruct the lsst.verify job metadata before returning
-        self.meta["packages"] = [pkg.json() for pkg in self.packages]
-        self.meta["env"] = self.env
+    def json(self, fields=None):
+        """Return JSON serialized job.
 
-        return {
-            "id": self.id,
-            "date_created": self.date_created.strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "ci_dataset": self.ci_dataset,
-            "s3_uri": self.s3_uri,
-            "measurements": [meas.json() for meas in self.measurements],
-            "meta": self.meta,
-        }
+        Parameters
+        ----------
+        fields : `list`, optional
+            Fields of the job document, see `select_fields`. Relationships
+            are not accessed, nor loaded, unless a field requires them. By
+            default all the fields are returned.
+        """
+
+        def include(name):
+            return fields is None or requires_field(fields, name)
+
+        document = {}
+        if include("id"):
+            document["id"] = self.id
+        if include("date_created"):
+            document["date_created"] = self.date_created.strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            )
+        if include("ci_dataset"):
+            document["ci_dataset"] = self.ci_dataset
+        if include("s3_uri"):
+            document["s3_uri"] = self.s3_uri
+        if include("measurements"):
+            document["measurements"] = [
+                meas.json() for meas in self.measurements
+            ]
+        if include("meta"):
+            # Reconstruct the lsst.verify job metadata before returning, on
+            # a copy so that the loaded job is not modified
+            meta = dict(self.meta)
+            if include("meta.packages"):
+                meta["packages"] = [pkg.json() for pkg in self.packages]
+            meta["env"] = self.env
+            document["meta"] = meta
+
+        if fields is None:
+            return document
+
+        return select_fields(document, fields)
 
     @classmethod
-    def find_by_id(cls, job_id):
-        """Find job by id."""
-        return cls.query.filter_by(id=job_id).first()
+    def find_by_id(cls, job_id, fields=None):
+        """Find job by id.
+
+        If ``fields`` is given, only the relationships required by these
+        fields of the job document are loaded, see `json`.
+        """
+        query = cls.query.filter_by(id=job_id)
+
+        if fields is not None:
+            relationships = {
+                "measurements": cls.measurements,
+                "meta.packages": cls.packages,
+            }
+            query = query.options(
+                *[
+                    lazyload(relationship)
+                    for field, relationship in relationships.items()
+                    if not requires_field(fields, field)
+                ]
+            )
+
+        return query.first()
+
+    @staticmethod
+    def make_revision(date_created, version):
+        """Return the revision of a job from its creation date and version.
+
+        The version tells apart the states of a job, the creation date the
+        jobs with the same id, MySQL reuses the id of the last jobs if they
+        are deleted before a restart.
+        """
+        return "{:%Y%m%d%H%M%S}.{}".format(date_created, version)
+
+    @property
+    def revision(self):
+        """Revision of the job, see `make_revision`."""
+        return self.make_revision(self.date_created, self.version)
 
     @classmethod
-    def find_by_env_data(cls, env_id, **kwargs):
-        """Find job by environment ID."""
+    def get_revision(cls, job_id):
+        """Return the revision of a job, without loading it.
+
+        Returns `None` if the job does not exist.
+        """
+        row = (
+            db.session.query(cls.date_created, cls.version)
+            .filter_by(id=job_id)
+            .first()
+        )
+        if row is None:
+            return None
+
+        return cls.make_revision(*row)
+
+    @classmethod
+    def mark_uploaded(cls, job_id):
+        """Record that the document of a job is uploaded to S3."""
+        cls.query.filter_by(id=job_id).update(
+            {cls.uploaded_at: now()}, synchronize_session=False
+        )
+        db.session.commit()
+
+    @classmethod
+    def bump_version(cls, job_id):
+        """Increment the version of a job in the current transaction."""
+        cls.query.filter_by(id=job_id).update(
+            {cls.version: cls.version + 1}, synchronize_session=False
+        )
+
+    @classmethod
+    def find_ids_by_idempotency_keys(cls, keys):
+        """Find the ids of the jobs created with the idempotency keys.
+
+        Returns a `dict` mapping the keys found to their job id.
+        """
+        query = db.session.query(cls.idempotency_key, cls.id).filter(
+            cls.idempotency_key.in_(keys)
+        )
+        return {key: job_id for key, job_id in query}
+
+    @classmethod
+    def query_by_env_data(cls, env_id, **kwargs):
+        """Return the query of the jobs with the environment data.
+
+        The keys with a generated column, see ``ENV_COLUMNS``, are looked
+        up in its index.
+        """
         query = cls.query.filter_by(env_id=env_id)
 
         for key, value in kwargs.items():
-            expression = cls.env[key] == value
+            if key in cls.ENV_COLUMNS:
+                expression = getattr(cls, key) == value
+            else:
+                expression = cls.env[key] == value
             query = query.filter(expression)
+
+        return query
+
+    @classmethod
+    def find_by_env_data(cls, env_id, **kwargs):
+        """Find job by environment ID."""
         # TODO: not very useful if it returns just the first record.
         # Review where this is used.
-        return query.first()
+        return cls.query_by_env_data(env_id, **kwargs).first()
 
     def save_to_db(self):
         """Save job to database."""
@@ -357,7 +634,10 @@ class JobModel(db.Model):
         db.session.commit()
 
     def delete_from_db(self):
-        """Delete job from database."""
+        """Delete job from database, and its points of the metric series."""
+        MetricSeriesModel.query.filter_by(job_id=self.id).delete(
+            synchronize_session=False
+        )
         db.session.delete(self)
         db.session.commit()
 
@@ -382,7 +662,7 @@ class PackageModel(db.Model):
     # EUPS build version
     eups_version = db.Column(db.String(64))
 
-    job_id = db.Column(db.Integer, db.ForeignKey("job.id"))
+    job_id = db.Column(db.Integer, db.ForeignKey("job.id"), index=True)
 
     def __init__(
         self,
@@ -460,12 +740,13 @@ class MeasurementModel(db.Model):
     # An empty string means an unitless quantity.
     unit = db.Column(db.String(16), nullable=False)
 
-    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"))
+    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"), index=True)
 
-    job_id = db.Column(db.Integer, db.ForeignKey("job.id"))
+    job_id = db.Column(db.Integer, db.ForeignKey("job.id"), index=True)
 
+    # Loaded for all the measurements of a query at once
     blobs = db.relationship(
-        "BlobModel", secondary=measurement_blob, lazy="dynamic"
+        "BlobModel", secondary=measurement_blob, lazy="selectin"
     )
 
     def __init__(
@@ -506,8 +787,16 @@ class MeasurementModel(db.Model):
         return cls.query.filter_by(job_id=job_id).all()
 
     def save_to_db(self):
-        """Save measurements to database."""
+        """Save measurements to database.
+
+        A new measurement is appended to the metric series in the same
+        transaction, see `MetricSeriesModel`.
+        """
+        new = self.id is None
         db.session.add(self)
+        if new:
+            db.session.flush()
+            MetricSeriesModel.append(MeasurementModel.id == self.id)
         db.session.commit()
 
     def delete_from_db(self):
@@ -516,6 +805,96 @@ class MeasurementModel(db.Model):
         db.session.commit()
 
 
+class MetricSeriesModel(db.Model):
+    """Denormalized time series of the metrics, read by the monitor.
+
+    A narrow append-only table with a row per measurement, filled when the
+    measurement is inserted, with the job attributes the monitor filters
+    and sends. The monitor is read with an index range scan, without joins
+    or the extraction of values from JSON columns.
+    """
+
+    __tablename__ = "metric_series"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Measurement of the point, unique so that a measurement is appended
+    # once, see migrations/0005_metric_series.sql
+    measurement_id = db.Column(db.Integer, unique=True, index=True)
+
+    metric_id = db.Column(db.Integer, db.ForeignKey("metric.id"))
+    # Full qualified name of the metric, e.g. validate_drp.AM1
+    metric_name = db.Column(db.String(64), nullable=False)
+    # Dataset and filter of the job, from its env and meta
+    ci_dataset = db.Column(db.String(32), default=None)
+    filter_name = db.Column(db.String(64), default=None)
+    # Creation date of the job
+    date_created = db.Column(db.TIMESTAMP, nullable=False)
+    value = db.Column(db.Float)
+
+    job_id = db.Column(db.Integer, db.ForeignKey("job.id"), index=True)
+    # Jenkins build of the job, from its env
+    ci_id = db.Column(db.String(64), default=None)
+    ci_url = db.Column(db.Unicode(255), default=None)
+
+    __table_args__ = (
+        db.Index(
+            "ix_metric_series_dataset_metric_date",
+            "ci_dataset",
+            "metric_id",
+            "date_created",
+        ),
+        db.Index("ix_metric_series_metric_date", "metric_id", "date_created"),
+    )
+
+    @classmethod
+    def append(cls, *criteria):
+        """Append the measurements that match the criteria to the series.
+
+        The rows are inserted with a single ``INSERT ... SELECT`` in the
+        current transaction.
+
+        Parameters
+        ----------
+        *criteria
+            Filters of the measurements, e.g. ``MeasurementModel.job_id ==
+            job_id``.
+        """
+        query = (
+            db.session.query(
+                MeasurementModel.id,
+                MeasurementModel.metric_id,
+                MeasurementModel.metric_name,
+                JobModel.ci_dataset,
+                JobModel.filter_name,
+                JobModel.date_created,
+                MeasurementModel.value,
+                MeasurementModel.job_id,
+                JobModel.ci_id,
+                JobModel.env["ci_url"].as_string(),
+            )
+            .join(JobModel, JobModel.id == MeasurementModel.job_id)
+            .filter(MeasurementModel.metric_id.isnot(None), *criteria)
+        )
+
+        db.session.execute(
+            cls.__table__.insert().from_select(
+                [
+                    "measurement_id",
+                    "metric_id",
+                    "metric_name",
+                    "ci_dataset",
+                    "filter_name",
+                    "date_created",
+                    "value",
+                    "job_id",
+                    "ci_id",
+                    "ci_url",
+                ],
+                query.statement,
+            )
+        )
+
+
 class BlobModel(db.Model):
     """Database model for data blobs.
 
@@ -527,13 +906,18 @@ class BlobModel(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     # Receives a string representation of python UUID object
-    # and store as CHAR(32)
-    identifier = db.Column(db.String(32), nullable=False)
+    # and store as CHAR(32). A blob is stored once and shared by all
+    # the measurements that reference it.
+    identifier = db.Column(
+        db.String(32), nullable=False, unique=True, index=True
+    )
     # Blob name
     name = db.Column(db.String(64), nullable=False)
-    # URI of the object store repository for this job, note that
-    # this field is updated only after the blob object is created
+    # URI of the object store repository for this blob, written when the
+    # blob is inserted, before the blob data is uploaded
     s3_uri = db.Column(db.Unicode(255), default=None)
+    # Time the blob data was uploaded, NULL until the upload completes
+    uploaded_at = db.Column(db.TIMESTAMP, nullable=True, default=None)
 
     def __init__(self, identifier, name):
         self.identifier = identifier
@@ -549,8 +933,47 @@ class BlobModel(db.Model):
 
     @classmethod
     def find_by_identifier(cls, identifier):
-        """Find blobs by an identifier."""
-        return cls.query.filter_by(identifier=identifier).all()
+        """Find blob by its identifier."""
+        return cls.query.filter_by(identifier=identifier).first()
+
+    @classmethod
+    def mark_uploaded(cls, identifier):
+        """Record that the data of a blob is uploaded to S3."""
+        cls.query.filter_by(identifier=identifier).update(
+            {cls.uploaded_at: now()}, synchronize_session=False
+        )
+        db.session.commit()
+
+    @classmethod
+    def find_by_measurement_ids(cls, measurement_ids):
+        """Return the serialized blobs of measurements by measurement id.
+
+        The query runs on its own connection, so that it can be used
+        while the measurements are read from a server-side cursor.
+        """
+        query = (
+            db.select(
+                [
+                    measurement_blob.c.measurement_id,
+                    cls.identifier,
+                    cls.name,
+                    cls.s3_uri,
+                ]
+            )
+            .select_from(measurement_blob.join(cls.__table__))
+            .where(measurement_blob.c.measurement_id.in_(measurement_ids))
+        )
+
+        blobs = {}
+        with db.engine.connect() as connection:
+            for measurement_id, identifier, name, s3_uri in connection.execute(
+                query
+            ):
+                blobs.setdefault(measurement_id, []).append(
+                    {"identifier": identifier, "name": name, "s3_uri": s3_uri}
+                )
+
+        return blobs
 
     def save_to_db(self):
         """Save blob to database."""
@@ -0,0 +1,110 @@
+"""Keyset pagination of the list resources.
+
+List resources return a page of at most ``limit`` items ordered by their
+primary key, starting after the key given by ``after``. The page is read
+with an indexed range scan, ``WHERE id > after ORDER BY id LIMIT limit``,
+so its cost does not depend on the position of the page in the table. The
+response has the URL of the ``next`` page, or `None` for the last page.
+
+A `Page` can be iterated while the response is streamed, see
+`squash.responses.stream_json`.
+"""
+
+__all__ = ["Page", "paginate"]
+
+from flask import current_app as app
+from flask import request, url_for
+from flask_restful import inputs, reqparse
+
+from squash.responses import iter_rows
+
+parser = reqparse.RequestParser()
+parser.add_argument("limit", type=inputs.positive, location="args")
+parser.add_argument("after", type=inputs.natural, location="args")
+
+
+class Page:
+    """A page of a queryset, read as it is iterated.
+
+    Parameters
+    ----------
+    queryset : `sqlalchemy.orm.query.Query`
+        The items to paginate, either model instances or rows with a
+        column named as ``key``.
+    key : `sqlalchemy.Column`
+        The unique column the items are ordered by, e.g. the primary key.
+    stream : `bool`, optional
+        Whether to read the items from a server-side cursor, no other
+        query can run until the page is iterated. Not compatible with the
+        eager loading of collections.
+    """
+
+    def __init__(self, queryset, key, stream=True):
+        args = parser.parse_args()
+
+        self.limit = min(
+            args["limit"] or app.config["DEFAULT_PAGE_SIZE"],
+            app.config["MAX_PAGE_SIZE"],
+        )
+
+        if args["after"] is not None:
+            queryset = queryset.filter(key > args["after"])
+
+        # one more item tells whether there is a next page
+        self.queryset = queryset.order_by(key.asc()).limit(self.limit + 1)
+        self.key = key
+        self.stream = stream
+        self.last = None
+        self.more = False
+
+    def __iter__(self):
+        """Iterate over the items of the page."""
+        rows = iter_rows(self.queryset) if self.stream else self.queryset
+
+        for count, item in enumerate(rows):
+            # the extra item is read, not skipped, to consume the cursor
+            if count == self.limit:
+                self.more = True
+                continue
+
+            self.last = getattr(item, self.key.key)
+            yield item
+
+    def next_url(self):
+        """Return the URL of the next page, `None` if this is the last page.
+
+        Only known once the page is iterated.
+        """
+        if not self.more:
+            return None
+
+        # the path and all the values of the query arguments are kept
+        params = dict(request.view_args or {})
+        params.update(request.args.to_dict(flat=False))
+        params.update(limit=self.limit, after=self.last)
+
+        return url_for(request.endpoint, _external=True, **params)
+
+
+def paginate(queryset, key):
+    """Return a page of a queryset.
+
+    Parameters
+    ----------
+    queryset : `sqlalchemy.orm.query.Query`
+        The items to paginate, either model instances or rows with a
+        column named as ``key``.
+    key : `sqlalchemy.Column`
+        The unique column the items are ordered by, e.g. the primary key.
+
+    Returns
+    -------
+    items : `list`
+        The items of the page.
+    next : `str` or `None`
+        URL of the next page, `None` if this is the last page.
+    """
+    page = Page(queryset, key, stream=False)
+    items = list(page)
+
+    return items, page.next_url()
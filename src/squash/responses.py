@@ -0,0 +1,589 @@
+"""Stream the responses of the collection resources.
+
+Collection resources encode their items as they are read from a server-side
+database cursor (``stream_results``) and send the JSON text in chunks, so
+the memory used by a request does not depend on the number of items.
+
+The body is described by a `dict` whose values are encoded as follows:
+
+- a callable is called when the value is about to be encoded, e.g. the URL
+  of the next page, known only once the items of the page are sent;
+- a `dict` is encoded as a JSON object, its values follow these rules;
+- `RawJSON` text is sent as is;
+- any other iterator or iterable that is not a `list`, `tuple` or `str`
+  is encoded as a JSON array, item by item;
+- everything else is encoded with `json.dumps`.
+
+The collection resources also negotiate the format of the response with the
+``Accept`` header of the request, see `negotiate`. Tables, e.g. the monitor
+columns, and lists of records can be sent as JSON, newline-delimited JSON
+(NDJSON), MessagePack or Apache Arrow IPC streams, so numeric series are
+loaded by the clients without parsing text. The other resources can be sent
+as JSON or MessagePack, see `output_json` and `output_msgpack`.
+
+The job resources are sent with an entity tag derived from the revision of
+the job, see `get_job_etag`, and a request with a matching
+``If-None-Match`` header gets a 304 response without loading the job.
+"""
+
+__all__ = [
+    "ARROW",
+    "DOCUMENT_FORMATS",
+    "JSON",
+    "MSGPACK",
+    "NDJSON",
+    "RawJSON",
+    "iter_chunks",
+    "get_job_etag",
+    "is_not_modified",
+    "iter_columns",
+    "iter_rows",
+    "negotiate",
+    "not_modified",
+    "output_json",
+    "output_msgpack",
+    "spool_columns",
+    "stream_json",
+    "stream_records",
+    "stream_table",
+]
+
+import hashlib
+import io
+import json
+import tempfile
+from datetime import datetime
+from itertools import islice
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+from flask import Response, make_response, request, stream_with_context
+from flask_restful.representations.json import output_json as _output_json
+
+# Media types of the response formats
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Formats of the tables and lists of records, JSON is the default
+COLLECTION_FORMATS = [JSON, NDJSON, MSGPACK, ARROW]
+
+# Formats of the other resources, see `output_json` and `output_msgpack`
+DOCUMENT_FORMATS = [JSON, MSGPACK]
+
+# Media types accepted for a format, besides its own
+ALIASES = {"application/x-msgpack": MSGPACK}
+
+# Number of rows fetched from the database cursor at a time
+CHUNK_SIZE = 1000
+
+# Number of characters sent to the client at a time
+BUFFER_SIZE = 64 * 1024
+
+
+class RawJSON:
+    """JSON text that is sent as is.
+
+    Parameters
+    ----------
+    chunks : iterable of `str`
+        The JSON text.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+
+def _default(value):
+    """Encode the values that are not JSON serializable, e.g. dates."""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    raise TypeError(
+        "Object of type {} is not serializable".format(type(value).__name__)
+    )
+
+
+def negotiate(formats=COLLECTION_FORMATS):
+    """Return the response format preferred by the client.
+
+    Parameters
+    ----------
+    formats : `list`, optional
+        Media types of the formats available, the first one is used when
+        the request has no ``Accept`` header or none of the formats is
+        acceptable.
+
+    Returns
+    -------
+    mimetype : `str`
+        Media type of the format.
+    """
+    offered = list(formats) + [
+        alias for alias, mimetype in ALIASES.items() if mimetype in formats
+    ]
+    mimetype = request.accept_mimetypes.best_match(offered, default=formats[0])
+
+    return ALIASES.get(mimetype, mimetype)
+
+
+def get_job_etag(job_id, revision, mimetype, fields=None):
+    """Return the entity tag of a job resource.
+
+    A job changes only when a measurement is added to it, which increments
+    its version, so the tag is derived from the job id and revision, its
+    creation date and version, the format of the response and the fields
+    selected.
+
+    Parameters
+    ----------
+    job_id : `int`
+        ID of the job.
+    revision : `str`
+        Revision of the job, see `squash.models.JobModel.get_revision`.
+    mimetype : `str`
+        Media type of the response, see `negotiate`.
+    fields : `list`, optional
+        Fields of the job document, if not all of them are sent.
+
+    Returns
+    -------
+    etag : `str`
+        The unquoted entity tag.
+    """
+    etag = "job-{}-{}-{}".format(job_id, revision, mimetype.split("/")[-1])
+
+    if fields is not None:
+        digest = hashlib.sha1(",".join(fields).encode("utf-8")).hexdigest()
+        etag += "-" + digest[:12]
+
+    return etag
+
+
+def is_not_modified(etag):
+    """Whether the ``If-None-Match`` header matches an entity tag."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    """Return a 304 Not Modified response with an entity tag."""
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.vary.add("Accept")
+
+    return response
+
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Iterate over the results of a query read from a server-side cursor.
+
+    No other query can run on the session connection until the rows are
+    consumed.
+
+    Parameters
+    ----------
+    queryset : `sqlalchemy.orm.query.Query`
+        The query.
+    chunk_size : `int`, optional
+        Number of rows fetched at a time.
+    """
+    return queryset.execution_options(stream_results=True).yield_per(
+        chunk_size
+    )
+
+
+def iter_columns(queryset, chunk_size=CHUNK_SIZE):
+    """Iterate over the results of a query, a chunk of columns at a time.
+
+    The rows are read from a server-side cursor ``chunk_size`` at a time,
+    without building a result object per row, and transposed into a
+    sequence of values per column, see `stream_table`.
+
+    Parameters
+    ----------
+    queryset : `sqlalchemy.orm.query.Query`
+        The query, of columns rather than model instances.
+    chunk_size : `int`, optional
+        Number of rows fetched at a time.
+    """
+    result = queryset.session.execute(
+        queryset.statement.execution_options(stream_results=True)
+    )
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield tuple(zip(*rows))
+    finally:
+        result.close()
+
+
+def iter_chunks(iterable, size=CHUNK_SIZE):
+    """Group the items of an iterable in lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _as_arrays(columns, schema):
+    """Convert the numeric and timestamp columns of a chunk to NumPy arrays.
+
+    The other columns are kept as sequences of values.
+    """
+    arrays = []
+    for values, field in zip(columns, schema):
+        if pa.types.is_timestamp(field.type):
+            values = np.array(
+                values, dtype="datetime64[{}]".format(field.type.unit)
+            )
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(
+            field.type
+        ):
+            values = np.array(values, dtype=field.type.to_pandas_dtype())
+        arrays.append(values)
+
+    return arrays
+
+
+def _as_list(values):
+    """Return the values of a column chunk as a `list`.
+
+    The list can be encoded as JSON or MessagePack, timestamps are formatted
+    as ISO 8601 strings for the whole chunk at once. The NULL values of a
+    numeric column, NaN in its array, are sent as `None`, NaN is not valid
+    JSON.
+    """
+    if isinstance(values, np.ndarray):
+        if np.issubdtype(values.dtype, np.datetime64):
+            values = np.char.add(np.datetime_as_string(values, unit="s"), "Z")
+        elif np.issubdtype(values.dtype, np.floating):
+            nulls = np.isnan(values)
+            if nulls.any():
+                values = values.astype(object)
+                values[nulls] = None
+        return values.tolist()
+
+    return list(values)
+
+
+def spool_columns(chunks, names):
+    """Write the columns of a table to temporary files.
+
+    Parameters
+    ----------
+    chunks : iterable
+        The chunks of the table, with a sequence or NumPy array of values
+        per column, see `iter_columns`.
+    names : `list`
+        The names of the columns.
+
+    Returns
+    -------
+    columns : `dict`
+        `RawJSON` array of each column, keyed by column name.
+    """
+    spools = [tempfile.TemporaryFile("w+") for _ in names]
+
+    for count, columns in enumerate(chunks):
+        separator = "," if count else ""
+        for spool, values in zip(spools, columns):
+            # the values of a chunk are encoded at once, without brackets
+            text = json.dumps(_as_list(values), default=_default)
+            spool.write(separator + text[1:-1])
+
+    return {
+        name: RawJSON(_read_spool(spool, "[", "]"))
+        for name, spool in zip(names, spools)
+    }
+
+
+def _read_spool(spool, prefix, suffix):
+    """Read a spooled column between a prefix and a suffix and close it."""
+    spool.seek(0)
+    try:
+        yield prefix
+        while True:
+            chunk = spool.read(BUFFER_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield suffix
+    finally:
+        spool.close()
+
+
+def _encode(value):
+    """Encode a value as JSON text chunks."""
+    if callable(value):
+        value = value()
+
+    if isinstance(value, dict):
+        yield "{"
+        for count, (key, item) in enumerate(value.items()):
+            yield "{}{}:".format("," if count else "", json.dumps(key))
+            yield from _encode(item)
+        yield "}"
+    elif isinstance(value, RawJSON):
+        yield from value.chunks
+    elif hasattr(value, "__iter__") and not isinstance(
+        value, (list, tuple, str)
+    ):
+        yield "["
+        for count, item in enumerate(value):
+            yield "{}{}".format(
+                "," if count else "", json.dumps(item, default=_default)
+            )
+        yield "]"
+    else:
+        yield json.dumps(value, default=_default)
+
+
+def _encode_ndjson(records):
+    """Encode records as JSON text lines."""
+    for record in records:
+        yield json.dumps(record, default=_default) + "\n"
+
+
+def _encode_ndjson_rows(chunks, names):
+    """Encode the rows of a table as JSON text lines."""
+    for columns in chunks:
+        rows = zip(*[_as_list(values) for values in columns])
+        yield from _encode_ndjson(dict(zip(names, row)) for row in rows)
+
+
+def _encode_msgpack_columns(chunks, names):
+    """Encode the columns of a table as a MessagePack map.
+
+    The length of the arrays is known once the rows are read, so the
+    columns are spooled to temporary files as `spool_columns` does.
+    """
+    packer = msgpack.Packer(default=_default)
+    spools = [tempfile.TemporaryFile() for _ in names]
+
+    count = 0
+    for columns in chunks:
+        for spool, values in zip(spools, columns):
+            values = _as_list(values)
+            # the values of a chunk are packed at once, without array header
+            header = packer.pack_array_header(len(values))
+            spool.write(packer.pack(values)[len(header) :])
+        count += len(values)
+
+    yield packer.pack_map_header(len(names))
+    for name, spool in zip(names, spools):
+        prefix = packer.pack(name) + packer.pack_array_header(count)
+        yield from _read_spool(spool, prefix, b"")
+
+
+def _encode_arrow(chunks, schema):
+    """Encode a table as an Arrow IPC stream, a record batch per chunk."""
+    sink = io.BytesIO()
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for columns in chunks:
+            writer.write_batch(
+                pa.RecordBatch.from_arrays(
+                    [
+                        # NULL values are NaN, see `_as_list`
+                        pa.array(values, type=field.type, from_pandas=True)
+                        for values, field in zip(columns, schema)
+                    ],
+                    schema=schema,
+                )
+            )
+            yield drain()
+
+    # end of stream marker
+    yield drain()
+
+
+def _buffer(chunks, empty=""):
+    """Join small chunks into chunks of about ``BUFFER_SIZE``."""
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= BUFFER_SIZE:
+            yield empty.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield empty.join(buffer)
+
+
+def _stream(chunks, mimetype, status=200, headers=None):
+    """Return a streamed response of the given format."""
+    empty = "" if mimetype in (JSON, NDJSON) else b""
+    response = Response(
+        stream_with_context(_buffer(chunks, empty)),
+        status=status,
+        headers=headers,
+        mimetype=mimetype,
+    )
+    response.vary.add("Accept")
+
+    return response
+
+
+def stream_json(body, status=200):
+    """Return a response that encodes the body as it is sent.
+
+    Parameters
+    ----------
+    body : `dict`
+        The response body, see the module documentation.
+    status : `int`, optional
+        The HTTP status code.
+
+    Returns
+    -------
+    response : `flask.Response`
+        A streamed ``application/json`` response. The request context,
+        and the database session, remain available until it is sent.
+    """
+    return _stream(_encode(body), JSON, status)
+
+
+def stream_table(chunks, schema):
+    """Return a response with the columns of a table.
+
+    The response is in the format preferred by the client. A JSON or
+    MessagePack response is an object with an array per column, a NDJSON
+    response has an object per row and an Arrow response a record batch
+    per chunk of rows. The numeric and timestamp columns of a chunk are
+    converted to NumPy arrays, and encoded, at once.
+
+    Parameters
+    ----------
+    chunks : iterable
+        The chunks of the table, with a sequence of values per column, read
+        as the response is sent, see `iter_columns`.
+    schema : `pyarrow.Schema`
+        The names and types of the columns.
+
+    Returns
+    -------
+    response : `flask.Response`
+        A streamed response.
+    """
+    mimetype = negotiate()
+    chunks = (_as_arrays(columns, schema) for columns in chunks)
+
+    if mimetype == NDJSON:
+        encoded = _encode_ndjson_rows(chunks, schema.names)
+    elif mimetype == MSGPACK:
+        encoded = _encode_msgpack_columns(chunks, schema.names)
+    elif mimetype == ARROW:
+        encoded = _encode_arrow(chunks, schema)
+    else:
+        encoded = _encode(lambda: spool_columns(chunks, schema.names))
+
+    return _stream(encoded, mimetype)
+
+
+def stream_records(name, records, schema, next_url=None):
+    """Return a response with a list of records.
+
+    The response is in the format preferred by the client. A JSON response
+    is an object with the records in the ``name`` array and the URL of the
+    ``next`` page, if the list is paginated. A NDJSON response has a record
+    per line, an Arrow response a row per record, and a MessagePack
+    response is encoded as the JSON one. The page is read before a NDJSON,
+    Arrow or MessagePack response is sent, the URL of the next page is sent
+    in its ``Link`` header.
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the list in a JSON response.
+    records : iterable
+        The records, `dict` with a key per field of the schema, or values
+        for a schema with a single field.
+    schema : `pyarrow.Schema`
+        The names and types of the fields of the records.
+    next_url : callable, optional
+        Returns the URL of the next page once the records are read, e.g.
+        `squash.pagination.Page.next_url`.
+
+    Returns
+    -------
+    response : `flask.Response`
+        A streamed response.
+    """
+    mimetype = negotiate()
+
+    if mimetype == JSON:
+        body = {name: records}
+        if next_url:
+            body["next"] = next_url
+
+        return stream_json(body)
+
+    records = list(records)
+
+    headers = {}
+    url = next_url() if next_url else None
+    if url:
+        headers["Link"] = '<{}>; rel="next"'.format(url)
+
+    if mimetype == NDJSON:
+        chunks = _encode_ndjson(records)
+    elif mimetype == MSGPACK:
+        body = {name: records}
+        if next_url:
+            body["next"] = url
+        chunks = [msgpack.packb(body, default=_default)]
+    else:
+        if len(schema) == 1 and records and not isinstance(records[0], dict):
+            rows = [(record,) for record in records]
+        else:
+            rows = [
+                tuple(record[field] for field in schema.names)
+                for record in records
+            ]
+        chunks = _encode_arrow(
+            (tuple(zip(*chunk)) for chunk in iter_chunks(rows)), schema
+        )
+
+    return _stream(chunks, mimetype, headers=headers)
+
+
+def output_json(data, code, headers=None):
+    """Encode the response of a resource as JSON.
+
+    This is the representation of the `flask_restful.Api` for
+    ``application/json``.
+    """
+    response = _output_json(data, code, headers)
+    response.vary.add("Accept")
+
+    return response
+
+
+def output_msgpack(data, code, headers=None):
+    """Encode the response of a resource as MessagePack.
+
+    This is the representation of the `flask_restful.Api` for
+    ``application/msgpack``.
+    """
+    response = make_response(msgpack.packb(data, default=_default), code)
+    response.headers.extend(headers or {})
+    response.mimetype = MSGPACK
+    response.vary.add("Accept")
+
+    return response
@@ -0,0 +1,308 @@
+"""Parse verification job documents incrementally.
+
+Job documents can be as large as ~1 GB, most of it in the data blobs. The
+streaming parser keeps in memory only the relational parts of the document
+(``meta`` and ``measurements``) while ``blobs[*].data`` are written to spool
+files as they are parsed, so memory stays bounded regardless of the size of
+the blobs. The raw request body is spooled as well, to be uploaded as the
+job document without serializing it again.
+
+Like `json.loads`, the parser accepts the ``NaN``, ``Infinity`` and
+``-Infinity`` tokens written by `json.dumps` for non-finite floats, e.g. in
+the measurements of lsst.verify jobs.
+
+Bulk ingestion requests are newline-delimited JSON, one job document per
+line, read line by line with `iter_lines`.
+"""
+
+__all__ = ["iter_lines", "parse_job"]
+
+import json
+import re
+import tempfile
+
+import ijson
+
+from squash.error import ApiError
+
+# Non-finite numbers are quoted before the document is parsed, these strings
+# are mapped back to floats by `_parse`
+NON_FINITE = {
+    "\x00NaN": float("nan"),
+    "\x00Infinity": float("inf"),
+    "\x00-Infinity": float("-inf"),
+}
+
+# Escape sequences, quotes and non-finite number tokens
+_TOKENS = re.compile(rb'\\.|"|-?Infinity|NaN')
+
+# Length of the longest token, a token that may continue in the next chunk
+# is kept for the next read
+_MAX_TOKEN = len(b"-Infinity")
+
+
+class _TeeReader:
+    """File-like object that copies everything read from a stream."""
+
+    def __init__(self, stream, spool):
+        self.stream = stream
+        self.spool = spool
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.spool.write(chunk)
+        return chunk
+
+
+class _NonFiniteReader:
+    """File-like object that quotes the non-finite numbers of a stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = b""
+        self.in_string = False
+
+    def _quote(self, data, end):
+        """Quote the non-finite numbers of ``data`` up to ``end``.
+
+        The text is returned up to ``end``, or to the end of the last token
+        started before, the rest is kept for the next read.
+        """
+        pieces = []
+        start = 0
+        for match in _TOKENS.finditer(data):
+            if match.start() >= end:
+                break
+
+            token = match.group()
+            if token == b'"':
+                self.in_string = not self.in_string
+            elif not self.in_string and not token.startswith(b"\\"):
+                pieces.append(data[start : match.start()])
+                pieces.append(b'"\\u0000' + token + b'"')
+                start = match.end()
+            end = max(end, match.end())
+
+        pieces.append(data[start:end])
+        self.pending = data[end:]
+        return b"".join(pieces)
+
+    def read(self, size=-1):
+        if size == 0:
+            # e.g. ijson checks the type of the stream
+            return b""
+
+        while True:
+            chunk = self.stream.read(size)
+            data = self.pending + chunk
+            if not chunk:
+                return self._quote(data, len(data))
+
+            text = self._quote(data, max(len(data) - _MAX_TOKEN, 0))
+            if text:
+                return text
+
+
+class _JSONWriter:
+    """Write ijson events back to a file as JSON text."""
+
+    def __init__(self, f):
+        self.f = f
+        # whether the current container has no items yet
+        self.first = []
+        self.after_key = False
+
+    def _write(self, text):
+        self.f.write(text.encode("utf-8"))
+
+    def _separator(self):
+        if self.first:
+            if self.first[-1]:
+                self.first[-1] = False
+            else:
+                self._write(",")
+
+    def event(self, event, value):
+        if event == "map_key":
+            self._separator()
+            self._write(json.dumps(value) + ":")
+            self.after_key = True
+            return
+
+        if event in ("end_map", "end_array"):
+            self.first.pop()
+            self._write("}" if event == "end_map" else "]")
+            return
+
+        if self.after_key:
+            self.after_key = False
+        else:
+            self._separator()
+
+        if event == "start_map":
+            self._write("{")
+            self.first.append(True)
+        elif event == "start_array":
+            self._write("[")
+            self.first.append(True)
+        else:
+            self._write(json.dumps(value))
+
+
+def _parse(stream):
+    """Iterate over the ijson events of a stream, with non-finite numbers."""
+    events = ijson.parse(_NonFiniteReader(stream), use_float=True)
+    for prefix, event, value in events:
+        if event == "string" and value in NON_FINITE:
+            event, value = "number", NON_FINITE[value]
+        yield prefix, event, value
+
+
+def _consume(event, value, events, sink):
+    """Pass the events of the value started by ``event`` to ``sink``."""
+    sink(event, value)
+
+    if event in ("start_map", "start_array"):
+        depth = 1
+        while depth:
+            _, event, value = next(events)
+            sink(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+
+
+def _build(event, value, events):
+    """Build the Python object of the value started by ``event``."""
+    builder = ijson.ObjectBuilder()
+    _consume(event, value, events, builder.event)
+    return builder.value
+
+
+def _read_blobs(events):
+    """Read the blobs array, spooling the data of each blob."""
+    blobs = []
+
+    for _, event, value in events:
+        if event == "end_array":
+            return blobs
+
+        if event != "start_map":
+            _consume(event, value, events, lambda *args: None)
+            continue
+
+        blob = {}
+        for _, event, key in events:
+            if event == "end_map":
+                break
+
+            _, event, value = next(events)
+            if key == "data":
+                spool = tempfile.TemporaryFile()
+                _consume(event, value, events, _JSONWriter(spool).event)
+                spool.seek(0)
+                blob["data"] = spool
+            else:
+                blob[key] = _build(event, value, events)
+
+        blobs.append(blob)
+
+
+def parse_job(stream):
+    """Parse a job document from a stream.
+
+    Parameters
+    ----------
+    stream : file-like object
+        The request body.
+
+    Returns
+    -------
+    data : `dict`
+        The ``measurements``, ``meta`` and ``blobs`` of the job, where the
+        ``data`` of each blob is a spool file with its JSON serialization.
+    raw : file-like object
+        Spool file with the request body.
+
+    Raises
+    ------
+    ApiError
+        If the request body is not a valid job document.
+    """
+    raw = tempfile.TemporaryFile()
+    tee = _TeeReader(stream, raw)
+    events = _parse(tee)
+
+    data = {"measurements": [], "meta": {}, "blobs": []}
+
+    try:
+        _, event, _ = next(events)
+        if event != "start_map":
+            raise ApiError("Invalid job document.", 400)
+
+        for _, event, key in events:
+            if event == "end_map":
+                break
+
+            _, event, value = next(events)
+            if key == "blobs" and event == "start_array":
+                data["blobs"] = _read_blobs(events)
+            elif key in ("measurements", "meta"):
+                data[key] = _build(event, value, events)
+            else:
+                # e.g. metrics and specs are not ingested
+                _consume(event, value, events, lambda *args: None)
+    except (ijson.JSONError, StopIteration):
+        raise ApiError("Invalid job document.", 400)
+
+    if not isinstance(data["meta"], dict) or not isinstance(
+        data["measurements"], list
+    ):
+        raise ApiError("Invalid job document.", 400)
+
+    # the parser stops at the end of the document, the rest of the body,
+    # e.g. a final newline, is spooled as well
+    for chunk in iter(lambda: tee.read(64 * 1024), b""):
+        if chunk.strip():
+            raise ApiError("Invalid job document.", 400)
+
+    raw.seek(0)
+
+    return data, raw
+
+
+def iter_lines(stream, chunk_size=64 * 1024):
+    """Iterate over the lines of a stream, reading it in chunks.
+
+    The request stream may be a decompressing reader without ``readline``.
+
+    Parameters
+    ----------
+    stream : file-like object
+        The request body.
+    chunk_size : `int`, optional
+        Number of bytes read at a time.
+
+    Yields
+    ------
+    line : `bytes`
+        A line without the line terminator.
+    """
+    # chunks of the current line, joined once the line is complete, so that
+    # a long line is not copied at every chunk
+    pending = []
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        if b"\n" not in chunk:
+            pending.append(chunk)
+            continue
+
+        lines = chunk.split(b"\n")
+        pending.append(lines[0])
+        yield b"".join(pending)
+        yield from lines[1:-1]
+        pending = [lines[-1]]
+
+    last = b"".join(pending)
+    if last:
+        yield last
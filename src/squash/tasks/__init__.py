@@ -1,3 +1,5 @@
 """Implement SQuaSH API tasks with Celery."""
 from .influxdb import *  # noqa F403
+from .ingestion import *  # noqa F403
+from .pipeline import *  # noqa F403
 from .s3 import *  # noqa F403
@@ -0,0 +1,133 @@
+"""Implement Celery task to ingest staged SQuaSH jobs.
+
+In the asynchronous ingestion mode of POST /job the raw job document is
+written to a staging area in the S3 bucket and the relational inserts are
+done by the `ingest_job` task. The task goes through the following states,
+reported by the /status resource:
+
+STAGING
+    The job document is staged and the task is waiting for a worker.
+INSERTING
+    A worker is inserting the job into the database.
+SUCCESS
+    The job was inserted, the result has the ``job_id`` and the
+    ``pipeline_id`` of the blob uploads, document upload and InfluxDB
+    export.
+FAILURE
+    The job could not be inserted, the staged document is kept.
+"""
+
+__all__ = ["get_staging_key", "ingest_job"]
+
+import json
+import logging
+import os
+
+from squash.error import ApiError
+
+from .celery import celery
+from .pipeline import JobPipeline
+from .s3 import copy_object, delete_object, download_object, get_s3_uri
+
+logger = logging.getLogger("squash")
+
+_app = None
+
+
+def get_staging_key(task_id):
+    """Return the S3 key of a job document staged for ingestion.
+
+    Parameters
+    ----------
+    task_id : `str`
+        ID of the `ingest_job` task.
+
+    Returns
+    -------
+    key : `str`
+        The S3 key of the staged job document.
+    """
+    return "staging/{}".format(task_id)
+
+
+def get_app():
+    """Return the Flask app used to access the database from the worker."""
+    global _app
+
+    if _app is None:
+        # squash.app imports the API resources, which import the tasks
+        from squash.app import create_app
+
+        profile = os.environ.get(
+            "SQUASH_API_PROFILE", "squash.config.Development"
+        )
+        _app = create_app(profile)
+
+    return _app
+
+
+def archive_staged_document(key, job_id):
+    """Move the staged job document to the key of the job."""
+    copy_object(key, str(job_id))
+    delete_object(key)
+
+
+@celery.task(bind=True)
+def ingest_job(self, key, idempotency_key=None):
+    """Insert a staged job document into the SQuaSH database.
+
+    Parameters
+    ----------
+    key : `str`
+        The S3 key of the staged job document.
+    idempotency_key : `str`, optional
+        The Idempotency-Key of the request, by default the digest of the
+        job document.
+
+    Returns
+    -------
+    result : `dict`
+        The ``job_id`` of the job created and the ``pipeline_id`` of its
+        post-ingestion pipeline, or the ``job_id`` of the existing job with
+        the same idempotency key.
+    """
+    from squash.ingestion import JobIngestion, get_job_data, get_job_digest
+    from squash.models import JobModel
+
+    self.update_state(state="INSERTING")
+
+    body = download_object(get_s3_uri(key))
+    if body is None:
+        raise ApiError("Staged job document `{}` not found.".format(key), 404)
+
+    try:
+        data = get_job_data(json.loads(body))
+    except ValueError:
+        raise ApiError("Invalid job document.", 400)
+
+    if idempotency_key is None:
+        idempotency_key = get_job_digest(data)
+
+    with get_app().app_context():
+        existing = JobModel.find_ids_by_idempotency_keys([idempotency_key])
+        job_id = existing.get(idempotency_key)
+        if job_id:
+            delete_object(key)
+            logger.info(f"Job {job_id} already exists.")
+            return {"job_id": job_id}
+
+        ingestion = JobIngestion(data, idempotency_key)
+        job_id = ingestion.run()
+        pipeline = JobPipeline(job_id)
+        ingestion.upload_blobs_to_s3([pipeline])
+
+        # the staged document becomes the job document
+        pipeline.run("document", archive_staged_document, key, job_id)
+
+    pipeline.add("influxdb", job_id)
+    pipeline_id = pipeline.start()
+
+    message = f"Job {job_id} successfully ingested."
+    logger.info(message)
+
+    return {"job_id": job_id, "pipeline_id": pipeline_id}
@@ -0,0 +1,263 @@
+"""Implement the post-ingestion pipeline of a SQuaSH job.
+
+Once a job is inserted in the database its data blobs and the job document
+are uploaded to S3 and the job is exported to InfluxDB. Each of these
+stages is a `run_stage` task; the tasks of a job are sent as a single Celery
+group, so the blob uploads run in parallel across the workers, and the group
+result is saved in the result backend under the pipeline id.
+
+Stages that must run in the process that ingested the job, e.g. the upload
+of a document spooled to a local file, are run by `JobPipeline.run` before
+the response is sent, so that they are not lost if the process exits. Their
+result is stored in the backend as well, so `get_pipeline_status` reports
+every stage of the job with its state and timings.
+
+Once an object is uploaded its stage sets the ``uploaded_at`` time of the
+blob, or of the job for the job document, so that an object whose upload
+is pending or failed is told apart from a missing one.
+
+The id of a stage task is ``<pipeline id>:<stage>``, where the stage is
+``blob:<identifier>``, ``document`` or ``influxdb``.
+"""
+
+__all__ = ["JobPipeline", "get_pipeline_status", "run_stage"]
+
+import logging
+import time
+import uuid
+from datetime import datetime
+
+from celery import group
+from celery.result import AsyncResult, GroupResult
+
+from squash.models import BlobModel, JobModel
+
+from .celery import celery
+from .influxdb import job_to_influxdb
+from .s3 import put_object
+
+logger = logging.getLogger("squash")
+
+
+def export_to_influxdb(job_id):
+    """Export the job to InfluxDB."""
+    message, status_code = job_to_influxdb.run(job_id)
+    if status_code not in (200, 204):
+        raise RuntimeError(message)
+
+    return message
+
+
+# Functions run by each kind of stage
+STAGE_FUNCTIONS = {
+    "blob": put_object,
+    "document": put_object,
+    "influxdb": export_to_influxdb,
+}
+
+
+def mark_uploaded(stage, job_id):
+    """Record the upload of the object of a stage in the database.
+
+    Requires an app context.
+
+    Parameters
+    ----------
+    stage : `str`
+        Name of the stage, only the ``blob:<identifier>`` and ``document``
+        stages upload an object.
+    job_id : `int`
+        ID of the job.
+    """
+    kind, _, identifier = stage.partition(":")
+    if kind == "blob":
+        BlobModel.mark_uploaded(identifier)
+    elif kind == "document":
+        JobModel.mark_uploaded(job_id)
+
+
+def _timestamp(seconds):
+    """Format a UNIX time as an ISO 8601 UTC timestamp."""
+    return datetime.utcfromtimestamp(seconds).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _timings(started_at):
+    """Return the start, end and duration of a stage started at a time."""
+    finished_at = time.time()
+    return {
+        "started_at": _timestamp(started_at),
+        "finished_at": _timestamp(finished_at),
+        "duration": round(finished_at - started_at, 3),
+    }
+
+
+@celery.task(bind=True)
+def run_stage(self, stage, *args):
+    """Run a stage of the post-ingestion pipeline of a job.
+
+    Parameters
+    ----------
+    stage : `str`
+        Name of the stage, e.g. ``blob:<identifier>``.
+    *args
+        Arguments of the stage function.
+
+    Returns
+    -------
+    result : `dict`
+        The start and end time of the stage and its duration in seconds.
+    """
+    started_at = time.time()
+    self.update_state(
+        state="STARTED", meta={"started_at": _timestamp(started_at)}
+    )
+
+    kind = stage.split(":")[0]
+    STAGE_FUNCTIONS[kind](*args)
+
+    if kind in ("blob", "document"):
+        # squash.app imports the API resources, which import the tasks
+        from .ingestion import get_app
+
+        # the S3 key of a job document is the job id
+        with get_app().app_context():
+            mark_uploaded(stage, args[0])
+
+    return _timings(started_at)
+
+
+class JobPipeline:
+    """Collect the post-ingestion stages of a job and start them.
+
+    Parameters
+    ----------
+    job_id : `int`
+        ID of the job.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.id = str(uuid.uuid4())
+        self.stages = set()
+        self.signatures = []
+        self.results = []
+
+    def get_task_id(self, stage):
+        """Return the id of the task of a stage."""
+        return "{}:{}".format(self.id, stage)
+
+    def add(self, stage, *args):
+        """Add a stage to be run by a worker.
+
+        Parameters
+        ----------
+        stage : `str`
+            Name of the stage, a stage is added only once.
+        *args
+            Arguments of the stage function, sent in the task message.
+        """
+        if stage in self.stages:
+            return
+
+        self.stages.add(stage)
+        self.signatures.append(
+            run_stage.si(stage, *args).set(task_id=self.get_task_id(stage))
+        )
+
+    def _run(self, stage, started_at, func, args, kwargs):
+        """Run a stage function and store the result of its task."""
+        task_id = self.get_task_id(stage)
+
+        try:
+            func(*args, **kwargs)
+            mark_uploaded(stage, self.job_id)
+        except Exception as exc:
+            logger.error(
+                "Stage `{}` of job `{}` failed: {}".format(
+                    stage, self.job_id, exc
+                )
+            )
+            run_stage.backend.mark_as_failure(task_id, exc)
+        else:
+            run_stage.backend.store_result(
+                task_id, _timings(started_at), "SUCCESS"
+            )
+
+    def run(self, stage, func, *args, **kwargs):
+        """Run a stage in this process and store its result.
+
+        Errors are logged and reported in the stage status, the job is
+        already ingested at this point. Requires an app context, see
+        `mark_uploaded`.
+
+        Parameters
+        ----------
+        stage : `str`
+            Name of the stage.
+        func : callable
+            Function run with ``args`` and ``kwargs``.
+        """
+        if stage in self.stages:
+            return
+
+        self.stages.add(stage)
+        self._run(stage, time.time(), func, args, kwargs)
+        self.results.append(AsyncResult(self.get_task_id(stage), app=celery))
+
+    def start(self):
+        """Send the stage tasks as a group and save the pipeline result.
+
+        Returns
+        -------
+        pipeline_id : `str`
+            ID of the pipeline, see `get_pipeline_status`.
+        """
+        results = list(self.results)
+        if self.signatures:
+            results.extend(group(self.signatures).apply_async().results)
+
+        GroupResult(self.id, results, app=celery).save()
+
+        return self.id
+
+
+def get_pipeline_status(pipeline_id):
+    """Return the combined status of the stages of a pipeline.
+
+    Parameters
+    ----------
+    pipeline_id : `str`
+        ID of the pipeline.
+
+    Returns
+    -------
+    status : `dict` or `None`
+        The overall ``status`` of the pipeline and the ``stages`` with
+        their state and timings, `None` if the pipeline is not found.
+    """
+    pipeline = GroupResult.restore(pipeline_id, app=celery)
+    if pipeline is None:
+        return None
+
+    stages = []
+    for result in pipeline.results:
+        stage = {"stage": result.id.split(":", 1)[1], "status": result.state}
+
+        if result.state == "FAILURE":
+            stage["message"] = str(result.info)
+        elif isinstance(result.info, dict):
+            stage.update(result.info)
+
+        stages.append(stage)
+
+    states = set(stage["status"] for stage in stages)
+    if "FAILURE" in states:
+        status = "FAILURE"
+    elif states <= {"SUCCESS"}:
+        status = "SUCCESS"
+    elif states == {"PENDING"}:
+        status = "PENDING"
+    else:
+        status = "STARTED"
+
+    return {"status": status, "stages": stages}
@@ -34,7 +34,7 @@ def download_object(s3_uri):
 
     Example of S3 URI: s3://squash.data/88c3f896fe2948788d56bdadfc468812
     """
-    _, _, bucket, key = s3_uri.split("/")
+    _, _, bucket, key = s3_uri.split("/", 3)
 
     s3 = boto3.resource("s3")
 
@@ -86,6 +86,35 @@ def upload_object(
         The secret key for your AWS account.
 
     """
+    self.update_state(state="STARTED")
+
+    return put_object(key, body, metadata, acl, content_type)
+
+
+def put_object(
+    key,
+    body,
+    metadata=None,
+    acl=None,
+    content_type="application/json",
+    content_encoding=None,
+):
+    """Write an arbitrary object to the S3 bucket synchronously.
+
+    See `upload_object` for the parameters.
+
+    Parameters
+    ----------
+    content_encoding : `str`, optional
+        The object's content encoding, e.g. 'gzip' if the body is
+        compressed. Default is `None`.
+
+    Returns
+    -------
+    S3 URI of the uploaded object: `str`
+        The location of the S3 object uploaded in the form:
+        s3://<S3_BUCKET>/<key>
+    """
     s3 = boto3.resource("s3")
 
     object = s3.Object(S3_BUCKET, key)
@@ -98,9 +127,102 @@ def upload_object(
         args["ACL"] = acl
     if content_type is not None:
         args["ContentType"] = content_type
+    if content_encoding is not None:
+        args["ContentEncoding"] = content_encoding
 
-    self.update_state(state="STARTED")
     object.put(Body=body, **args)
 
     s3_uri = get_s3_uri(key)
     return s3_uri
+
+
+def put_fileobj(key, fileobj, metadata=None, content_type="application/json"):
+    """Stream a file-like object to the S3 bucket.
+
+    The object is uploaded with a managed transfer, in multiple parts if it
+    is large, without reading the whole file in memory.
+
+    Parameters
+    ----------
+    key : `str`
+        The Object's key identifier.
+    fileobj : file-like object
+        Object data, only its ``read`` method is used.
+    metadata : `dict`
+        Header metadata values. These keys will appear in headers as
+        ``x-amz-meta-*``.
+    content_type : `str`, optional
+        The object's content type. Default is 'application/json'
+
+    Returns
+    -------
+    S3 URI of the uploaded object: `str`
+        The location of the S3 object uploaded in the form:
+        s3://<S3_BUCKET>/<key>
+    """
+    s3 = boto3.resource("s3")
+
+    args = {}
+
+    if metadata is not None:
+        args["Metadata"] = metadata
+    if content_type is not None:
+        args["ContentType"] = content_type
+
+    s3.Object(S3_BUCKET, key).upload_fileobj(fileobj, ExtraArgs=args)
+
+    return get_s3_uri(key)
+
+
+def put_spool_file(key, spool, metadata=None):
+    """Stream a spool file to the S3 bucket and close it.
+
+    See `put_fileobj` for the parameters.
+
+    Returns
+    -------
+    S3 URI of the uploaded object: `str`
+        The location of the S3 object uploaded in the form:
+        s3://<S3_BUCKET>/<key>
+    """
+    try:
+        return put_fileobj(key, spool, metadata)
+    finally:
+        spool.close()
+
+
+def copy_object(source_key, key):
+    """Copy an object within the S3 bucket without downloading it.
+
+    Parameters
+    ----------
+    source_key : `str`
+        Key of the object to copy.
+    key : `str`
+        Key of the new object.
+
+    Returns
+    -------
+    S3 URI of the new object: `str`
+        The location of the S3 object in the form s3://<S3_BUCKET>/<key>
+    """
+    s3 = boto3.resource("s3")
+
+    s3.Object(S3_BUCKET, key).copy_from(
+        CopySource={"Bucket": S3_BUCKET, "Key": source_key}
+    )
+
+    return get_s3_uri(key)
+
+
+def delete_object(key):
+    """Delete an object from the S3 bucket.
+
+    Parameters
+    ----------
+    key : `str`
+        The object's key identifier.
+    """
+    s3 = boto3.resource("s3")
+
+    s3.Object(S3_BUCKET, key).delete()
@@ -106,9 +106,10 @@ class Transformer(Formatter):
             ci_id = self.data["meta"]["env"]["ci_id"]
             ci_name = self.data["meta"]["env"]["ci_name"]
 
-            # Get timestamp from Jenkins
+            # Get timestamp from Jenkins, only the date is loaded
             jenkins_url = (
                 f"{self.squash_api_url}/jenkins/{ci_id}?ci_name={ci_name}"
+                "&fields=date_created"
             )
             try:
                 r = requests.get(jenkins_url)
@@ -1,18 +1,26 @@
 """squash-api pytest fixtures."""
 
+import json
 import os
 
 import pymysql
 import pytest
 import redis
+from celery import Celery
+from celery.backends.cache import CacheBackend
 
 from squash.app import create_app
 from squash.config import Development
-from squash.models import UserModel
+from squash.ingestion import JobIngestion
+from squash.models import MetricModel, UserModel
+from squash.tasks.celery import celery
 
 # timeout in seconds to get the docker services running
 DOCKER_SERVICE_TIMEOUT = 120
 
+# directory of the job documents used by the tests
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
 
 def is_mysql_responsive():
     """Try to connect and run a query to check if mysql is responsive."""
@@ -87,3 +95,52 @@ def test_client(ensure_redis_service, ensure_mysql_service):
     ctx.push()
     yield testing_client  # this is where the testing happens!
     ctx.pop()
+
+
+@pytest.fixture
+def auth_header(test_client):
+    """Return the authorization header of the test user."""
+    response = test_client.post(
+        "/auth", json={"username": "mole", "password": "desert"}
+    )
+    return {"Authorization": "JWT {}".format(response.json["access_token"])}
+
+
+@pytest.fixture(scope="session")
+def data_path():
+    """Return a function that returns the path of a file in tests/data."""
+    return lambda name: os.path.join(DATA_DIR, name)
+
+
+@pytest.fixture
+def job_document(data_path):
+    """Load tests/data/job-768.json, a new copy for each test."""
+    with open(data_path("job-768.json")) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def job_data(test_client, data_path):
+    """Load tests/data/job-768.json and create its metrics."""
+    with open(data_path("job-768.json")) as f:
+        data = json.load(f)
+
+    for name in set(m["metric"] for m in data["measurements"]):
+        if not MetricModel.find_by_name(name):
+            MetricModel(name, description=name).save_to_db()
+
+    return data
+
+
+@pytest.fixture(scope="module")
+def job_id(job_data):
+    """Insert tests/data/job-768.json and return its id."""
+    return JobIngestion(job_data).run()
+
+
+@pytest.fixture
+def result_backend(monkeypatch):
+    """Replace the Celery result backend with an in-memory backend."""
+    backend = CacheBackend(app=celery, backend="memory")
+    monkeypatch.setattr(Celery, "backend", property(lambda self: backend))
+    return backend
@@ -0,0 +1,108 @@
+"""Test compressed request bodies."""
+
+import gzip
+import json
+import uuid
+
+import zstandard
+
+MEASUREMENT = {"metric": "validate_drp.AM1", "value": 1.0, "unit": "marcsec"}
+
+
+def test_gzip_body(test_client, auth_header):
+    """A gzip compressed body is decompressed transparently."""
+    body = gzip.compress(json.dumps(MEASUREMENT).encode())
+    headers = dict(auth_header)
+    headers["Content-Encoding"] = "gzip"
+
+    response = test_client.post(
+        "/measurement/0",
+        data=body,
+        content_type="application/json",
+        headers=headers,
+    )
+    # the body is parsed, then the job is not found
+    assert response.status_code == 404
+
+
+def test_zstd_body(test_client, auth_header):
+    """A zstd compressed body is decompressed transparently."""
+    body = zstandard.ZstdCompressor().compress(
+        json.dumps(MEASUREMENT).encode()
+    )
+    headers = dict(auth_header)
+    headers["Content-Encoding"] = "zstd"
+
+    response = test_client.post(
+        "/measurement/0",
+        data=body,
+        content_type="application/json",
+        headers=headers,
+    )
+    # the body is parsed, then the job is not found
+    assert response.status_code == 404
+
+
+def test_decompressed_size_limit(test_client, auth_header):
+    """A body larger than MAX_DECOMPRESSED_SIZE once decompressed fails."""
+    body = gzip.compress(b" " * 1024 + json.dumps(MEASUREMENT).encode())
+    headers = dict(auth_header)
+    headers["Content-Encoding"] = "gzip"
+
+    test_client.application.config["MAX_DECOMPRESSED_SIZE"] = 1024
+    try:
+        response = test_client.post(
+            "/measurement/0",
+            data=body,
+            content_type="application/json",
+            headers=headers,
+        )
+    finally:
+        test_client.application.config["MAX_DECOMPRESSED_SIZE"] = 2 ** 31
+    assert response.status_code == 413
+
+
+def post_job(test_client, auth_header, body, encoding):
+    """Post a compressed job document.
+
+    The document is parsed incrementally, its decompressed length is not
+    known.
+    """
+    headers = dict(auth_header)
+    headers["Content-Encoding"] = encoding
+    headers["Idempotency-Key"] = uuid.uuid4().hex
+
+    return test_client.post(
+        "/job", data=body, content_type="application/json", headers=headers
+    )
+
+
+def test_gzip_job(test_client, auth_header, data_path):
+    """A gzip compressed job document with NaN values is ingested."""
+    with open(data_path("verify_job.json"), "rb") as f:
+        body = gzip.compress(f.read())
+
+    response = post_job(test_client, auth_header, body, "gzip")
+
+    assert response.status_code == 202
+
+
+def test_zstd_job(test_client, auth_header, data_path):
+    """A zstd compressed job document with NaN values is ingested."""
+    with open(data_path("verify_job.json"), "rb") as f:
+        body = zstandard.ZstdCompressor().compress(f.read())
+
+    response = post_job(test_client, auth_header, body, "zstd")
+
+    assert response.status_code == 202
+
+
+def test_unsupported_encoding(test_client):
+    """An unknown Content-Encoding is rejected."""
+    response = test_client.post(
+        "/measurement/0",
+        data=b"{}",
+        content_type="application/json",
+        headers={"Content-Encoding": "br"},
+    )
+    assert response.status_code == 415
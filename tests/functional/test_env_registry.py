@@ -0,0 +1,27 @@
+"""Test the environment registry."""
+
+import uuid
+
+from squash.catalog import env_registry
+from squash.models import EnvModel
+
+
+def test_create_env(test_client):
+    """An environment is created once and its id is cached."""
+    name = "env-{}".format(uuid.uuid4().hex[:8])
+
+    assert env_registry.get_id(name) is None
+
+    env_id = env_registry.get_id(name, create=True)
+
+    assert env_registry.get_id(name, create=True) == env_id
+    assert EnvModel.query.filter_by(name=name).count() == 1
+
+
+def test_existing_env(test_client):
+    """An environment created by another worker is found."""
+    name = "env-{}".format(uuid.uuid4().hex[:8])
+    env = EnvModel(name)
+    env.save_to_db()
+
+    assert env_registry.get_id(name, create=True) == env.id
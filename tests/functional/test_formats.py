@@ -0,0 +1,90 @@
+"""Test the formats of the responses negotiated with the Accept header."""
+
+import json
+
+import msgpack
+import pyarrow as pa
+
+ARROW = "application/vnd.apache.arrow.stream"
+
+
+def test_default_format(test_client, job_id):
+    """JSON is sent when no other format is acceptable."""
+    response = test_client.get("/monitor", headers={"Accept": "text/html"})
+
+    assert response.mimetype == "application/json"
+    assert "Accept" in response.headers["Vary"]
+
+
+def test_monitor_arrow(test_client, job_id):
+    """The Arrow table has the columns of the JSON response."""
+    url = "/monitor?period=All"
+    columns = test_client.get(url).json
+
+    response = test_client.get(url, headers={"Accept": ARROW})
+    table = pa.ipc.open_stream(response.data).read_all()
+
+    assert response.mimetype == ARROW
+    assert table.schema.names == list(columns)
+    assert table.column("value").to_pylist() == columns["value"]
+    assert table.column("job_id").to_pylist() == columns["job_id"]
+
+
+def test_monitor_formats(test_client, job_id):
+    """The NDJSON rows and the MessagePack columns match the JSON ones."""
+    url = "/monitor?period=All"
+    columns = test_client.get(url).json
+
+    response = test_client.get(url, headers={"Accept": "application/x-ndjson"})
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert {name: [row[name] for row in rows] for name in columns} == columns
+
+    response = test_client.get(url, headers={"Accept": "application/msgpack"})
+    assert msgpack.unpackb(response.data) == columns
+
+
+def test_monitor_max_points(test_client, job_id):
+    """The series are sent one after the other when downsampled."""
+    columns = test_client.get("/monitor?period=All").json
+
+    response = test_client.get("/monitor?period=All&max_points=4")
+    downsampled = response.json
+
+    assert sorted(downsampled["metric_name"]) == sorted(columns["metric_name"])
+    assert sorted(downsampled["job_id"]) == sorted(columns["job_id"])
+
+    response = test_client.get("/monitor?max_points=2")
+    assert response.status_code == 400
+
+
+def test_measurements_formats(test_client, job_id):
+    """The measurements of a job are sent in every format."""
+    url = "/measurement/{}".format(job_id)
+    measurements = test_client.get(url).json["measurements"]
+
+    response = test_client.get(url, headers={"Accept": ARROW})
+    table = pa.ipc.open_stream(response.data).read_all()
+    assert table.to_pylist() == measurements
+
+    response = test_client.get(url, headers={"Accept": "application/msgpack"})
+    assert msgpack.unpackb(response.data)["measurements"] == measurements
+
+
+def test_next_page_link(test_client, job_id):
+    """The URL of the next page is sent in the Link header."""
+    response = test_client.get(
+        "/measurements?limit=1", headers={"Accept": "application/x-ndjson"}
+    )
+
+    assert len(response.data.splitlines()) == 1
+    assert 'rel="next"' in response.headers["Link"]
+
+
+def test_job_msgpack(test_client, job_id):
+    """A job is sent as MessagePack."""
+    url = "/job/{}".format(job_id)
+
+    response = test_client.get(url, headers={"Accept": "application/msgpack"})
+
+    assert response.mimetype == "application/msgpack"
+    assert msgpack.unpackb(response.data) == test_client.get(url).json
@@ -0,0 +1,68 @@
+"""Test the generated columns of the JSON paths used in lookups."""
+
+import copy
+import uuid
+
+import pytest
+
+from squash.catalog import env_registry
+from squash.ingestion import JobIngestion
+from squash.models import JobModel, MetricModel, SpecificationModel
+
+
+@pytest.fixture(scope="module")
+def job_data(job_data):
+    """Return tests/data/job-768.json with a new ci_id and a filter."""
+    data = copy.deepcopy(job_data)
+    data["meta"]["env"]["ci_id"] = uuid.uuid4().hex
+    data["meta"]["filter_name"] = "r"
+
+    return data
+
+
+def test_job_columns(test_client, job_data):
+    """The env and meta paths are generated as columns."""
+    job = JobModel.find_by_id(JobIngestion(job_data).run())
+    env = job_data["meta"]["env"]
+
+    assert job.ci_id == env["ci_id"]
+    assert job.ci_name == env["ci_name"]
+    assert job.filter_name == "r"
+
+
+def test_env_data_lookup(test_client, job_data):
+    """Jenkins jobs are looked up with the generated columns."""
+    env = dict(job_data["meta"]["env"], ci_id=uuid.uuid4().hex)
+    job_id = JobIngestion(
+        dict(job_data, meta=dict(job_data["meta"], env=env))
+    ).run()
+
+    query = JobModel.query_by_env_data(
+        env_registry.get_id("jenkins"),
+        ci_id=env["ci_id"],
+        ci_name=env["ci_name"],
+    )
+    assert "json" not in str(query.statement).lower()
+
+    response = test_client.get(
+        "/jenkins/{}?ci_name={}&fields=id".format(env["ci_id"], env["ci_name"])
+    )
+    assert response.json == {"id": job_id}
+
+
+def test_spec_columns(test_client, job_data):
+    """Specifications are filtered with the generated columns."""
+    metric = MetricModel.find_by_name(job_data["measurements"][0]["metric"])
+    spec = SpecificationModel(
+        "{}.generated".format(metric.name),
+        metric.id,
+        metadata_query={"dataset_name": "decam", "filter_name": "r"},
+    )
+    spec.save_to_db()
+
+    specs = test_client.get(
+        "/specs?metric={}&dataset_name=decam&filter_name=r".format(metric.name)
+    ).json["specs"]
+
+    assert spec.dataset_name == "decam"
+    assert [s["name"] for s in specs] == [spec.name]
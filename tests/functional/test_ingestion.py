@@ -0,0 +1,143 @@
+"""Test the ingestion of verification jobs."""
+
+import uuid
+
+import squash.api_v1.blob
+from squash.ingestion import JobIngestion
+from squash.models import (
+    BlobModel,
+    JobModel,
+    MeasurementModel,
+    MetricSeriesModel,
+    PackageModel,
+    db,
+    measurement_blob,
+)
+from squash.tasks.pipeline import JobPipeline
+from squash.tasks.s3 import get_s3_uri
+
+MODELS = [JobModel, MeasurementModel, PackageModel, MetricSeriesModel]
+
+
+def count_rows():
+    """Return the number of rows of the tables written by an ingestion."""
+    return {model.__tablename__: model.query.count() for model in MODELS}
+
+
+def make_job(metric_name, identifier):
+    """Return a job document with a measurement and its data blob."""
+    return {
+        "meta": {"packages": {}},
+        "measurements": [
+            {
+                "metric": metric_name,
+                "value": 1.0,
+                "unit": "",
+                "blob_refs": [identifier],
+            }
+        ],
+        "blobs": [{"identifier": identifier, "name": "blob", "data": {}}],
+    }
+
+
+def test_rollback(test_client, job_data, auth_header, monkeypatch):
+    """Nothing is written if a late step of the ingestion fails."""
+
+    def insert_blobs(self, measurements):
+        raise RuntimeError("insert_blobs failed")
+
+    monkeypatch.setattr(JobIngestion, "insert_blobs", insert_blobs)
+    before = count_rows()
+
+    headers = dict(auth_header)
+    headers["Idempotency-Key"] = uuid.uuid4().hex
+    response = test_client.post("/job", json=job_data, headers=headers)
+
+    assert response.status_code == 500
+    assert count_rows() == before
+
+
+def test_shared_blob(test_client, job_data):
+    """A blob sent again by another job is linked, not inserted again."""
+    metric_name = job_data["measurements"][0]["metric"]
+    identifier = uuid.uuid4().hex
+
+    for _ in range(2):
+        JobIngestion(make_job(metric_name, identifier)).run()
+
+    blob = BlobModel.find_by_identifier(identifier)
+
+    assert BlobModel.query.filter_by(identifier=identifier).count() == 1
+    assert (
+        db.session.query(measurement_blob).filter_by(blob_id=blob.id).count()
+        == 2
+    )
+
+
+def test_s3_uris(test_client, job_data):
+    """The S3 URIs are set by the ingestion, before the uploads."""
+    metric_name = job_data["measurements"][0]["metric"]
+    identifier = uuid.uuid4().hex
+
+    job_id = JobIngestion(make_job(metric_name, identifier)).run()
+    job = JobModel.find_by_id(job_id)
+    blob = BlobModel.find_by_identifier(identifier)
+
+    assert job.s3_uri == get_s3_uri(str(job_id))
+    assert blob.s3_uri == get_s3_uri(identifier)
+    assert job.uploaded_at is None
+    assert blob.uploaded_at is None
+
+
+def test_uploaded_at(test_client, job_data, result_backend):
+    """The upload stages record the upload of the objects."""
+    metric_name = job_data["measurements"][0]["metric"]
+    identifier = uuid.uuid4().hex
+
+    job_id = JobIngestion(make_job(metric_name, identifier)).run()
+    pipeline = JobPipeline(job_id)
+    pipeline.run("blob:{}".format(identifier), lambda: None)
+    pipeline.run("document", lambda: None)
+    db.session.expire_all()
+
+    assert JobModel.find_by_id(job_id).uploaded_at is not None
+    assert BlobModel.find_by_identifier(identifier).uploaded_at is not None
+
+
+def test_failed_upload(test_client, job_data, result_backend):
+    """A failed upload leaves the object marked as not uploaded."""
+    identifier = uuid.uuid4().hex
+    job_id = JobIngestion(
+        make_job(job_data["measurements"][0]["metric"], identifier)
+    ).run()
+
+    def put_object(*args):
+        raise RuntimeError("S3 is down.")
+
+    JobPipeline(job_id).run("blob:{}".format(identifier), put_object)
+    db.session.expire_all()
+
+    assert BlobModel.find_by_identifier(identifier).uploaded_at is None
+
+
+def test_blob_not_uploaded(test_client, job_data, monkeypatch):
+    """A blob that is not uploaded yet can be requested again later."""
+    metric_name = job_data["measurements"][0]["metric"]
+    identifier = uuid.uuid4().hex
+    monkeypatch.setattr(
+        squash.api_v1.blob, "download_object", lambda s3_uri: None
+    )
+
+    job_id = JobIngestion(make_job(metric_name, identifier)).run()
+    url = "/blob/{}?metric={}&name=blob".format(job_id, metric_name)
+    response = test_client.get(url)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(
+        squash.api_v1.blob.RETRY_AFTER
+    )
+
+    BlobModel.mark_uploaded(identifier)
+    response = test_client.get(url)
+
+    assert response.status_code == 404
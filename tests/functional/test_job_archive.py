@@ -0,0 +1,89 @@
+"""Test the archive of the job documents in S3."""
+
+import gzip
+import json
+import uuid
+
+import pytest
+
+import squash.api_v1.job
+
+
+@pytest.fixture
+def archived(monkeypatch):
+    """Record the documents uploaded to S3 instead of uploading them."""
+    documents = {}
+
+    def put_object(key, body, content_encoding=None):
+        documents[key] = body
+
+    def put_spool_file(key, spool, metadata=None):
+        documents[key] = spool.read()
+        spool.close()
+
+    monkeypatch.setattr(squash.api_v1.job, "put_object", put_object)
+    monkeypatch.setattr(squash.api_v1.job, "put_spool_file", put_spool_file)
+
+    return documents
+
+
+def post_job(test_client, auth_header, body, encoding=None):
+    """Post a job document and return the id of the job."""
+    headers = dict(auth_header)
+    headers["Idempotency-Key"] = uuid.uuid4().hex
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    response = test_client.post(
+        "/job", data=body, content_type="application/json", headers=headers
+    )
+    assert response.status_code == 202
+
+    return str(response.json["job_id"])
+
+
+def test_cached_body(test_client, auth_header, job_data, archived):
+    """A small document is archived as received."""
+    body = json.dumps(job_data, indent=1).encode()
+
+    job_id = post_job(test_client, auth_header, body)
+
+    assert archived[job_id] == body
+
+
+def test_spooled_body(test_client, auth_header, job_data, archived):
+    """A document parsed incrementally is archived as received."""
+    body = json.dumps(job_data, indent=1).encode() + b"\n"
+
+    config = test_client.application.config
+    threshold = config["JOB_STREAMING_THRESHOLD"]
+    config["JOB_STREAMING_THRESHOLD"] = 0
+    try:
+        job_id = post_job(test_client, auth_header, body)
+    finally:
+        config["JOB_STREAMING_THRESHOLD"] = threshold
+
+    assert archived[job_id] == body
+
+
+def test_compressed_body(test_client, auth_header, job_data, archived):
+    """A compressed document is archived as it was once decompressed."""
+    body = json.dumps(job_data, indent=1).encode()
+
+    job_id = post_job(test_client, auth_header, gzip.compress(body), "gzip")
+
+    assert archived[job_id] == body
+
+
+def test_archive_compression(test_client, auth_header, job_data, archived):
+    """The archived document is compressed with JOB_ARCHIVE_COMPRESSION."""
+    body = json.dumps(job_data, indent=1).encode()
+
+    config = test_client.application.config
+    config["JOB_ARCHIVE_COMPRESSION"] = "gzip"
+    try:
+        job_id = post_job(test_client, auth_header, body)
+    finally:
+        config["JOB_ARCHIVE_COMPRESSION"] = ""
+
+    assert gzip.decompress(archived[job_id]) == body
@@ -0,0 +1,30 @@
+"""Test the bulk ingestion of jobs."""
+
+import json
+
+
+def test_invalid_lines(test_client, auth_header):
+    """Each line of the request body gets its own result."""
+    lines = [
+        "not json",
+        "",
+        json.dumps({"meta": {}, "measurements": []}),
+        json.dumps(["not", "a", "job"]),
+    ]
+    job_ids = test_client.get("/jobs").json["ids"]
+
+    response = test_client.post(
+        "/jobs",
+        data="\n".join(lines),
+        content_type="application/x-ndjson",
+        headers=auth_header,
+    )
+
+    assert response.status_code == 200
+    assert response.json["results"] == [
+        {"line": 1, "status": 400, "message": "Invalid job document."},
+        {"line": 3, "status": 400, "message": "Missing packages metadata."},
+        {"line": 4, "status": 400, "message": "Invalid job document."},
+    ]
+    # no job was created
+    assert test_client.get("/jobs").json["ids"] == job_ids
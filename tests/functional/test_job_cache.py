@@ -0,0 +1,121 @@
+"""Test the cache of job documents."""
+
+from datetime import timedelta
+
+from flask import current_app as app
+
+from squash.catalog import job_cache
+from squash.ingestion import JobIngestion
+from squash.models import JobModel, db
+
+
+def test_hits_and_misses(test_client, job_data):
+    """A job is loaded once and then served from the cache."""
+    job_id = JobIngestion(job_data).run()
+    job_cache.clear()
+
+    first = test_client.get("/job/{}".format(job_id)).json
+    second = test_client.get("/job/{}".format(job_id)).json
+
+    assert first == second
+    assert "packages" in first["meta"]
+    assert job_cache.stats()["hits"] == 1
+    assert job_cache.stats()["misses"] == 1
+
+
+def test_fields_from_cache(test_client, job_data):
+    """The fields of a cached job are selected from its document."""
+    job_id = JobIngestion(job_data).run()
+    document = test_client.get("/job/{}".format(job_id)).json
+
+    response = test_client.get(
+        "/job/{}?fields=measurements,meta.packages".format(job_id)
+    )
+
+    assert response.json == {
+        "measurements": document["measurements"],
+        "meta": {"packages": document["meta"]["packages"]},
+    }
+    assert (
+        response.headers["ETag"]
+        != test_client.get("/job/{}".format(job_id)).headers["ETag"]
+    )
+
+
+def test_unknown_field(test_client, job_data):
+    """Unknown fields are rejected."""
+    response = test_client.get("/job/1?fields=id,measurements.value")
+
+    assert response.status_code == 400
+
+
+def test_bounded_size(test_client, job_data):
+    """The least recently used documents are evicted."""
+    job_ids = [JobIngestion(job_data).run() for _ in range(3)]
+    job_cache.clear()
+
+    max_size = app.config["JOB_CACHE_SIZE"]
+    app.config["JOB_CACHE_SIZE"] = 2
+    try:
+        for job_id in job_ids:
+            test_client.get("/job/{}".format(job_id))
+
+        assert job_cache.stats()["size"] == 2
+
+        # the first job was evicted
+        test_client.get("/job/{}".format(job_ids[0]))
+        assert job_cache.stats()["misses"] == 4
+    finally:
+        app.config["JOB_CACHE_SIZE"] = max_size
+
+
+def test_measurement_added(test_client, job_data, auth_header):
+    """A measurement added to a job invalidates its document."""
+    job_id = JobIngestion(job_data).run()
+    url = "/measurement/{}".format(job_id)
+    measurements = test_client.get(url).json["measurements"]
+
+    test_client.post(
+        url,
+        json={
+            "metric": job_data["measurements"][0]["metric"],
+            "value": 1.0,
+            "unit": "",
+        },
+        headers=auth_header,
+    )
+
+    assert len(test_client.get(url).json["measurements"]) == (
+        len(measurements) + 1
+    )
+
+
+def test_job_deleted(test_client, job_data, auth_header):
+    """A deleted job is removed from the cache."""
+    job_id = JobIngestion(job_data).run()
+    url = "/job/{}".format(job_id)
+    test_client.get(url)
+    size = job_cache.stats()["size"]
+
+    test_client.delete(url, headers=auth_header)
+
+    assert job_cache.stats()["size"] == size - 1
+    assert test_client.get(url).status_code == 404
+
+
+def test_reused_id(test_client, job_data):
+    """A new job with the id of a deleted one is not served from the cache.
+
+    MySQL reuses the id of the last jobs if they are deleted before a
+    restart, the new job is simulated by changing the creation date.
+    """
+    job_id = JobIngestion(job_data).run()
+    url = "/job/{}".format(job_id)
+    test_client.get(url)
+
+    job = JobModel.find_by_id(job_id)
+    job.date_created += timedelta(seconds=1)
+    job.env = dict(job.env, ci_id="reused")
+    db.session.commit()
+
+    assert test_client.get(url).json["meta"]["env"]["ci_id"] == "reused"
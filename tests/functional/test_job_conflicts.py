@@ -0,0 +1,61 @@
+"""Test the conflicts detected when a job is inserted."""
+
+import uuid
+
+import pytest
+
+from squash.catalog import env_registry
+from squash.error import ApiError
+from squash.ingestion import JobIngestion
+from squash.models import EnvModel, db
+
+
+@pytest.fixture
+def data(job_document):
+    """Return tests/data/job-768.json with a new Jenkins build."""
+    job_document["meta"]["env"]["ci_id"] = uuid.uuid4().hex
+    job_document["measurements"] = []
+    job_document["blobs"] = []
+
+    return job_document
+
+
+def test_replayed_key(test_client, data):
+    """A job with the idempotency key of an existing job is a conflict."""
+    key = uuid.uuid4().hex
+    JobIngestion(data, key).run()
+
+    with pytest.raises(ApiError) as excinfo:
+        JobIngestion(data, key).run()
+
+    assert excinfo.value.status_code == 409
+
+
+def test_deleted_env(test_client, data):
+    """Other integrity errors, e.g. a deleted env, are not conflicts."""
+    name = "env-{}".format(uuid.uuid4().hex[:8])
+    data["meta"]["env"]["env_name"] = name
+
+    env_registry.get_id(name, create=True)
+    EnvModel.query.filter_by(name=name).delete()
+    db.session.commit()
+
+    with pytest.raises(ApiError) as excinfo:
+        JobIngestion(data, uuid.uuid4().hex).run()
+
+    assert excinfo.value.status_code == 500
+
+    # the env is created again by the next request
+    JobIngestion(data, uuid.uuid4().hex).run()
+
+    assert EnvModel.query.filter_by(name=name).count() == 1
+
+
+def test_long_env_name(test_client, data):
+    """An env name longer than the column is rejected."""
+    data["meta"]["env"]["env_name"] = "x" * 65
+
+    with pytest.raises(ApiError) as excinfo:
+        JobIngestion(data).run()
+
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,54 @@
+"""Test the metric catalog."""
+
+import uuid
+
+import pytest
+
+from squash.catalog import metric_catalog
+from squash.ingestion import JobIngestion
+from squash.models import MeasurementModel, MetricModel, db
+
+
+def make_job(metric_names):
+    """Return a job document with a measurement per metric."""
+    return {
+        "meta": {"packages": {}},
+        "measurements": [
+            {"metric": name, "value": 1.0, "unit": ""} for name in metric_names
+        ],
+        "blobs": [],
+    }
+
+
+def test_resolve(test_client):
+    """Metric names are resolved to their ids."""
+    metric = MetricModel("catalog.{}".format(uuid.uuid4().hex[:8]))
+    metric.save_to_db()
+
+    assert metric_catalog.resolve({metric.name, "unknown"}) == {
+        metric.name: metric.id
+    }
+
+
+def test_deleted_metric(test_client):
+    """A metric deleted while its id is cached is skipped.
+
+    The metric is deleted by another worker, the job is still ingested.
+    """
+    kept = MetricModel("catalog.{}".format(uuid.uuid4().hex[:8]))
+    kept.save_to_db()
+    deleted = MetricModel("catalog.{}".format(uuid.uuid4().hex[:8]))
+    deleted.save_to_db()
+    metric_catalog.resolve({kept.name, deleted.name})
+
+    # deleted without changing the catalog version, as seen by a worker
+    # before its cache expires
+    MetricModel.query.filter_by(id=deleted.id).delete()
+    db.session.commit()
+
+    with pytest.warns(UserWarning):
+        job_id = JobIngestion(make_job([kept.name, deleted.name])).run()
+
+    assert [
+        m.metric_name for m in MeasurementModel.find_by_job_id(job_id)
+    ] == [kept.name]
@@ -0,0 +1,84 @@
+"""Test the metric series read by the monitor."""
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from squash.ingestion import JobIngestion
+from squash.models import MeasurementModel, MetricSeriesModel, db
+
+
+def get_series(job_id):
+    """Return the points of the series of a job."""
+    return MetricSeriesModel.query.filter_by(job_id=job_id).all()
+
+
+def test_ingested_job(test_client, job_data):
+    """A point is appended per measurement, with the job attributes."""
+    job_id = JobIngestion(job_data).run()
+    env = job_data["meta"]["env"]
+
+    points = get_series(job_id)
+
+    assert sorted(point.metric_name for point in points) == sorted(
+        m["metric"] for m in job_data["measurements"]
+    )
+    for point in points:
+        assert point.ci_id == env["ci_id"]
+        assert point.ci_url == env["ci_url"]
+        assert point.metric_id is not None
+
+    columns = test_client.get(
+        "/monitor?period=All&metric={}".format(points[0].metric_name)
+    ).json
+    assert job_id in columns["job_id"]
+    assert set(columns["metric_name"]) == {points[0].metric_name}
+
+
+def test_measurement_appended_once(test_client, job_data):
+    """A measurement has a single point, the backfill relies on it."""
+    job_id = JobIngestion(job_data).run()
+    measurement_ids = {
+        meas.id for meas in MeasurementModel.find_by_job_id(job_id)
+    }
+
+    points = get_series(job_id)
+
+    assert {point.measurement_id for point in points} == measurement_ids
+
+    with pytest.raises(IntegrityError):
+        MetricSeriesModel.append(MeasurementModel.job_id == job_id)
+    db.session.rollback()
+
+
+def test_measurement_added(test_client, job_data, auth_header):
+    """A measurement added to a job is appended to the series."""
+    job_id = JobIngestion(job_data).run()
+    size = len(get_series(job_id))
+
+    test_client.post(
+        "/measurement/{}".format(job_id),
+        json={
+            "metric": job_data["measurements"][0]["metric"],
+            "value": 1.0,
+            "unit": "",
+        },
+        headers=auth_header,
+    )
+
+    assert len(get_series(job_id)) == size + 1
+
+
+def test_job_deleted(test_client, job_data, auth_header):
+    """The points of a deleted job are deleted."""
+    job_id = JobIngestion(job_data).run()
+
+    test_client.delete("/job/{}".format(job_id), headers=auth_header)
+
+    assert get_series(job_id) == []
+
+
+def test_unknown_metric(test_client, job_data):
+    """An unknown metric has no series."""
+    columns = test_client.get("/monitor?period=All&metric=unknown").json
+
+    assert columns["job_id"] == []
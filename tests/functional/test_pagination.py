@@ -0,0 +1,33 @@
+"""Test the keyset pagination of the list resources."""
+
+import uuid
+
+
+def test_metrics_pages(test_client, auth_header):
+    """Following the next links returns every metric once, in order."""
+    package = "pkg_{}".format(uuid.uuid4().hex[:8])
+    names = ["{}.metric{}".format(package, i) for i in range(5)]
+    metrics = [
+        {"name": name, "package": package, "description": name}
+        for name in names
+    ]
+    test_client.post(
+        "/metrics", json={"metrics": metrics}, headers=auth_header
+    )
+
+    retrieved = []
+    url = "/metrics?package={}&limit=2".format(package)
+    while url:
+        response = test_client.get(url)
+        assert response.status_code == 200
+        assert len(response.json["metrics"]) <= 2
+        retrieved.extend(metric["name"] for metric in response.json["metrics"])
+        url = response.json["next"]
+
+    assert retrieved == names
+
+
+def test_invalid_limit(test_client):
+    """The limit must be a positive integer."""
+    response = test_client.get("/jobs?limit=0")
+    assert response.status_code == 400
@@ -0,0 +1,156 @@
+"""Test the number of queries run to serialize a job."""
+
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+from squash.catalog import job_cache
+from squash.ingestion import JobIngestion
+from squash.models import JobModel, MetricModel, db
+
+
+@contextmanager
+def count_queries():
+    """Record the statements executed by the database engine."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_job_queries(test_client, job_id):
+    """A job is serialized with one query per table.
+
+    The number of queries does not depend on the number of measurements.
+    """
+    job_cache.clear()
+
+    with count_queries() as statements:
+        response = test_client.get("/job/{}".format(job_id))
+
+    assert response.status_code == 200
+    assert len(response.json["measurements"]) == 21
+    # job version, job, measurements, packages and blobs
+    assert len(statements) == 5
+
+
+def test_measurement_queries(test_client, job_id):
+    """The measurements are serialized with a fixed number of queries."""
+    job_cache.clear()
+
+    with count_queries() as statements:
+        response = test_client.get("/measurement/{}".format(job_id))
+
+    assert response.status_code == 200
+    # job version, job, measurements, packages and blobs
+    assert len(statements) == 5
+
+
+@pytest.mark.parametrize("url", ["/job/{}", "/measurement/{}"])
+def test_cached_job_queries(test_client, job_id, url):
+    """A cached job is served with a single query."""
+    url = url.format(job_id)
+    test_client.get(url)
+
+    with count_queries() as statements:
+        response = test_client.get(url)
+
+    assert response.status_code == 200
+    # job revision
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize("url", ["/job/{}", "/measurement/{}"])
+def test_not_modified_queries(test_client, job_id, url):
+    """A job that has not changed is not loaded again."""
+    url = url.format(job_id)
+    etag = test_client.get(url).headers["ETag"]
+
+    with count_queries() as statements:
+        response = test_client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    # job revision
+    assert len(statements) == 1
+
+    # a measurement added to the job changes its version
+    JobModel.bump_version(job_id)
+    db.session.commit()
+
+    response = test_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_reused_id_etag(test_client, job_data):
+    """A new job with the id of a deleted one has another entity tag.
+
+    MySQL reuses the id of the last jobs if they are deleted before a
+    restart, the new job is simulated by changing the creation date.
+    """
+    job_id = JobIngestion(job_data).run()
+    url = "/job/{}".format(job_id)
+    etag = test_client.get(url).headers["ETag"]
+
+    job = JobModel.find_by_id(job_id)
+    job.date_created += timedelta(seconds=1)
+    db.session.commit()
+
+    response = test_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_job_fields_queries(test_client, job_id):
+    """Only the job row is loaded for fields that require no relationship."""
+    job_cache.clear()
+
+    with count_queries() as statements:
+        response = test_client.get(
+            "/job/{}?fields=id,date_created,meta.env".format(job_id)
+        )
+
+    assert response.status_code == 200
+    assert list(response.json) == ["id", "date_created", "meta"]
+    assert list(response.json["meta"]) == ["env"]
+    # job version and job
+    assert len(statements) == 2
+
+
+def test_metric_queries(test_client, job_id):
+    """A metric is loaded without its specifications and measurements."""
+    name = MetricModel.query.join(MetricModel.measurement).first().name
+    db.session.expunge_all()
+
+    with count_queries() as statements:
+        metric = MetricModel.find_by_name(name)
+
+    assert metric is not None
+    assert len(statements) == 1
+    assert "JOIN" not in statements[0]
+    # only the metric row is fetched
+    assert list(db.session.identity_map.values()) == [metric]
+
+
+def test_metric_expand(test_client, job_data, job_id):
+    """The measurements of a metric are expanded a page at a time."""
+    # a second measurement of each metric
+    JobIngestion(job_data).run()
+
+    name = MetricModel.query.join(MetricModel.measurement).first().name
+    url = "/metric/{}?expand=specs&expand=measurements&limit=1".format(name)
+
+    response = test_client.get(url)
+
+    assert response.status_code == 200
+    assert response.json["specs"] == []
+    assert len(response.json["measurements"]) == 1
+    assert "expand=measurements" in response.json["next"]
+    assert test_client.get(url + "&expand=jobs").status_code == 400
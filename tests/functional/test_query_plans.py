@@ -0,0 +1,329 @@
+"""Test the plans of the queries run by the resources.
+
+The tables are filled with ``SEED_ROWS`` rows each, every ``SELECT``,
+``UPDATE`` and ``DELETE`` run by a request is explained, and a full table
+scan (access type ``ALL``) that reads more than ``SCAN_THRESHOLD`` rows fails
+the test. A new query that is not served by an index is detected here,
+before it reaches production. Every ``GET`` resource of the API is
+requested, see `test_all_resources`.
+"""
+
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from squash.catalog import env_registry, job_cache, metric_catalog
+from squash.ingestion import JobIngestion
+from squash.models import (
+    BlobModel,
+    JobModel,
+    MeasurementModel,
+    MetricModel,
+    MetricSeriesModel,
+    PackageModel,
+    SpecificationModel,
+    db,
+)
+
+# Number of rows inserted in each table
+SEED_ROWS = 2000
+
+# Maximum number of rows of a full table scan
+SCAN_THRESHOLD = 500
+
+SEEDED_TABLES = [
+    "job",
+    "measurement",
+    "package",
+    "metric_series",
+    "spec",
+    "blob",
+]
+
+# Requests run by the tests, formatted with the `params` fixture, and the
+# expected status code
+URLS = [
+    ("/job/{job_id}", 200),
+    ("/jobs?limit=10", 200),
+    ("/measurement/{job_id}", 200),
+    ("/measurements?limit=10", 200),
+    ("/jenkins/{ci_id}?ci_name={ci_name}", 200),
+    ("/code_changes/{ci_id}?ci_name={ci_name}", 200),
+    ("/metric/{metric}?expand=specs&expand=measurements", 200),
+    ("/metrics?limit=10", 200),
+    ("/spec/seed.0", 200),
+    ("/specs?metric={metric}", 200),
+    ("/specs?dataset_name=seed&filter_name=0", 200),
+    ("/monitor?ci_dataset={ci_dataset}&metric={metric}&period=All", 200),
+    ("/monitor?ci_dataset={ci_dataset}&metric={metric}&max_points=100", 200),
+    ("/datasets", 200),
+    ("/packages", 200),
+    ("/stats", 200),
+    ("/users", 200),
+    ("/user/mole", 200),
+    # the blob is looked up, but not downloaded from S3
+    ("/blob/{job_id}?metric={metric}&name=seed", 404),
+]
+
+# Endpoints of the GET resources that do not query the database
+NO_QUERIES = ["root", "version", "status"]
+
+# Statements that are explained
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+@contextmanager
+def record_queries():
+    """Record the statements executed by the database engine.
+
+    The ``EXPLAINED`` statements are recorded with their parameters, the
+    first set of parameters of a statement executed many times.
+    """
+    queries = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if statement.lstrip().upper().startswith(EXPLAINED):
+            if executemany:
+                parameters = parameters[0]
+            queries.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    yield queries
+    event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(statement, parameters):
+    """Return the rows of the EXPLAIN of a statement, as `dict`."""
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("EXPLAIN " + statement, parameters)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def get_full_scans(statement, parameters):
+    """Return the full table scans in the plan of a statement.
+
+    Only the scans of more than ``SCAN_THRESHOLD`` rows are returned.
+    """
+    return [
+        row
+        for row in explain(statement, parameters)
+        if row["type"] == "ALL" and (row["rows"] or 0) > SCAN_THRESHOLD
+    ]
+
+
+def seed(data):
+    """Insert ``SEED_ROWS`` rows in each table, return the seeded job ids."""
+    env_id = env_registry.get_id("jenkins", create=True)
+    metric_ids = metric_catalog.resolve(
+        set(m["metric"] for m in data["measurements"])
+    )
+    metrics = sorted(metric_ids.items())
+
+    db.session.execute(
+        JobModel.__table__.insert(),
+        [
+            {
+                "env_id": env_id,
+                "ci_dataset": "seed",
+                "env": {"ci_id": "seed-{}".format(i), "ci_name": "seed"},
+                "meta": {"filter_name": "seed"},
+            }
+            for i in range(SEED_ROWS)
+        ],
+    )
+    job_ids = [
+        job_id
+        for (job_id,) in db.session.query(JobModel.id).filter(
+            JobModel.ci_dataset == "seed"
+        )
+    ]
+
+    db.session.execute(
+        MeasurementModel.__table__.insert(),
+        [
+            {
+                "job_id": job_id,
+                "metric_id": metrics[i % len(metrics)][1],
+                "metric_name": metrics[i % len(metrics)][0],
+                "value": float(i),
+                "unit": "",
+            }
+            for i, job_id in enumerate(job_ids)
+        ],
+    )
+    MetricSeriesModel.append(MeasurementModel.job_id.in_(job_ids))
+    db.session.execute(
+        PackageModel.__table__.insert(),
+        [
+            {"job_id": job_id, "name": "seed", "git_sha": "seed"}
+            for job_id in job_ids
+        ],
+    )
+    db.session.execute(
+        SpecificationModel.__table__.insert(),
+        [
+            {
+                "name": "seed.{}".format(i),
+                "metric_id": metrics[i % len(metrics)][1],
+                "metadata_query": {
+                    "dataset_name": "seed",
+                    "filter_name": str(i),
+                },
+            }
+            for i in range(SEED_ROWS)
+        ],
+    )
+    db.session.execute(
+        BlobModel.__table__.insert(),
+        [
+            {"identifier": uuid.uuid4().hex, "name": "seed"}
+            for _ in range(SEED_ROWS)
+        ],
+    )
+    db.session.commit()
+
+    # the plans are chosen with the statistics of the seeded tables
+    for table in SEEDED_TABLES:
+        db.session.execute("ANALYZE TABLE {}".format(table))
+
+    return job_ids
+
+
+def unseed(job_ids):
+    """Delete the seeded rows."""
+    for model in (MetricSeriesModel, MeasurementModel, PackageModel):
+        model.query.filter(model.job_id.in_(job_ids)).delete(
+            synchronize_session=False
+        )
+    JobModel.query.filter(JobModel.id.in_(job_ids)).delete(
+        synchronize_session=False
+    )
+    SpecificationModel.query.filter(
+        SpecificationModel.name.like("seed.%")
+    ).delete(synchronize_session=False)
+    BlobModel.query.filter_by(name="seed").delete(synchronize_session=False)
+    db.session.commit()
+
+
+@pytest.fixture(scope="module")
+def params(job_data, job_id):
+    """Insert the seeded rows and return the parameters of the requests.
+
+    tests/data/job-768.json is inserted as well, by the `job_id` fixture.
+    """
+    job_ids = seed(job_data)
+    env = job_data["meta"]["env"]
+
+    yield {
+        "data": job_data,
+        "job_id": job_id,
+        "seeded_job_id": job_ids[0],
+        "ci_id": env["ci_id"],
+        "ci_name": env["ci_name"],
+        "ci_dataset": env["ci_dataset"],
+        "metric": job_data["measurements"][0]["metric"],
+    }
+
+    unseed(job_ids)
+
+
+@pytest.mark.parametrize("url,status_code", URLS)
+def test_no_full_scans(test_client, params, url, status_code):
+    """The queries of a request do not scan large tables."""
+    job_cache.clear()
+
+    with record_queries() as queries:
+        response = test_client.get(url.format(**params))
+        response.get_data()
+
+    assert response.status_code == status_code
+    assert_no_full_scans(queries)
+
+
+def test_all_resources(test_client, params):
+    """Every GET resource that queries the database is in ``URLS``."""
+    url_map = test_client.application.url_map
+    adapter = url_map.bind("localhost")
+
+    requested = {
+        adapter.match(url.format(**params).split("?")[0], "GET")[0]
+        for url, _ in URLS
+    }
+    resources = {
+        rule.endpoint
+        for rule in url_map.iter_rules()
+        if "GET" in rule.methods
+        and rule.endpoint != "static"
+        and not rule.endpoint.startswith("flasgger.")
+    }
+
+    assert resources - set(NO_QUERIES) - requested == set()
+
+
+def assert_no_full_scans(queries):
+    """Check that the recorded queries do not scan large tables."""
+    assert queries
+
+    for statement, parameters in queries:
+        assert get_full_scans(statement, parameters) == [], statement
+
+
+def test_delete_job(test_client, params, auth_header):
+    """Deleting a job does not scan large tables."""
+    url = "/job/{}".format(params["seeded_job_id"])
+
+    with record_queries() as queries:
+        response = test_client.delete(url, headers=auth_header)
+
+    assert response.status_code == 200
+    assert any(s.upper().startswith("DELETE") for s, _ in queries)
+    assert_no_full_scans(queries)
+
+
+def test_delete_metric(test_client, params, auth_header):
+    """Deleting a metric unlinks its rows without scanning large tables."""
+    MetricModel("plans.deleted").save_to_db()
+
+    with record_queries() as queries:
+        response = test_client.delete(
+            "/metric/plans.deleted", headers=auth_header
+        )
+
+    assert response.status_code == 200
+    assert any(s.upper().startswith("UPDATE") for s, _ in queries)
+    assert_no_full_scans(queries)
+
+
+def test_post_specs(test_client, params, auth_header):
+    """Creating specifications does not scan large tables."""
+    name = "{}.plans".format(params["metric"])
+    body = {"specs": [{"name": name, "threshold": {}, "tags": []}]}
+
+    try:
+        with record_queries() as queries:
+            response = test_client.post(
+                "/specs", json=body, headers=auth_header
+            )
+    finally:
+        SpecificationModel.query.filter_by(name=name).delete()
+        db.session.commit()
+
+    assert response.status_code == 201
+    assert_no_full_scans(queries)
+
+
+def test_ingestion_no_full_scans(test_client, params):
+    """The queries run to ingest a job do not scan large tables."""
+    with record_queries() as queries:
+        JobIngestion(params["data"]).run()
+
+    assert_no_full_scans(queries)
@@ -0,0 +1,136 @@
+"""Test the asynchronous ingestion of staged job documents."""
+
+import json
+import uuid
+
+import pytest
+from celery.result import AsyncResult
+
+import squash.api_v1.job
+import squash.tasks.ingestion
+from squash.error import ApiError
+from squash.tasks.celery import celery
+from squash.tasks.ingestion import ingest_job
+from squash.tasks.pipeline import run_stage
+
+
+@pytest.fixture
+def staging(test_client, monkeypatch, result_backend):
+    """Stage the job documents in memory and send no task.
+
+    Returns the staged documents by S3 key, and the status of the task
+    read when the staged document is downloaded by `ingest_job`.
+    """
+    staged = {}
+    statuses = []
+    tasks = {}
+
+    def put_fileobj(key, fileobj, metadata=None):
+        staged[key] = fileobj.read()
+
+    def download_object(s3_uri):
+        key = s3_uri.split("/", 3)[3]
+        statuses.append(get_status(test_client, key.split("/")[1]))
+        return staged.get(key)
+
+    def copy_object(source_key, key):
+        staged[key] = staged[source_key]
+
+    def delete_object(key):
+        del staged[key]
+
+    def apply_async(args=None, kwargs=None, task_id=None, **options):
+        tasks[task_id] = args
+        return AsyncResult(task_id, app=celery)
+
+    monkeypatch.setattr(squash.api_v1.job, "put_fileobj", put_fileobj)
+    monkeypatch.setattr(
+        squash.tasks.ingestion, "download_object", download_object
+    )
+    monkeypatch.setattr(squash.tasks.ingestion, "copy_object", copy_object)
+    monkeypatch.setattr(squash.tasks.ingestion, "delete_object", delete_object)
+    monkeypatch.setattr(ingest_job, "apply_async", apply_async)
+    monkeypatch.setattr(run_stage, "apply_async", apply_async)
+    # the worker uses the app of the tests
+    monkeypatch.setattr(
+        squash.tasks.ingestion, "_app", test_client.application
+    )
+
+    return staged, statuses, tasks
+
+
+def get_status(test_client, task_id):
+    """Return the status of a task."""
+    return test_client.get("/status/{}".format(task_id)).json
+
+
+def stage_job(test_client, auth_header, body):
+    """Post a job document with ``Prefer: respond-async``."""
+    headers = dict(auth_header)
+    headers["Prefer"] = "respond-async"
+    headers["Idempotency-Key"] = uuid.uuid4().hex
+
+    response = test_client.post(
+        "/job", data=body, content_type="application/json", headers=headers
+    )
+    assert response.status_code == 202
+
+    return response.json["task_id"]
+
+
+def run_task(result_backend, task_id, args):
+    """Run `ingest_job` as a worker would and store its result."""
+    result = ingest_job.apply(args=args, task_id=task_id)
+    if result.successful():
+        result_backend.store_result(task_id, result.result, "SUCCESS")
+    else:
+        result_backend.mark_as_failure(task_id, result.result)
+
+    return result
+
+
+def test_staged_job(
+    test_client, auth_header, job_data, staging, result_backend
+):
+    """The status goes through the staging, inserting and done stages."""
+    staged, statuses, tasks = staging
+    body = json.dumps(job_data).encode()
+
+    task_id = stage_job(test_client, auth_header, body)
+    key, _ = tasks[task_id]
+
+    assert staged[key] == body
+    assert get_status(test_client, task_id)["stage"] == "staging"
+
+    run_task(result_backend, task_id, tasks[task_id])
+    status = get_status(test_client, task_id)
+
+    assert statuses[0]["stage"] == "inserting"
+    assert status["stage"] == "done"
+    assert status["job_id"]
+    # the blob uploads and the InfluxDB export wait for a worker
+    stages = {
+        stage["stage"]: stage["status"]
+        for stage in status["pipeline"]["stages"]
+    }
+    assert stages["document"] == "SUCCESS"
+    assert stages["influxdb"] == "PENDING"
+    assert status["pipeline"]["status"] == "STARTED"
+    # the staged document becomes the job document
+    assert staged == {str(status["job_id"]): body}
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'"job"', b"{"])
+def test_invalid_document(
+    test_client, auth_header, staging, result_backend, body
+):
+    """A staged document that is not a JSON object fails the task."""
+    _, _, tasks = staging
+
+    task_id = stage_job(test_client, auth_header, body)
+    result = run_task(result_backend, task_id, tasks[task_id])
+    status = get_status(test_client, task_id)
+
+    assert isinstance(result.result, ApiError)
+    assert status["stage"] == "failed"
+    assert status["message"] == "Invalid job document."
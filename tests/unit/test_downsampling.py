@@ -0,0 +1,53 @@
+"""Test the downsampling of the monitor time series."""
+
+import numpy as np
+
+from squash.downsampling import bucket_extrema, downsample
+
+
+def test_bucket_extrema():
+    """The first and last points and the outliers are kept."""
+    values = np.zeros(1000)
+    values[[100, 500]] = [50.0, -50.0]
+
+    indices = bucket_extrema(values, 20)
+
+    assert len(indices) <= 20
+    assert list(indices[[0, -1]]) == [0, 999]
+    assert 100 in indices and 500 in indices
+
+
+def test_bucket_extrema_short_series():
+    """A series with fewer points than the maximum is kept as is."""
+    assert list(bucket_extrema(np.arange(3.0), 4)) == [0, 1, 2]
+
+
+def test_downsample():
+    """Each series is downsampled, even when split across chunks."""
+    keys = ["a"] * 30 + ["b"] * 3
+    values = list(range(33))
+    job_ids = list(range(100, 133))
+    chunks = [
+        (keys[:20], values[:20], job_ids[:20]),
+        (keys[20:], values[20:], job_ids[20:]),
+    ]
+
+    series = list(downsample(iter(chunks), 0, 1, 6))
+
+    assert [set(columns[0]) for columns in series] == [{"a"}, {"b"}]
+    assert len(series[0][1]) <= 6
+    assert list(series[0][1][[0, -1]]) == [0, 29]
+    assert list(series[1][1]) == [30, 31, 32]
+    # the rows are kept whole, e.g. with their job id
+    assert list(series[0][2] - series[0][1]) == [100] * len(series[0][1])
+
+
+def test_downsample_dtypes():
+    """The downsampled columns keep the dtype of the source columns."""
+    chunks = [(["a"] * 10, np.arange(10.0), np.arange(10))]
+
+    ((keys, values, job_ids),) = downsample(iter(chunks), 0, 1, 4)
+
+    assert values.dtype == np.float64
+    assert job_ids.dtype == np.int64
+    assert list(keys) == ["a"] * len(values)
@@ -0,0 +1,49 @@
+"""Test the ingestion of verification jobs."""
+
+import json
+
+import pytest
+
+from squash.error import ApiError
+from squash.ingestion import get_job_data, get_job_digest
+
+
+def test_job_digest(job_document):
+    """The digest does not depend on the key order or the blob data."""
+    data = job_document
+    digest = get_job_digest(data)
+
+    reordered = json.loads(json.dumps(data, sort_keys=True))
+    for blob in reordered["blobs"]:
+        blob["data"] = None
+
+    assert len(digest) == 64
+    assert get_job_digest(reordered) == digest
+
+
+def test_job_digest_changes(job_document):
+    """Different jobs have different digests."""
+    data = job_document
+    digest = get_job_digest(data)
+
+    data["meta"]["env"]["ci_id"] = "0"
+
+    assert get_job_digest(data) != digest
+
+
+def test_job_data():
+    """Missing keys of a job document get the defaults of the Job parser."""
+    assert get_job_data({"meta": {"packages": {}}}) == {
+        "measurements": [],
+        "meta": {"packages": {}},
+        "blobs": [],
+    }
+
+
+@pytest.mark.parametrize("document", [[], ["job"], "job", 1, None])
+def test_job_data_not_object(document):
+    """A job document that is not a JSON object is rejected."""
+    with pytest.raises(ApiError) as excinfo:
+        get_job_data(document)
+
+    assert excinfo.value.status_code == 400
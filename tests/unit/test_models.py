@@ -5,3 +5,22 @@ def test_new_user(new_user):
     """Test user cretion with hashed password."""
     assert new_user.username == "mole"
     assert new_user.verify_password("desert") is True
+
+
+def test_select_fields():
+    """Nested fields are selected by path, the document is not modified."""
+    from squash.models import select_fields
+
+    document = {"id": 1, "meta": {"env": {"ci_id": "1"}, "packages": []}}
+
+    assert select_fields(document, ["id", "meta.env"]) == {
+        "id": 1,
+        "meta": {"env": {"ci_id": "1"}},
+    }
+    assert select_fields(document, ["meta", "meta.env"]) == {
+        "meta": document["meta"]
+    }
+    assert select_fields(document, ["meta.env.ci_id", "missing"]) == {
+        "meta": {"env": {"ci_id": "1"}}
+    }
+    assert list(document["meta"]) == ["env", "packages"]
@@ -0,0 +1,123 @@
+"""Test the post-ingestion pipeline of the jobs."""
+
+import pytest
+from celery.result import AsyncResult
+
+from squash.tasks.celery import celery
+from squash.tasks.pipeline import JobPipeline, get_pipeline_status, run_stage
+
+
+@pytest.fixture
+def workers(monkeypatch, result_backend):
+    """Send no task, the stages added to a pipeline stay pending."""
+
+    def apply_async(args=None, kwargs=None, task_id=None, **options):
+        return AsyncResult(task_id, app=celery)
+
+    monkeypatch.setattr(run_stage, "apply_async", apply_async)
+
+    return result_backend
+
+
+def export(job_id):
+    """Stage function that succeeds."""
+
+
+def fail(job_id):
+    """Stage function that fails."""
+    raise RuntimeError("InfluxDB is down.")
+
+
+def get_states(pipeline_id):
+    """Return the status of each stage of a pipeline."""
+    status = get_pipeline_status(pipeline_id)
+    return {stage["stage"]: stage["status"] for stage in status["stages"]}
+
+
+def test_run(workers):
+    """A stage run in this process is reported with its timings."""
+    pipeline = JobPipeline(1)
+    pipeline.run("influxdb", export, 1)
+    pipeline_id = pipeline.start()
+
+    status = get_pipeline_status(pipeline_id)
+
+    assert status["status"] == "SUCCESS"
+    (stage,) = status["stages"]
+    assert stage["stage"] == "influxdb"
+    assert stage["status"] == "SUCCESS"
+    assert set(stage) >= {"started_at", "finished_at", "duration"}
+
+
+def test_run_failure(workers):
+    """A failed stage is reported, the error is not raised."""
+    pipeline = JobPipeline(1)
+    pipeline.run("influxdb", fail, 1)
+    pipeline_id = pipeline.start()
+
+    status = get_pipeline_status(pipeline_id)
+
+    assert status["status"] == "FAILURE"
+    assert status["stages"][0]["message"] == "InfluxDB is down."
+
+
+def test_stage_once(workers):
+    """A stage is added to a pipeline only once."""
+    calls = []
+    pipeline = JobPipeline(1)
+    pipeline.run("influxdb", lambda: calls.append(1))
+    pipeline.run("influxdb", lambda: calls.append(2))
+    pipeline.add("blob:a", "a", "{}")
+    pipeline.add("blob:a", "a", "{}")
+
+    assert calls == [1]
+    assert get_states(pipeline.start()) == {
+        "influxdb": "SUCCESS",
+        "blob:a": "PENDING",
+    }
+
+
+def test_stages(workers):
+    """The status of a pipeline combines its group and local stages."""
+    pipeline = JobPipeline(1)
+    pipeline.add("blob:a", "a", "{}")
+    pipeline.add("influxdb", 1)
+    pipeline_id = pipeline.start()
+
+    assert get_pipeline_status(pipeline_id)["status"] == "PENDING"
+
+    workers.store_result(pipeline.get_task_id("blob:a"), None, "STARTED")
+    assert get_pipeline_status(pipeline_id)["status"] == "STARTED"
+
+    workers.store_result(pipeline.get_task_id("blob:a"), {}, "SUCCESS")
+    assert get_pipeline_status(pipeline_id)["status"] == "STARTED"
+
+    workers.store_result(pipeline.get_task_id("influxdb"), {}, "SUCCESS")
+    assert get_pipeline_status(pipeline_id)["status"] == "SUCCESS"
+
+
+def test_mixed_stages(workers):
+    """A failed stage fails the pipeline, whatever the other stages."""
+    pipeline = JobPipeline(1)
+    pipeline.run("influxdb", export, 1)
+    pipeline.add("blob:a", "a", "{}")
+    pipeline_id = pipeline.start()
+
+    assert get_states(pipeline_id) == {
+        "influxdb": "SUCCESS",
+        "blob:a": "PENDING",
+    }
+    assert get_pipeline_status(pipeline_id)["status"] == "STARTED"
+
+    workers.mark_as_failure(
+        pipeline.get_task_id("blob:a"), RuntimeError("No such bucket.")
+    )
+    status = get_pipeline_status(pipeline_id)
+
+    assert status["status"] == "FAILURE"
+    assert status["stages"][1]["message"] == "No such bucket."
+
+
+def test_unknown_pipeline(workers):
+    """An unknown pipeline has no status."""
+    assert get_pipeline_status("unknown") is None
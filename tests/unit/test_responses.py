@@ -0,0 +1,101 @@
+"""Test the streamed JSON responses."""
+
+import json
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+from flask import Flask
+
+from squash.responses import (
+    ARROW,
+    JSON,
+    NDJSON,
+    spool_columns,
+    stream_json,
+    stream_table,
+)
+
+
+def get_body(body):
+    """Return the decoded body of a `stream_json` response."""
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = stream_json(body)
+        return json.loads("".join(response.response))
+
+
+def test_stream_json():
+    """Iterators are encoded as arrays, callables once they are reached."""
+    items = []
+
+    def get_next():
+        return "next" if items == [0, 1, 2] else None
+
+    def iter_items():
+        for item in range(3):
+            items.append(item)
+            yield item
+
+    body = get_body({"items": iter_items(), "meta": {"next": get_next}})
+
+    assert body == {"items": [0, 1, 2], "meta": {"next": "next"}}
+
+
+def test_spool_columns():
+    """The columns of the chunks are sent as arrays."""
+    chunks = [((1.0, 2.0), ("a", "b")), (np.array([3.0]), ("c",))]
+
+    assert get_body(spool_columns(iter(chunks), ["x", "y"])) == {
+        "x": [1.0, 2.0, 3.0],
+        "y": ["a", "b", "c"],
+    }
+    assert get_body(spool_columns(iter([]), ["x", "y"])) == {
+        "x": [],
+        "y": [],
+    }
+
+
+def test_stream_table():
+    """Timestamps are formatted for a whole chunk at once."""
+    schema = pa.schema(
+        [("date", pa.timestamp("s", tz="UTC")), ("value", pa.float64())]
+    )
+    chunks = [((datetime(2020, 1, 2, 3, 4, 5),), (1,))]
+
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = stream_table(iter(chunks), schema)
+        body = json.loads("".join(response.response))
+
+    assert body == {"date": ["2020-01-02T03:04:05Z"], "value": [1.0]}
+
+
+def reject_constant(name):
+    """Reject the NaN and Infinity constants, they are not valid JSON."""
+    raise ValueError("Invalid JSON constant {}".format(name))
+
+
+def test_null_values():
+    """NULL values of a numeric column are sent as null, not NaN."""
+    schema = pa.schema([("value", pa.float64()), ("job_id", pa.int64())])
+    chunks = [((1.0, None), (1, 2))]
+
+    app = Flask(__name__)
+    bodies = {}
+    for mimetype in (JSON, NDJSON, ARROW):
+        headers = {"Accept": mimetype}
+        with app.test_request_context(headers=headers):
+            response = stream_table(iter(chunks), schema)
+            bodies[mimetype] = response.get_data()
+
+    body = json.loads(bodies[JSON], parse_constant=reject_constant)
+    rows = [
+        json.loads(line, parse_constant=reject_constant)
+        for line in bodies[NDJSON].splitlines()
+    ]
+    table = pa.ipc.open_stream(bodies[ARROW]).read_all()
+
+    assert body == {"value": [1.0, None], "job_id": [1, 2]}
+    assert rows == [{"value": 1.0, "job_id": 1}, {"value": None, "job_id": 2}]
+    assert table.column("value").to_pylist() == [1.0, None]
@@ -0,0 +1,118 @@
+"""Test the streaming parser of job documents."""
+
+import io
+import json
+import math
+
+import pytest
+
+from squash.error import ApiError
+from squash.streaming import iter_lines, parse_job
+
+
+def test_parse_job(data_path):
+    """The parsed job matches the document, blobs are spooled."""
+    with open(data_path("job-768.json"), "rb") as f:
+        body = f.read()
+    document = json.loads(body)
+
+    data, raw = parse_job(io.BytesIO(body))
+
+    assert raw.read() == body
+    assert data["meta"] == document["meta"]
+    assert data["measurements"] == document["measurements"]
+    assert len(data["blobs"]) == len(document["blobs"])
+
+    for blob, expected in zip(data["blobs"], document["blobs"]):
+        assert blob["identifier"] == expected["identifier"]
+        assert blob["name"] == expected["name"]
+        assert json.loads(blob["data"].read()) == expected["data"]
+
+
+def test_parse_job_non_finite(data_path):
+    """Values of NaN are parsed like `json.loads` does."""
+    with open(data_path("Cfht_output_r.json"), "rb") as f:
+        body = f.read()
+    document = json.loads(body)
+
+    data, raw = parse_job(io.BytesIO(body))
+
+    assert raw.read() == body
+    assert data["meta"] == document["meta"]
+    assert len(data["measurements"]) == len(document["measurements"])
+
+    for measurement, expected in zip(
+        data["measurements"], document["measurements"]
+    ):
+        assert measurement["metric"] == expected["metric"]
+        if math.isnan(expected["value"]):
+            assert math.isnan(measurement["value"])
+        else:
+            assert measurement["value"] == expected["value"]
+
+
+class _ChunkedReader(io.BytesIO):
+    """Stream that returns at most ``chunk_size`` bytes per read."""
+
+    def __init__(self, body, chunk_size):
+        super().__init__(body)
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        return super().read(size)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 9, 64])
+def test_parse_job_non_finite_chunks(chunk_size):
+    """Non-finite numbers are parsed across read chunks, not in strings."""
+    body = (
+        b'{"meta": {"note": "NaN \\" -Infinity"}, "measurements": ['
+        b'{"metric": "a", "value": NaN}, {"metric": "b", "value": Infinity},'
+        b'{"metric": "c", "value": -Infinity}]}'
+    )
+
+    data, raw = parse_job(_ChunkedReader(body, chunk_size))
+
+    assert raw.read() == body
+    assert data["meta"] == {"note": 'NaN " -Infinity'}
+    values = [m["value"] for m in data["measurements"]]
+    assert math.isnan(values[0])
+    assert values[1:] == [float("inf"), float("-inf")]
+
+
+def test_parse_invalid_job():
+    """An invalid document raises an ApiError."""
+    with pytest.raises(ApiError):
+        parse_job(io.BytesIO(b'{"meta": {"env": '))
+
+
+def test_parse_job_trailing_data():
+    """The whitespace after the document is spooled, other data fails."""
+    body = b'{"meta": {}, "measurements": []}' + b" " * 100000 + b"\n"
+
+    _, raw = parse_job(io.BytesIO(body))
+
+    assert raw.read() == body
+
+    with pytest.raises(ApiError):
+        parse_job(io.BytesIO(b'{"meta": {}} {"meta": {}}'))
+
+
+def test_iter_lines():
+    """Lines are split across read chunks."""
+    body = b'{"a": 1}\n\n{"b": 2}\n{"c": 3}'
+
+    lines = list(iter_lines(io.BytesIO(body), chunk_size=3))
+
+    assert lines == [b'{"a": 1}', b"", b'{"b": 2}', b'{"c": 3}']
+
+
+def test_iter_lines_long_line():
+    """A line longer than many read chunks is returned whole."""
+    line = b"x" * 10000
+
+    lines = list(iter_lines(io.BytesIO(line + b"\n" + line), chunk_size=7))
+
+    assert lines == [line, line]